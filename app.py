@@ -2,15 +2,32 @@ from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
 import base64
+import hashlib
+import hmac
+import time
 import traceback
-import requests
 import json
 import urllib3
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, urljoin
 
 # 导入核心 API
 from zfn_api import Client
 from school_config import school_config_manager
+from transport import transport_manager
+from session_store import session_store
+from classroom_index import classroom_index
+from cache import reference_cache, response_cache, school_key
+from grade_history import (
+    MIN_ENROLLMENT_YEAR, academic_terms, enrollment_year_from_info, is_term_closed, is_valid_enrollment_year,
+    merge_grade_history,
+)
+from course_rush import MAX_TARGETS as RUSH_MAX_TARGETS, course_rush, parse_open_at
+from seat_watcher import seat_watcher
+from pubkey_cache import pubkey_cache
+from pending_login import pending_logins
+from captcha_solver import captcha_solver
+from schedule_bits import sessions_mask, weeks_mask
 
 app = Flask(__name__)
 CORS(app)
@@ -20,6 +37,13 @@ RASPISANIE = []
 IGNORE_TYPE = []
 DETAIL_CATEGORY_TYPE = []
 TIMEOUT = 30
+# 管理接口令牌（请求头 X-Admin-Token），未配置时管理接口不可用
+ADMIN_TOKEN = os.environ.get('ZFJW_ADMIN_TOKEN')
+# 批量接口：单次最多操作数、同时执行的操作数
+BATCH_MAX_OPERATIONS = max(1, int(os.environ.get('ZFJW_BATCH_MAX_OPERATIONS', 10)))
+BATCH_CONCURRENCY = max(1, int(os.environ.get('ZFJW_BATCH_CONCURRENCY', 4)))
+# 历年成绩：同时查询的学期数
+GRADE_HISTORY_CONCURRENCY = max(1, int(os.environ.get('ZFJW_GRADE_HISTORY_CONCURRENCY', 4)))
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -38,23 +62,48 @@ def handle_errors(func):
     wrapper.__name__ = func.__name__
     return wrapper
 
+def check_admin_token(token):
+    """校验管理接口令牌，通过时返回 None，否则返回错误结果字典"""
+    if not ADMIN_TOKEN:
+        return {"code": 403, "msg": "管理接口未启用，请配置环境变量 ZFJW_ADMIN_TOKEN"}
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return {"code": 403, "msg": "管理令牌无效"}
+    return None
+
+def require_admin(func):
+    """管理接口装饰器：校验请求头 X-Admin-Token"""
+    def wrapper(*args, **kwargs):
+        error = check_admin_token(request.headers.get('X-Admin-Token'))
+        if error:
+            return jsonify(error)
+        return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
 # 统一的参数校验和base_url获取函数
-def get_base_url_from_params(data):
+def resolve_base_url(data):
     """
-    从请求参数中获取base_url，支持通过school_name自动查找
+    从请求参数中获取base_url，支持通过school_name自动查找（不依赖具体Web框架）
     参数:
         data: 请求的JSON数据
     返回:
-        tuple: (base_url, error_response)
-        如果成功，error_response为None
-        如果失败，base_url为None，error_response为错误响应对象
+        tuple: (base_url, error)
+        如果成功，error为None
+        如果失败，base_url为None，error为错误结果字典
     """
     base_url = data.get('base_url')
     school_name = data.get('school_name')
     
+    # 使用 token 时可省略 base_url 与 school_name，沿用登录时的地址
+    if not base_url and not school_name and data.get('token'):
+        entry = session_store.get(data.get('token'))
+        if not entry:
+            return None, {"code": 1006, "msg": "会话不存在或已过期，请重新登录"}
+        return entry.base_url, None
+    
     # 校验参数：base_url 或 school_name 至少一个
     if not base_url and not school_name:
-        return None, jsonify({"code": 400, "msg": "缺少 base_url 或 school_name 参数"})
+        return None, {"code": 400, "msg": "缺少 base_url 或 school_name 参数"}
     
     # 通过学校名称获取base_url
     if not base_url and school_name:
@@ -63,14 +112,179 @@ def get_base_url_from_params(data):
             base_url = school_config.get('base_url')
             print(f"通过学校名称 '{school_name}' 获取到 base_url: {base_url}")
         else:
-            return None, jsonify({"code": 400, "msg": f"未找到学校 '{school_name}' 的配置"})
+            return None, {"code": 400, "msg": f"未找到学校 '{school_name}' 的配置"}
     
     # 最终校验 base_url
     if not base_url:
-        return None, jsonify({"code": 400, "msg": "未能获取到 base_url，请检查 school_name 是否正确或补充 base_url 参数"})
+        return None, {"code": 400, "msg": "未能获取到 base_url，请检查 school_name 是否正确或补充 base_url 参数"}
     
     return base_url, None
 
+def get_base_url_from_params(data):
+    """
+    从请求参数中获取base_url，支持通过school_name自动查找
+    参数:
+        data: 请求的JSON数据
+    返回:
+        tuple: (base_url, error_response)
+        如果成功，error_response为None
+        如果失败，base_url为None，error_response为错误响应对象
+    """
+    base_url, error = resolve_base_url(data)
+    if error:
+        return None, jsonify(error)
+    return base_url, None
+
+def resolve_client(data, base_url, client_cls=Client, **kwargs):
+    """
+    根据请求参数获取客户端：优先使用 token 对应的已登录会话，否则使用 cookies 新建（不依赖具体Web框架）
+    参数:
+        data: 请求的JSON数据
+        base_url: 教务系统地址
+        client_cls: 客户端类型（Client 或 AsyncClient）
+        kwargs: 新建客户端时的额外参数（如 school_name）
+    返回:
+        tuple: (client, error)，error 为错误结果字典
+    """
+    token = data.get('token')
+    if token:
+        entry = session_store.get(token)
+        if not entry:
+            return None, {"code": 1006, "msg": "会话不存在或已过期，请重新登录"}
+        return entry.get_client(client_cls), None
+    
+    cookies = data.get('cookies')
+    if not cookies:
+        return None, {"code": 400, "msg": "参数不完整，需要 cookies 或 token"}
+    return client_cls(cookies=cookies, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT, **kwargs), None
+
+def get_client_from_params(data, base_url, **kwargs):
+    """
+    根据请求参数获取 Client：优先使用 token 对应的已登录会话，否则使用 cookies 新建
+    参数:
+        data: 请求的JSON数据
+        base_url: 教务系统地址
+        kwargs: 新建 Client 时的额外参数（如 school_name）
+    返回:
+        tuple: (client, error_response)
+    """
+    stu, error = resolve_client(data, base_url, **kwargs)
+    if error:
+        return None, jsonify(error)
+    return stu, None
+
+def resolve_cache_user(data, base_url):
+    """
+    识别请求所属用户，作为用户级结果缓存的键（不依赖具体Web框架）
+    token 会话按 学校+学号 识别；cookies 请求按 cookies 摘要识别；无法识别时返回 None（不使用缓存）
+    """
+    token = data.get('token')
+    if token:
+        entry = session_store.get(token)
+        if not entry:
+            return None
+        if entry.sid:
+            return f"{school_key(entry.base_url)}|sid:{entry.sid}"
+        return "token:" + hashlib.sha256(token.encode()).hexdigest()
+    cookies = data.get('cookies')
+    if not cookies:
+        return None
+    digest = hashlib.sha256(json.dumps(cookies, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{school_key(base_url)}|cookies:{digest}"
+
+def attach_session_token(result, stu, base_url, school_name=None, sid=None):
+    """登录成功后在服务端保留会话，并在返回数据中附带 token"""
+    if isinstance(result, dict) and result.get("code") == 1000:
+        if stu.is_async:
+            # 会话存储统一保存同步客户端，异步接口按需转换
+            stu = Client.from_client(stu)
+        token = session_store.create(stu, base_url, school_name=school_name, sid=sid)
+        result.setdefault("data", {})["token"] = token
+    return result
+
+def attach_pending_login(result, stu, base_url, school_name=None, sid=None, password=None,
+                         binary=False, image_field="kaptcha_pic"):
+    """
+    需要验证码时在服务端保留登录握手状态（会话、CSRF token、公钥、密码与验证码图片），
+    返回数据中以 login_token 代替 csrf_token、cookies、公钥与密码
+    result 中的验证码图片为原始字节（kaptcha_bytes、kaptcha_type）；binary 为 True 时只返回图片地址 kaptcha_url，
+    否则以 base64 放在 image_field 字段中
+    """
+    if isinstance(result, dict) and result.get("code") == 1001:
+        data = result.get("data") or {}
+        kaptcha = data.pop("kaptcha_bytes", None)
+        kaptcha_type = data.pop("kaptcha_type", None)
+        if stu.is_async:
+            # 与会话存储一致，统一保存同步客户端
+            stu = Client.from_client(stu)
+        token = pending_logins.create(
+            stu, base_url, data.get("csrf_token"), data.get("modulus"), data.get("exponent"),
+            school_name=school_name, sid=sid, password=password, kaptcha=kaptcha, kaptcha_type=kaptcha_type,
+        )
+        for key in ("csrf_token", "cookies", "modulus", "exponent", "password"):
+            data.pop(key, None)
+        data["login_token"] = token
+        data["expires_in"] = pending_logins.ttl
+        if binary:
+            data["kaptcha_url"] = f"/api/captcha_image/{token}"
+        elif kaptcha is not None:
+            data[image_field] = base64.b64encode(kaptcha).decode()
+    return result
+
+def wants_binary_captcha(data):
+    """请求是否要求以图片接口获取验证码（captcha_format 为 binary）"""
+    return data.get('captcha_format') == 'binary'
+
+def captcha_image_response(token):
+    """
+    login_token 对应的验证码图片（不依赖具体Web框架）
+    返回:
+        tuple: (图片字节, Content-Type, 响应头, error)，error 为错误结果字典
+    """
+    pending = pending_logins.get(token)
+    if not pending or pending.kaptcha is None:
+        return None, None, None, {"code": 1006, "msg": "登录状态不存在或已过期，请重新获取验证码"}
+    # 验证码与登录状态绑定，禁止浏览器、代理缓存或复用
+    headers = {
+        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0, private",
+        "Pragma": "no-cache",
+        "Expires": "0",
+    }
+    return pending.kaptcha, pending.kaptcha_type or "image/jpeg", headers, None
+
+def resolve_pending_login(data):
+    """
+    取出 login_token 对应的登录握手状态，组装验证码登录参数（不依赖具体Web框架）
+    返回:
+        tuple: (pending, login_params, error)，error 为错误结果字典
+    """
+    kaptcha = data.get('kaptcha')
+    if not kaptcha:
+        return None, None, {"code": 400, "msg": "参数不完整，需要 login_token 和 kaptcha"}
+    token = data.get('login_token')
+    expired = {"code": 1006, "msg": "登录状态不存在或已过期，请重新获取验证码"}
+    pending = pending_logins.get(token)
+    if not pending:
+        return None, None, expired
+    sid = pending.sid or data.get('sid')
+    password = pending.password or data.get('password')
+    if not sid or not password:
+        return None, None, {"code": 400, "msg": "参数不完整，需要 sid 和 password"}
+    # 一次性使用：并发提交同一 login_token 时只有一个请求继续
+    if not pending_logins.remove(token):
+        return None, None, expired
+    login_params = {
+        "sid": sid,
+        "csrf_token": pending.csrf_token,
+        # 会话 cookies 已在握手时的客户端中，无需重新设置
+        "cookies": {},
+        "password": password,
+        "modulus": pending.modulus,
+        "exponent": pending.exponent,
+        "kaptcha": kaptcha,
+    }
+    return pending, login_params, None
+
 # 登录接口（自动识别验证码）
 @app.route('/api/login', methods=['POST'])
 @handle_errors
@@ -102,32 +316,14 @@ def login():
     if not base_url:
         return jsonify({"code": 400, "msg": "未能获取到 base_url，请检查 school_name 是否正确或补充 base_url 参数"})
     
-    # 检查学校是否需要验证码
-    requires_captcha = school_config_manager.requires_captcha(school_name)
-    if requires_captcha:
-        print(f"学校 '{school_name}' 需要验证码，直接返回验证码获取提示")
-        # 获取验证码进行登录验证
-        try:
-            stu = Client(cookies={}, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-            lgn = stu.login(sid, password)
-            return jsonify(lgn)
-        except Exception as e:
-            print(f"验证码登录过程中发生异常: {str(e)}")
-            traceback.print_exc()
-            return jsonify({
-                "code": 999,
-                "msg": f"登录过程发生异常: {str(e)}"
-            })
-      # 创建Client实例
+    # 登录：需要验证码时先尝试自动识别，无法识别时返回验证码（login_token）
     try:
         stu = Client(cookies={}, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-        
-        # 执行登录操作
-        lgn = stu.login(sid, password)
+        lgn = stu.login_auto(sid, password, kaptcha_binary=True)
+        lgn = attach_session_token(lgn, stu, base_url, school_name, sid)
+        lgn = attach_pending_login(lgn, stu, base_url, school_name, sid, password, binary=wants_binary_captcha(data))
         print(f"登录结果: {lgn}")
-        
         return jsonify(lgn)
-        
     except Exception as e:
         print(f"登录过程中发生异常: {str(e)}")
         traceback.print_exc()
@@ -145,6 +341,17 @@ def login_with_kaptcha():
         return jsonify({"code": 400, "msg": "请求数据为空"})
     print(f"收到验证码登录请求: {data}")
     
+    # 使用 login_token 时复用服务端保留的握手会话，无需回传 cookies、CSRF token、公钥与密码
+    if data.get('login_token'):
+        pending, login_params, error = resolve_pending_login(data)
+        if error:
+            return jsonify(error)
+        stu = pending.get_client(Client)
+        ret = stu.login_with_kaptcha(**login_params)
+        print(f"验证码登录结果: {ret}")
+        ret = attach_session_token(ret, stu, pending.base_url, pending.school_name, login_params["sid"])
+        return jsonify(ret)
+    
     base_url = data.get('base_url')
     school_name = data.get('school_name')
     # 校验参数：base_url 或 school_name 至少一个
@@ -161,7 +368,9 @@ def login_with_kaptcha():
         return jsonify({"code": 400, "msg": "未能获取到 base_url，请检查 school_name 是否正确或补充 base_url 参数"})
     
     try:
-        stu = Client(cookies={}, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+        # 仅在传入学校名称时指定，否则保持 Client 的默认学校
+        client_kwargs = {"school_name": school_name} if school_name else {}
+        stu = Client(cookies={}, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT, **client_kwargs)
         
         # 准备验证码登录参数，排除base_url
         login_params = {k: v for k, v in data.items() if k != 'base_url'}
@@ -169,6 +378,7 @@ def login_with_kaptcha():
         ret = stu.login_with_kaptcha(**login_params)
         
         print(f"验证码登录结果: {ret}")
+        ret = attach_session_token(ret, stu, base_url, school_name, data.get('sid'))
         return jsonify(ret)
         
     except Exception as e:
@@ -179,6 +389,22 @@ def login_with_kaptcha():
             "msg": f"验证码登录过程发生异常: {str(e)}"
         })
 
+# 退出登录（释放服务端会话）
+@app.route('/api/logout', methods=['POST'])
+@handle_errors
+def logout():
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    token = data.get('token')
+    if not token:
+        return jsonify({"code": 400, "msg": "参数不完整，需要 token"})
+    # 同时清除该用户的查询结果缓存
+    response_cache.purge_user(resolve_cache_user(data, None))
+    if session_store.remove(token):
+        return jsonify({"code": 1000, "msg": "退出登录成功"})
+    return jsonify({"code": 1006, "msg": "会话不存在或已过期"})
+
 # 个人信息
 @app.route('/api/info', methods=['POST'])
 @handle_errors
@@ -186,23 +412,27 @@ def get_info():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     
     # 使用统一的参数校验获取base_url
     base_url, error_response = get_base_url_from_params(data)
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"个人信息查询 - 使用URL: {base_url}")
     
     # 获取school_name参数
     school_name = data.get('school_name')
     
-    stu = Client(cookies=cookies, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-    result = stu.get_info(school_name=school_name, base_url=base_url)
+    stu, error_response = get_client_from_params(data, base_url)
+    if error_response:
+        return error_response
+    result = response_cache.fetch(
+        "info",
+        resolve_cache_user(data, base_url),
+        (),
+        lambda: stu.get_info(school_name=school_name, base_url=base_url),
+        force_refresh=bool(data.get('force_refresh')),
+    )
     return jsonify(result)
 
 # 成绩查询
@@ -212,7 +442,6 @@ def get_grade():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year')
     term = data.get('term')
       # 使用统一的参数校验获取base_url
@@ -220,18 +449,100 @@ def get_grade():
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"成绩查询 - 使用URL: {base_url}")
     
     # 获取school_name参数
     school_name = data.get('school_name')
     
-    stu = Client(cookies=cookies, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-    result = stu.get_grade(year, term, school_name=school_name, base_url=base_url)
+    stu, error_response = get_client_from_params(data, base_url)
+    if error_response:
+        return error_response
+    result = response_cache.fetch(
+        "grade",
+        resolve_cache_user(data, base_url),
+        (str(year), str(term)),
+        lambda: stu.get_grade(year, term, school_name=school_name, base_url=base_url),
+        force_refresh=bool(data.get('force_refresh')),
+    )
     return jsonify(result)
 
+def resolve_enrollment_year(data, info_result=None):
+    """
+    确定历年成绩查询的入学年份：优先使用请求参数 enrollment_year，否则从个人信息解析（不依赖具体Web框架）
+    返回:
+        tuple: (入学年份, error)
+    """
+    value = data.get('enrollment_year')
+    if value:
+        try:
+            year = int(value)
+        except (TypeError, ValueError):
+            return None, {"code": 400, "msg": "enrollment_year 必须为整数"}
+        # 每个学期对应一次教务系统请求，在并发查询之前拒绝不合理的年份
+        if not is_valid_enrollment_year(year):
+            return None, {"code": 400, "msg": f"enrollment_year 必须在 {MIN_ENROLLMENT_YEAR} 至今年之间"}
+        return year, None
+    if not isinstance(info_result, dict) or info_result.get("code") != 1000:
+        return None, info_result or {"code": 999, "msg": "获取个人信息失败"}
+    year = enrollment_year_from_info(info_result.get("data"))
+    if not year:
+        return None, {"code": 400, "msg": "无法从个人信息中确定入学年份，请传入 enrollment_year"}
+    return year, None
+
+def grade_term_cache(year, term):
+    """学期成绩使用的缓存：已关闭学期的成绩不再变化，使用长 TTL；其余学期与 /api/grade 共用缓存"""
+    return "grade_closed" if is_term_closed(year, term) else "grade"
+
+# 历年成绩
+@app.route('/api/grade_history', methods=['POST'])
+@handle_errors
+def get_grade_history():
+    """
+    历年成绩（入学以来各学期并发查询），合并重修记录并计算各学期与总体的学分加权平均绩点
+    请求参数：
+    - cookies 或 token、school_name 或 base_url
+    - enrollment_year: 入学年份（可选，缺省时从个人信息中获取）
+    - force_refresh: 跳过缓存（可选）
+    """
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    school_name = data.get('school_name')
+    stu, error_response = get_client_from_params(data, base_url)
+    if error_response:
+        return error_response
+    user = resolve_cache_user(data, base_url)
+    force_refresh = bool(data.get('force_refresh'))
+    
+    info = None
+    if not data.get('enrollment_year'):
+        info = response_cache.fetch("info", user, (), lambda: stu.get_info(school_name=school_name, base_url=base_url))
+    enrollment_year, error = resolve_enrollment_year(data, info)
+    if error:
+        return jsonify(error)
+    terms = academic_terms(enrollment_year)
+    if not terms:
+        return jsonify({"code": 400, "msg": f"入学年份无效: {enrollment_year}"})
+    print(f"历年成绩查询 - 使用URL: {base_url}, 入学年份: {enrollment_year}, 学期数: {len(terms)}")
+    
+    def load(year_term):
+        year, term = year_term
+        result = response_cache.fetch(
+            grade_term_cache(year, term),
+            user,
+            (str(year), str(term)),
+            lambda: stu.get_grade(year, term, school_name=school_name, base_url=base_url),
+            force_refresh=force_refresh,
+        )
+        return year, term, result
+    
+    with ThreadPoolExecutor(max_workers=min(GRADE_HISTORY_CONCURRENCY, len(terms)), thread_name_prefix="grade-history") as executor:
+        term_results = list(executor.map(load, terms))
+    return jsonify(merge_grade_history(term_results, enrollment_year))
+
 # 考试信息
 @app.route('/api/exam', methods=['POST'])
 @handle_errors
@@ -239,7 +550,6 @@ def get_exam():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year')
     term = data.get('term')
     
@@ -247,16 +557,24 @@ def get_exam():
     base_url, error_response = get_base_url_from_params(data)
     if error_response:
         return error_response
-    if not all([cookies, year, term]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, year, term 和 (base_url 或 school_name)"})
+    if not all([year, term]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), year, term 和 (base_url 或 school_name)"})
     
     print(f"考试信息查询 - 使用URL: {base_url}")
     
     # 获取school_name参数
     school_name = data.get('school_name')
     
-    stu = Client(cookies=cookies, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-    result = stu.get_exam_schedule(year, term, school_name=school_name, base_url=base_url)
+    stu, error_response = get_client_from_params(data, base_url)
+    if error_response:
+        return error_response
+    result = response_cache.fetch(
+        "exam",
+        resolve_cache_user(data, base_url),
+        (str(year), str(term)),
+        lambda: stu.get_exam_schedule(year, term, school_name=school_name, base_url=base_url),
+        force_refresh=bool(data.get('force_refresh')),
+    )
     return jsonify(result)
 
 # 详细成绩查询（含平时分）
@@ -275,7 +593,6 @@ def get_grade_detail():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year')
     term = data.get('term', 0)  # 默认为整个学年
     
@@ -284,15 +601,17 @@ def get_grade_detail():
     if error_response:
         return error_response
     
-    if not all([cookies, year]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, year 和 (base_url 或 school_name)"})
+    if not year:
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), year 和 (base_url 或 school_name)"})
     
     print(f"详细成绩查询 - 使用URL: {base_url}")
     
     # 获取school_name参数
     school_name = data.get('school_name')
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.get_grade_detail(year, term, school_name=school_name, base_url=base_url)
     return jsonify(result)
 
@@ -303,7 +622,6 @@ def get_schedule():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year')
     term = data.get('term')
     
@@ -312,21 +630,35 @@ def get_schedule():
     if error_response:
         return error_response
     
-    if not all([cookies, year, term]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, year, term 和 (base_url 或 school_name)"})    
+    if not all([year, term]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), year, term 和 (base_url 或 school_name)"})    
     print(f"课表查询 - 使用URL: {base_url}")
     
     # 获取school_name参数用于URL配置
     school_name = data.get('school_name')
     
-    # 调用课表查询接口
+    stu, error_response = get_client_from_params(data, base_url)
+    if error_response:
+        return error_response
+    
+    result = response_cache.fetch(
+        "schedule",
+        resolve_cache_user(data, base_url),
+        (str(year), str(term)),
+        lambda: query_schedule(stu, base_url, year, term, school_name),
+        force_refresh=bool(data.get('force_refresh')),
+    )
+    return jsonify(result)
+
+def query_schedule(stu, base_url, year, term, school_name=None):
+    """
+    查询课表（复用客户端会话，按浏览器请求方式访问课表首页与课表接口），失败时回退到 Client.get_schedule
+    返回:
+        dict: 结果字典
+    """
     try:
-        sess = requests.Session()
-        sess.verify = False
-        
-        # 设置cookies
-        for k, v in cookies.items():
-            sess.cookies.set(k, v)
+        # 复用 Client 的会话（cookies 已就绪，连接池按学校主机共享）
+        sess = stu.sess
         
         # 第一步：使用配置的课表首页URL
         if school_name:
@@ -355,13 +687,13 @@ def get_schedule():
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0'
         }
         
-        index_response = sess.get(index_url, headers=index_headers, timeout=30)
+        index_response = sess.get(index_url, headers=index_headers, timeout=30, verify=False)
         
         if index_response.status_code != 200:
-            return jsonify({"code": 2333, "msg": f"无法访问课表首页，状态码: {index_response.status_code}"})
+            return {"code": 2333, "msg": f"无法访问课表首页，状态码: {index_response.status_code}"}
         
         if "用户登录" in index_response.text:
-            return jsonify({"code": 1006, "msg": "访问首页时被重定向到登录页面，cookies可能已过期"})
+            return {"code": 1006, "msg": "访问首页时被重定向到登录页面，cookies可能已过期"}
           # 第二步：使用配置的课表查询URL
         if school_name:
             school_config = school_config_manager.get_school_config(school_name)
@@ -410,21 +742,22 @@ def get_schedule():
             schedule_url,
             headers=schedule_headers,
             data=data,
-            timeout=30
+            timeout=30,
+            verify=False
         )
         
         if schedule_response.status_code != 200:
-            return jsonify({"code": 2333, "msg": f"课表查询失败，状态码: {schedule_response.status_code}"})
+            return {"code": 2333, "msg": f"课表查询失败，状态码: {schedule_response.status_code}"}
         
         if "用户登录" in schedule_response.text:
-            return jsonify({"code": 1006, "msg": "课表查询时被重定向到登录页面，cookies可能已过期"})
+            return {"code": 1006, "msg": "课表查询时被重定向到登录页面，cookies可能已过期"}
         
         # 解析JSON响应
         try:
             schedule_data = schedule_response.json()
             
             if not schedule_data.get("kbList"):
-                return jsonify({"code": 1005, "msg": "获取课表内容为空"})
+                return {"code": 1005, "msg": "获取课表内容为空"}
             
             # 简化的课表数据格式化
             result = {
@@ -442,7 +775,9 @@ def get_schedule():
                         "credit": float(i.get("xf", 0)) if i.get("xf") else 0,
                         "weekday": int(i.get("xqj", 0)) if i.get("xqj") else 0,
                         "time": i.get("jc"),
+                        "sessions_mask": sessions_mask(i.get("jc")),
                         "weeks": i.get("zcd"),
+                        "weeks_mask": weeks_mask(i.get("zcd")),
                         "campus": i.get("xqmc"),
                         "place": i.get("cdmc"),
                         "total_hours": int(i.get("zxs", 0)) if i.get("zxs") else 0,
@@ -452,26 +787,20 @@ def get_schedule():
             }
             
             print(f"课表查询成功，返回 {len(result['courses'])} 门课程")
-            return jsonify({"code": 1000, "msg": "获取课表成功", "data": result})
+            return {"code": 1000, "msg": "获取课表成功", "data": result}
             
         except json.JSONDecodeError:
             print(f"课表响应不是JSON格式: {schedule_response.text[:500]}")
-            return jsonify({"code": 2333, "msg": f"课表响应格式错误，内容: {schedule_response.text[:200]}"})
+            return {"code": 2333, "msg": f"课表响应格式错误，内容: {schedule_response.text[:200]}"}
     
     except Exception as e:
         print(f"课表查询服务异常: {str(e)}")
         traceback.print_exc()        # 当前查询方法失败时的异常处理
         try:
-            stu = Client(cookies=cookies, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-            
-            # 获取school_name参数
-            school_name = data.get('school_name') if isinstance(data, dict) else None
-            
-            result = stu.get_schedule(year, term, school_name=school_name, base_url=base_url)
-            return jsonify(result)
+            return stu.get_schedule(year, term, school_name=school_name, base_url=base_url)
         except Exception as fallback_e:
             print(f"原版本也失败: {str(fallback_e)}")
-            return jsonify({"code": 999, "msg": f"课表查询完全失败: {str(e)}, 回退失败: {str(fallback_e)}"})
+            return {"code": 999, "msg": f"课表查询完全失败: {str(e)}, 回退失败: {str(fallback_e)}"}
 
 # 通知消息
 @app.route('/api/notifications', methods=['POST'])
@@ -480,22 +809,21 @@ def get_notifications():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     
     # 使用统一的参数校验获取base_url
     base_url, error_response = get_base_url_from_params(data)
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})    
     print(f"通知消息查询 - 使用URL: {base_url}")
     
     # 获取school_name参数
     school_name = data.get('school_name')
     
     try:
-        stu = Client(cookies=cookies, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+        stu, error_response = get_client_from_params(data, base_url)
+        if error_response:
+            return error_response
         result = stu.get_notifications(school_name=school_name, base_url=base_url)
         return jsonify(result)
     except Exception as e:
@@ -510,16 +838,12 @@ def get_academia():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     
     # 使用统一的参数校验获取base_url
     base_url, error_response = get_base_url_from_params(data)
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"学业生涯查询 - 使用URL: {base_url}")
     
     # 注意：get_academia 方法已被注释掉，返回不支持
@@ -561,65 +885,27 @@ def get_captcha():
     try:
         stu = Client(cookies={}, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
         
-        # 使用Client配置的正确URL路径
-        if not stu.login_url or not stu.kaptcha_url:
-            return jsonify({"code": 2333, "msg": "学校配置不完整，无法获取登录或验证码URL"})
-        
-        # 访问登录页面
-        resp = stu.sess.get(stu.login_url, timeout=stu.timeout, verify=False)
-        
-        if resp.status_code != 200:
-            return jsonify({"code": 2333, "msg": f"无法访问登录页面，状态码: {resp.status_code}"})
-        
-        # 解析页面获取CSRF token
-        from pyquery import PyQuery as pq
-        doc = pq(resp.text)
-        csrf_token = doc("#csrftoken").attr("value")
-        
-        if not csrf_token:
-            return jsonify({"code": 2333, "msg": "无法获取CSRF token"})
-        
-        # 获取公钥
-        if not stu.key_url:
-            return jsonify({"code": 2333, "msg": "学校配置不完整，无法获取公钥URL"})
-            
-        req_pubkey = stu.sess.get(stu.key_url, timeout=stu.timeout, verify=False)
-        
-        if req_pubkey.status_code != 200:
-            return jsonify({"code": 2333, "msg": f"公钥获取失败，状态码: {req_pubkey.status_code}"})
-        
-        try:
-            pubkey_data = req_pubkey.json()
-        except Exception as e:
-            return jsonify({"code": 2333, "msg": f"公钥解析失败: {str(e)}"})
-        
-        modulus = pubkey_data.get("modulus")
-        exponent = pubkey_data.get("exponent")
-        
-        if not modulus or not exponent:
-            return jsonify({"code": 2333, "msg": "公钥数据不完整"})
-        
-        # 获取验证码
-        req_kaptcha = stu.sess.get(stu.kaptcha_url, timeout=stu.timeout, verify=False)
-        
-        if req_kaptcha.status_code != 200:
-            return jsonify({"code": 2333, "msg": f"验证码获取失败，状态码: {req_kaptcha.status_code}"})
-        
-        kaptcha_pic = base64.b64encode(req_kaptcha.content).decode()
+        # 登录握手：访问登录页面后并发获取公钥（未缓存时）与验证码
+        handshake = stu.login_handshake(with_captcha=True)
+        if handshake["code"] != 1000:
+            return jsonify(handshake)
+        state = handshake["data"]
         
         result = {
             "code": 1001,
             "msg": "获取验证码成功",
             "data": {
-                "kaptcha": kaptcha_pic,
-                "cookies": dict(stu.sess.cookies),
-                "csrf_token": csrf_token,
-                "modulus": modulus,
-                "exponent": exponent
+                "kaptcha_bytes": state["kaptcha"],
+                "kaptcha_type": state["kaptcha_type"],
+                "cookies": state["cookies"],
+                "csrf_token": state["csrf_token"],
+                "modulus": state["modulus"],
+                "exponent": state["exponent"]
             }
         }
+        result = attach_pending_login(result, stu, base_url, school_name, binary=wants_binary_captcha(data), image_field="kaptcha")
         
-        print(f"获取验证码结果: 验证码大小 {len(req_kaptcha.content)} bytes")
+        print(f"获取验证码结果: 验证码大小 {len(state['kaptcha'])} bytes，耗时: {state['timing']}")
         return jsonify(result)
         
     except Exception as e:
@@ -630,6 +916,16 @@ def get_captcha():
             "msg": f"获取验证码过程发生异常: {str(e)}"
         })
 
+# 验证码图片（二进制，与 login_token 绑定）
+@app.route('/api/captcha_image/<login_token>', methods=['GET'])
+@handle_errors
+def captcha_image(login_token):
+    """直接返回验证码图片，代替 JSON 中的 base64 图片"""
+    image, content_type, headers, error = captcha_image_response(login_token)
+    if error:
+        return jsonify(error), 404
+    return Response(image, mimetype=content_type, headers=headers)
+
 # 选课相关接口
 @app.route('/api/selected_courses', methods=['POST'])
 @handle_errors
@@ -638,7 +934,6 @@ def selected_courses():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year', 2024)
     term = data.get('term', 1)
     school_name = data.get('school_name')  # 获取学校名称
@@ -648,15 +943,22 @@ def selected_courses():
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"已选课程查询 - 学校: {school_name}, 使用URL: {base_url}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.get_selected_courses(year, term, school_name, base_url)
     return jsonify(result)
 
+def block_catalog_key(base_url, block, params):
+    """板块课列表的缓存键：同一学校、同一选课控制（xkkz_id）、年级、专业、课程类型与学年学期的学生看到的列表相同"""
+    return (
+        school_key(base_url),
+        str(block),
+        *(str(params.get(name, '')) for name in ('xkkz_id', 'njdm_id', 'zyh_id', 'kklxdm', 'xkxnm', 'xkxqm')),
+    )
+
 @app.route('/api/block_courses', methods=['POST'])
 @handle_errors
 def block_courses():
@@ -664,7 +966,6 @@ def block_courses():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year', 2025)  # 默认查询年份为2025
     term = data.get('term', 1)
     # 支持两种参数名：block 和 block_id
@@ -676,13 +977,21 @@ def block_courses():
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"板块课程查询 - 学校: {school_name}, 使用URL: {base_url}, 年份: {year}, 学期: {term}, 板块: {block}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-    result = stu.get_block_courses(year, term, block, school_name, base_url)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    # 先用学生自己的会话进入选课首页取得表单参数，参数相同的学生共享板块课列表缓存
+    params_result = stu.get_block_params(year, term, school_name, base_url)
+    if params_result.get('code') != 1000:
+        return jsonify(params_result)
+    params = params_result['data']
+    result = reference_cache.get_or_load(
+        "block_courses",
+        block_catalog_key(base_url, block, params),
+        lambda: stu.get_block_courses(year, term, block, school_name, base_url, params=params),
+    )
     return jsonify(result)
 
 @app.route('/api/course_classes', methods=['POST'])
@@ -692,7 +1001,6 @@ def course_classes():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year', 2025)
     term = data.get('term', 1)
     course_id = data.get('course_id')
@@ -703,12 +1011,14 @@ def course_classes():
     if error_response:
         return error_response
     
-    if not all([cookies, course_id]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, course_id 和 (base_url 或 school_name)"})
+    if not course_id:
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), course_id 和 (base_url 或 school_name)"})
     
     print(f"教学班查询 - 学校: {school_name}, 使用URL: {base_url}, 年份: {year}, 学期: {term}, 课程ID: {course_id}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.get_course_classes(year, term, course_id, school_name, base_url)
     return jsonify(result)
 
@@ -719,7 +1029,6 @@ def select_course():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     sid = data.get('sid')
     course_id = data.get('course_id')
     do_id = data.get('do_id')
@@ -733,15 +1042,249 @@ def select_course():
     if error_response:
         return error_response
     
-    if not all([cookies, sid, course_id, do_id]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, sid, course_id, do_id 和 (base_url 或 school_name)"})
+    if not all([sid, course_id, do_id]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), sid, course_id, do_id 和 (base_url 或 school_name)"})
     
     print(f"选课操作 - 学校: {school_name}, 使用URL: {base_url}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.select_course(sid, course_id, do_id, kklxdm, year, term, school_name, base_url)
     return jsonify(result)
 
+def parse_rush_targets(data):
+    """
+    解析抢课目标课程：targets 列表，或与 /api/select_course 相同的单门课程参数
+    返回:
+        tuple: (targets, error)，targets 为 [{"course_id", "do_id", "kklxdm"}, ...]
+    """
+    targets = data.get('targets')
+    if targets is None:
+        targets = [{"course_id": data.get('course_id'), "do_id": data.get('do_id'), "kklxdm": data.get('kklxdm', '1')}]
+    if not isinstance(targets, list) or not targets:
+        return None, {"code": 400, "msg": "targets 必须为非空列表"}
+    if len(targets) > RUSH_MAX_TARGETS:
+        return None, {"code": 400, "msg": f"单个抢课任务最多 {RUSH_MAX_TARGETS} 门课程"}
+    parsed = []
+    for target in targets:
+        if not isinstance(target, dict) or not target.get('course_id') or not target.get('do_id'):
+            return None, {"code": 400, "msg": "每门课程需要 course_id 和 do_id"}
+        parsed.append({"course_id": target['course_id'], "do_id": target['do_id'], "kklxdm": target.get('kklxdm', '1')})
+    return parsed, None
+
+@app.route('/api/select_course/rush', methods=['POST'])
+@handle_errors
+def create_course_rush():
+    """
+    创建抢课任务：开放前保持并预热会话，到点后并发提交选课，有限次重试
+    请求参数:
+        token/cookies: 登录凭证
+        sid: 学号
+        targets: [{"course_id", "do_id", "kklxdm"}]（或单门课程的 course_id, do_id, kklxdm）
+        year, term: 学年学期
+        open_at: 选课开放时间（Unix 时间戳或 "YYYY-MM-DD HH:MM:SS"），已过时立即提交
+        max_attempts: 每门课程最多提交次数（默认 5，最多 50）
+        retry_interval: 重试间隔秒数（默认 0.3）
+        advance_ms: 提前提交的毫秒数（默认 0，最多 2000）
+    """
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    sid = data.get('sid')
+    year = data.get('year', 2024)
+    term = data.get('term', 1)
+    school_name = data.get('school_name')
+
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+
+    targets, error = parse_rush_targets(data)
+    if error:
+        return jsonify(error)
+    if not sid:
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), sid, targets 和 (base_url 或 school_name)"})
+    open_at = parse_open_at(data.get('open_at', time.time()))
+    if open_at is None:
+        return jsonify({"code": 400, "msg": "open_at 格式错误，需要 Unix 时间戳或 YYYY-MM-DD HH:MM:SS"})
+    try:
+        max_attempts = min(50, max(1, int(data.get('max_attempts', 5))))
+        retry_interval = min(10.0, max(0.0, float(data.get('retry_interval', 0.3))))
+        advance = min(2000.0, max(0.0, float(data.get('advance_ms', 0)))) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "max_attempts, retry_interval, advance_ms 必须为数字"})
+
+    owner = resolve_cache_user(data, base_url)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    try:
+        url_select = stu.get_school_url("select_course", None, school_name, base_url)
+    except ValueError as e:
+        return jsonify({"code": 2333, "msg": str(e)})
+
+    # 选课地址与表单提前准备好，到点后直接提交
+    for target in targets:
+        target["select_data"] = stu.build_select_data(sid, target["course_id"], target["do_id"], target["kklxdm"], year, term)
+    job, error = course_rush.start(
+        stu, owner, url_select, targets, open_at,
+        max_attempts=max_attempts, retry_interval=retry_interval, advance=advance,
+        school_name=school_name, base_url=base_url,
+    )
+    if error:
+        return jsonify(error)
+    return jsonify({"code": 1000, "msg": "抢课任务已创建", "data": job})
+
+@app.route('/api/select_course/rush/status', methods=['POST'])
+@handle_errors
+def course_rush_status():
+    """查询抢课任务状态（含每次提交的耗时与结果），需使用创建任务时的登录凭证"""
+    return course_rush_action(course_rush.status, "获取抢课任务状态成功")
+
+@app.route('/api/select_course/rush/cancel', methods=['POST'])
+@handle_errors
+def cancel_course_rush():
+    """取消抢课任务（已提交的请求不会撤回）"""
+    return course_rush_action(course_rush.cancel, "抢课任务已取消")
+
+def course_rush_action(action, msg):
+    data = request.json
+    if not data or not data.get('job_id'):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token) 和 job_id"})
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    job = action(data['job_id'], resolve_cache_user(data, base_url))
+    if job is None:
+        return jsonify({"code": 1005, "msg": "抢课任务不存在或已过期"})
+    return jsonify({"code": 1000, "msg": msg, "data": job})
+
+def swap_course_params(data):
+    """换课参数：原课程 course_id 与教学班 old_do_id（或 do_id），新教学班 new_do_id（及可选的 new_course_id）"""
+    return {
+        "sid": data.get('sid'),
+        "course_id": data.get('course_id'),
+        "old_do_id": data.get('old_do_id') or data.get('do_id'),
+        "new_do_id": data.get('new_do_id'),
+        "kklxdm": data.get('kklxdm', '1'),
+        "year": data.get('year', 2025),
+        "term": data.get('term', 1),
+        "new_course_id": data.get('new_course_id'),
+    }
+
+@app.route('/api/swap_course', methods=['POST'])
+@handle_errors
+def swap_course():
+    """
+    换教学班：服务端连续执行退课与选课，选课失败时立即选回原教学班，返回每一步的耗时
+    请求参数:
+        token/cookies: 登录凭证（建议使用 token，复用已预热的会话）
+        sid, course_id, old_do_id, new_do_id: 学号、课程、原教学班、新教学班
+        new_course_id: 新教学班所属课程（可选）
+        kklxdm, year, term: 开课类型代码、学年学期
+    """
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    school_name = data.get('school_name')
+
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+
+    params = swap_course_params(data)
+    if not all([params['sid'], params['course_id'], params['old_do_id'], params['new_do_id']]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), sid, course_id, old_do_id, new_do_id 和 (base_url 或 school_name)"})
+
+    print(f"换课操作 - 学校: {school_name}, 使用URL: {base_url}, 课程ID: {params['course_id']}")
+
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    result = stu.swap_course(**params, school_name=school_name, base_url=base_url)
+    return jsonify(result)
+
+@app.route('/api/course_watch', methods=['POST'])
+@handle_errors
+def create_course_watch():
+    """
+    登记余量监控：服务端轮询教学班余量，出现余量时自动选课
+    请求参数:
+        token/cookies: 登录凭证
+        sid: 学号
+        course_id: 课程ID
+        do_id: 教学班ID（选课用 do_jxb_id）
+        class_id: 教学班 jxb_id（可选，用于匹配教学班列表）
+        kklxdm: 开课类型代码（可选，默认 1）
+        year, term: 学年学期
+    """
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    sid = data.get('sid')
+    course_id = data.get('course_id')
+    do_id = data.get('do_id')
+    kklxdm = data.get('kklxdm', '1')
+    year = data.get('year', 2025)
+    term = data.get('term', 1)
+    school_name = data.get('school_name')
+
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+
+    if not all([sid, course_id, do_id]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), sid, course_id, do_id 和 (base_url 或 school_name)"})
+
+    owner = resolve_cache_user(data, base_url)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    try:
+        url_select = stu.get_school_url("select_course", None, school_name, base_url)
+    except ValueError as e:
+        return jsonify({"code": 2333, "msg": str(e)})
+
+    watcher, error = seat_watcher.add(
+        stu, owner, year, term, course_id, do_id, url_select,
+        stu.build_select_data(sid, course_id, do_id, kklxdm, year, term),
+        class_id=data.get('class_id'), school_name=school_name, base_url=base_url,
+    )
+    if error:
+        return jsonify(error)
+    return jsonify({"code": 1000, "msg": "余量监控已登记", "data": watcher})
+
+@app.route('/api/course_watch/status', methods=['POST'])
+@handle_errors
+def course_watch_status():
+    """查询余量监控状态：传 watch_id 时返回该监控，否则返回当前用户的全部监控"""
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    result = seat_watcher.status(resolve_cache_user(data, base_url), data.get('watch_id'))
+    if result is None:
+        return jsonify({"code": 1005, "msg": "余量监控不存在或已过期"})
+    return jsonify({"code": 1000, "msg": "获取余量监控状态成功", "data": result})
+
+@app.route('/api/course_watch/cancel', methods=['POST'])
+@handle_errors
+def cancel_course_watch():
+    """取消余量监控"""
+    data = request.json
+    if not data or not data.get('watch_id'):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token) 和 watch_id"})
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    watcher = seat_watcher.cancel(data['watch_id'], resolve_cache_user(data, base_url))
+    if watcher is None:
+        return jsonify({"code": 1005, "msg": "余量监控不存在或已过期"})
+    return jsonify({"code": 1000, "msg": "余量监控已取消", "data": watcher})
+
 @app.route('/api/drop_course', methods=['POST'])
 @handle_errors
 def drop_course():
@@ -749,7 +1292,6 @@ def drop_course():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     do_id = data.get('do_id')
     course_id = data.get('course_id')
     year = data.get('year', 2025)
@@ -761,12 +1303,14 @@ def drop_course():
     if error_response:
         return error_response
     
-    if not all([cookies, do_id, course_id]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, do_id, course_id 和 (base_url 或 school_name)"})
+    if not all([do_id, course_id]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), do_id, course_id 和 (base_url 或 school_name)"})
     
     print(f"退课操作 - 学校: {school_name}, 使用URL: {base_url}, 年份: {year}, 学期: {term}, 课程ID: {course_id}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.cancel_course(do_id, course_id, year, term, school_name, base_url)
     return jsonify(result)
 
@@ -777,7 +1321,6 @@ def schedule_pdf():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year', 2025)
     term = data.get('term', 1)
     name = data.get('name', '导出')  # 学生姓名
@@ -789,9 +1332,6 @@ def schedule_pdf():
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"课程表PDF导出 - 学校: {school_name}, 使用URL: {base_url}, 年份: {year}, 学期: {term}, 姓名: {name}")
     
     # 注意：get_schedule_pdf 方法已被注释掉，返回不支持
@@ -812,11 +1352,178 @@ def schedule_pdf():
     # else:
     #     return jsonify(result)
 
+# 批量接口支持的操作
+# required: 必填参数；cache: 使用的用户结果缓存（与单独接口共享）；key: 缓存键参数
+# call: 接收 (客户端, 参数, base_url)，Client 返回结果字典，AsyncClient 返回可等待对象
+# sync_only: 只能使用同步客户端（异步模式下在线程中执行）
+BATCH_OPERATIONS = {
+    "info": {
+        "cache": "info",
+        "call": lambda stu, p, base_url: stu.get_info(school_name=p.get('school_name'), base_url=base_url),
+    },
+    "grade": {
+        "cache": "grade",
+        "key": ('year', 'term'),
+        "call": lambda stu, p, base_url: stu.get_grade(p.get('year'), p.get('term'), school_name=p.get('school_name'), base_url=base_url),
+    },
+    "exam": {
+        "required": ('year', 'term'),
+        "cache": "exam",
+        "key": ('year', 'term'),
+        "call": lambda stu, p, base_url: stu.get_exam_schedule(p.get('year'), p.get('term'), school_name=p.get('school_name'), base_url=base_url),
+    },
+    "schedule": {
+        "required": ('year', 'term'),
+        "cache": "schedule",
+        "key": ('year', 'term'),
+        "call": lambda stu, p, base_url: query_schedule(stu, base_url, p.get('year'), p.get('term'), p.get('school_name')),
+        "sync_only": True,
+    },
+    "grade_detail": {
+        "required": ('year',),
+        "call": lambda stu, p, base_url: stu.get_grade_detail(p.get('year'), p.get('term', 0), school_name=p.get('school_name'), base_url=base_url),
+    },
+    "notifications": {
+        "call": lambda stu, p, base_url: stu.get_notifications(school_name=p.get('school_name'), base_url=base_url),
+    },
+    "selected_courses": {
+        "call": lambda stu, p, base_url: stu.get_selected_courses(p.get('year', 2024), p.get('term', 1), p.get('school_name'), base_url),
+    },
+}
+
+def parse_batch_operations(data):
+    """
+    校验批量请求中的操作列表（不依赖具体Web框架）
+    每个操作的参数为请求公共参数（cookies/token、school_name 等）与操作自身 params 的合并
+    返回:
+        tuple: (操作列表, error)，操作为 (id, 操作名, 参数, 错误结果字典或 None)
+    """
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return None, {"code": 400, "msg": "参数不完整，需要 operations 列表"}
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return None, {"code": 400, "msg": f"单次最多 {BATCH_MAX_OPERATIONS} 个操作"}
+    common = {k: v for k, v in data.items() if k != 'operations'}
+    parsed = []
+    for index, operation in enumerate(operations):
+        if isinstance(operation, str):
+            operation = {"op": operation}
+        if not isinstance(operation, dict):
+            parsed.append((str(index), None, None, {"code": 400, "msg": "操作格式错误"}))
+            continue
+        name = operation.get('op')
+        op_id = str(operation.get('id') or name or index)
+        spec = BATCH_OPERATIONS.get(name)
+        if not spec:
+            parsed.append((op_id, name, None, {"code": 400, "msg": f"不支持的操作: {name}，可选: {', '.join(BATCH_OPERATIONS)}"}))
+            continue
+        params = dict(common, **(operation.get('params') or {}))
+        missing = [key for key in spec.get('required', ()) if not params.get(key)]
+        if missing:
+            parsed.append((op_id, name, params, {"code": 400, "msg": f"参数不完整，需要 {', '.join(missing)}"}))
+            continue
+        parsed.append((op_id, name, params, None))
+    return parsed, None
+
+def batch_cache_key(spec, params):
+    return tuple(str(params.get(key)) for key in spec.get('key', ()))
+
+def batch_item(op_id, name, result, started):
+    """单个操作的结果项"""
+    return {
+        "id": op_id,
+        "op": name,
+        "code": result.get("code") if isinstance(result, dict) else None,
+        "elapsed": round(time.perf_counter() - started, 3),
+        "result": result,
+    }
+
+def run_batch_operation(stu, base_url, user, op_id, name, params, error=None):
+    """同步执行单个批量操作，返回单个操作的结果项"""
+    started = time.perf_counter()
+    if error:
+        result = error
+    else:
+        spec = BATCH_OPERATIONS[name]
+        try:
+            loader = lambda: spec['call'](stu, params, base_url)
+            if spec.get('cache'):
+                result = response_cache.fetch(spec['cache'], user, batch_cache_key(spec, params), loader, force_refresh=bool(params.get('force_refresh')))
+            else:
+                result = loader()
+        except Exception as e:
+            traceback.print_exc()
+            result = {"code": 999, "msg": f"操作执行失败: {str(e)}"}
+    return batch_item(op_id, name, result, started)
+
+# 批量接口
+@app.route('/api/batch', methods=['POST'])
+@handle_errors
+def batch():
+    """
+    批量执行多个查询（同一会话，有限并发），减少客户端往返次数
+    请求参数：
+    - cookies 或 token、school_name 或 base_url: 所有操作共用
+    - operations: 操作列表，如 [{"id": "g", "op": "grade", "params": {"year": 2024, "term": 1}}, "info"]
+      可选操作: info, grade, exam, schedule, grade_detail, notifications, selected_courses
+    """
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    operations, error = parse_batch_operations(data)
+    if error:
+        return jsonify(error)
+    stu, error_response = get_client_from_params(data, base_url, school_name=data.get('school_name'))
+    if error_response:
+        return error_response
+    user = resolve_cache_user(data, base_url)
+    
+    started = time.perf_counter()
+    workers = max(1, min(BATCH_CONCURRENCY, len(operations)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = [
+            executor.submit(run_batch_operation, stu, base_url, user, *operation)
+            for operation in operations
+        ]
+        results = [future.result() for future in futures]
+    return jsonify({
+        "code": 1000,
+        "msg": "批量请求完成",
+        "data": {
+            "count": len(results),
+            "elapsed": round(time.perf_counter() - started, 3),
+            "results": results,
+        }
+    })
+
 # 健康检查接口
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "ZFJW Backend API is running"})
 
+# 连接池统计接口
+@app.route('/api/pool_stats', methods=['GET'])
+@handle_errors
+def get_pool_stats():
+    """获取共享连接池统计信息（连接复用率等）及服务端会话数量"""
+    stats = transport_manager.get_stats()
+    stats["session_store"] = session_store.get_stats()
+    stats["reference_cache"] = reference_cache.get_stats()
+    stats["response_cache"] = response_cache.get_stats()
+    stats["course_rush"] = course_rush.get_stats()
+    stats["seat_watcher"] = seat_watcher.get_stats()
+    stats["pubkey_cache"] = pubkey_cache.get_stats()
+    stats["pending_logins"] = pending_logins.get_stats()
+    stats["captcha_solver"] = captcha_solver.get_stats()
+    return jsonify({
+        "code": 1000,
+        "msg": "获取连接池统计成功",
+        "data": stats
+    })
+
 # 学校相关接口
 @app.route('/api/schools', methods=['GET'])
 @handle_errors
@@ -888,14 +1595,13 @@ def evaluate_menu():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     school_name = data.get('school_name')
     base_url, error_response = get_base_url_from_params(data)
     if error_response:
         return error_response
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.get_evaluate_menu(school_name=school_name, base_url=base_url)
     return jsonify(result)
 
@@ -905,15 +1611,16 @@ def evaluate_detail():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     jxb_id = data.get('jxb_id')
     school_name = data.get('school_name')
     base_url, error_response = get_base_url_from_params(data)
     if error_response:
         return error_response
-    if not cookies or not jxb_id:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, jxb_id 和 (base_url 或 school_name)"})
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    if not jxb_id:
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), jxb_id 和 (base_url 或 school_name)"})
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
     result = stu.get_evaluate_detail(jxb_id, school_name=school_name, base_url=base_url)
     return jsonify(result)
 
@@ -923,7 +1630,6 @@ def evaluate_save():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     school_name = data.get('school_name')
     jxb_id = data.get('jxb_id')
     kch_id = data.get('kch_id')
@@ -932,8 +1638,8 @@ def evaluate_save():
     comment_name = data.get('comment_name', 'py')
 
     # 校验参数（action_url 不再要求前端传）
-    if not (cookies and school_name and jxb_id and kch_id and evaluation_data):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, school_name, jxb_id, kch_id, evaluation_data"})
+    if not (school_name and jxb_id and kch_id and evaluation_data):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), school_name, jxb_id, kch_id, evaluation_data"})
 
     # 后端自动查找 action_url（保存接口用 evaluate_save 配置）
     school_config = school_config_manager.get_school_config(school_name)
@@ -946,7 +1652,9 @@ def evaluate_save():
     action_url = urljoin(base_url, evaluate_save_path)
 
     # 自动组装表单参数
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
 
     # 兼容前端只传分数、评语，后端自动补全所有必填参数
     # 先获取评价详情，拿到所有input_name、pjzbxm_id等
@@ -976,7 +1684,6 @@ def evaluate_submit():
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
     print(f"收到教学评价提交请求: {data}")
-    cookies = data.get('cookies')
     school_name = data.get('school_name')
     jxb_id = data.get('jxb_id')
     kch_id = data.get('kch_id')
@@ -985,8 +1692,8 @@ def evaluate_submit():
     comment_name = data.get('comment_name', 'py')
 
     # 校验参数（action_url 不再要求前端传）
-    if not (cookies and school_name and jxb_id and kch_id and evaluation_data):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, school_name, jxb_id, kch_id, evaluation_data"})
+    if not (school_name and jxb_id and kch_id and evaluation_data):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), school_name, jxb_id, kch_id, evaluation_data"})
 
     # 后端自动查找 action_url
     school_config = school_config_manager.get_school_config(school_name)
@@ -999,7 +1706,9 @@ def evaluate_submit():
     action_url = urljoin(base_url, evaluate_submit_path)
 
     # 自动组装表单参数
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
 
     # 兼容前端只传分数、评语，后端自动补全所有必填参数
     # 先获取评价详情，拿到所有input_name、pjzbxm_id等
@@ -1060,7 +1769,6 @@ def get_campus_list():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     school_name = data.get('school_name')
     
     # 使用统一的参数校验获取base_url
@@ -1068,13 +1776,17 @@ def get_campus_list():
     if error_response:
         return error_response
     
-    if not cookies:
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies 和 (base_url 或 school_name)"})
-    
     print(f"获取校区列表 - 学校: {school_name}, 使用URL: {base_url}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-    result = stu.get_campus_list(school_name=school_name, base_url=base_url)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    # 校区列表对同一学校的所有学生相同，走共享缓存
+    result = reference_cache.get_or_load(
+        "campus_list",
+        (school_key(base_url),),
+        lambda: stu.get_campus_list(school_name=school_name, base_url=base_url),
+    )
     return jsonify(result)
 
 # 获取教学楼列表接口
@@ -1121,7 +1833,6 @@ def get_building_list():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year')
     term = data.get('term')
     campus_id = data.get('campus_id', '1')  # 默认为主校区
@@ -1132,13 +1843,20 @@ def get_building_list():
     if error_response:
         return error_response
     
-    if not all([cookies, year, term]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, year, term 和 (base_url 或 school_name)"})
+    if not all([year, term]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), year, term 和 (base_url 或 school_name)"})
     
     print(f"获取教学楼列表 - 学校: {school_name}, 使用URL: {base_url}, 学年: {year}, 学期: {term}, 校区: {campus_id}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
-    result = stu.get_building_list(year, term, campus_id=campus_id, school_name=school_name, base_url=base_url)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    # 教学楼与节次信息按学校、学年学期、校区共享缓存
+    result = reference_cache.get_or_load(
+        "building_list",
+        (school_key(base_url), str(year), str(term), str(campus_id)),
+        lambda: stu.get_building_list(year, term, campus_id=campus_id, school_name=school_name, base_url=base_url),
+    )
     return jsonify(result)
 
 # 空教室查询接口
@@ -1174,7 +1892,6 @@ def get_classroom():
     data = request.json
     if not data:
         return jsonify({"code": 400, "msg": "请求数据为空"})
-    cookies = data.get('cookies')
     year = data.get('year')
     term = data.get('term')
     weeks = data.get('weeks')
@@ -1190,15 +1907,117 @@ def get_classroom():
         return error_response
     
     # 校验必填参数
-    if not all([cookies, year, term, weeks is not None, day_of_weeks is not None, time_slots is not None]):
-        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies, year, term, weeks, day_of_weeks, time_slots 和 (base_url 或 school_name)"})
+    if not all([year, term, weeks is not None, day_of_weeks is not None, time_slots is not None]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), year, term, weeks, day_of_weeks, time_slots 和 (base_url 或 school_name)"})
     
     print(f"空教室查询 - 学校: {school_name}, 使用URL: {base_url}, 学年: {year}, 学期: {term}, 周次: {weeks}, 星期: {day_of_weeks}, 节次: {time_slots}, 校区: {campus_id}, 教学楼: {building or '全部'}")
     
-    stu = Client(cookies=cookies, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    
+    # 优先使用学期空教室索引本地计算
+    indexed = classroom_index.query(base_url, year, term, campus_id, weeks, day_of_weeks, time_slots, building)
+    if indexed:
+        return jsonify(indexed)
     result = stu.get_empty_classroom(year, term, weeks, day_of_weeks, time_slots, campus_id=campus_id, school_name=school_name, base_url=base_url, building=building)
     return jsonify(result)
 
+# 空教室索引管理接口
+@app.route('/api/admin/classroom_index', methods=['GET'])
+@handle_errors
+@require_admin
+def get_classroom_index_status():
+    """查看空教室索引与后台抓取状态"""
+    return jsonify({"code": 1000, "msg": "获取空教室索引状态成功", "data": classroom_index.get_stats()})
+
+@app.route('/api/admin/classroom_index', methods=['POST'])
+@handle_errors
+@require_admin
+def build_classroom_index():
+    """
+    使用一个已登录会话在后台抓取整学期空教室索引
+    请求参数：
+    - token 或 cookies: 用于抓取的登录凭证（必填）
+    - year, term: 学年、学期（必填）
+    - campus_id: 校区ID，默认"1"
+    - max_week: 抓取的最大周次，默认20
+    - max_slot: 每天最大节次，默认12
+    - school_name 或 base_url
+    """
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    year = data.get('year')
+    term = data.get('term')
+    campus_id = data.get('campus_id', '1')
+    school_name = data.get('school_name')
+    
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    if not all([year, term]):
+        return jsonify({"code": 400, "msg": "参数不完整，需要 cookies(或 token), year, term 和 (base_url 或 school_name)"})
+    try:
+        max_week = int(data.get('max_week', 20))
+        max_slot = int(data.get('max_slot', 12))
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "max_week 与 max_slot 必须为整数"})
+    if not (1 <= max_week <= 30 and 1 <= max_slot <= 16):
+        return jsonify({"code": 400, "msg": "max_week 范围为 1-30，max_slot 范围为 1-16"})
+    
+    stu, error_response = get_client_from_params(data, base_url, school_name=school_name)
+    if error_response:
+        return error_response
+    status = classroom_index.start(stu, base_url, year, term, campus_id, max_week, max_slot, school_name=school_name)
+    return jsonify({"code": 1000, "msg": "空教室索引抓取已启动", "data": status})
+
+@app.route('/api/admin/classroom_index/stop', methods=['POST'])
+@handle_errors
+@require_admin
+def stop_classroom_index():
+    """停止空教室索引的后台抓取（已建立的索引继续可用）"""
+    data = request.json
+    if not data:
+        return jsonify({"code": 400, "msg": "请求数据为空"})
+    base_url, error_response = get_base_url_from_params(data)
+    if error_response:
+        return error_response
+    if classroom_index.stop(base_url, data.get('year'), data.get('term'), data.get('campus_id', '1')):
+        return jsonify({"code": 1000, "msg": "已停止空教室索引抓取"})
+    return jsonify({"code": 1005, "msg": "未找到对应的抓取任务"})
+
+# 公共数据缓存管理接口
+@app.route('/api/admin/reference_cache', methods=['GET'])
+@handle_errors
+@require_admin
+def get_reference_cache_status():
+    """查看公共数据缓存（校区、教学楼、节次）的命中情况"""
+    return jsonify({"code": 1000, "msg": "获取公共数据缓存状态成功", "data": reference_cache.get_stats()})
+
+@app.route('/api/admin/reference_cache/purge', methods=['POST'])
+@handle_errors
+@require_admin
+def purge_reference_cache():
+    """
+    清除公共数据缓存
+    请求参数（均可选）：
+    - namespace: campus_list 或 building_list，为空时清除全部类型
+    - school_name 或 base_url: 只清除该学校的缓存，为空时清除全部学校
+    """
+    data = request.get_json(silent=True) or {}
+    namespace = data.get('namespace')
+    if namespace and namespace not in reference_cache.ttls:
+        return jsonify({"code": 400, "msg": f"未知的缓存类型: {namespace}"})
+    school = None
+    if data.get('base_url') or data.get('school_name'):
+        base_url, error_response = get_base_url_from_params(data)
+        if error_response:
+            return error_response
+        school = school_key(base_url)
+    purged = reference_cache.purge(namespace, school)
+    return jsonify({"code": 1000, "msg": "清除公共数据缓存成功", "data": {"purged": purged}})
+
 if __name__ == '__main__':
     # 检查是否在生产环境
     is_production = os.environ.get('FLASK_ENV') == 'production'
@@ -1209,6 +2028,6 @@ if __name__ == '__main__':
     print("健康检查: http://localhost:5000/api/health")
     
     if is_production:
-        print("生产环境建议使用uWSGI启动:")
+        print("生产环境建议使用 ASGI 模式启动: uvicorn asgi:app --host 0.0.0.0 --port 5000")
     
     app.run(host='0.0.0.0', port=5000, debug=debug_mode)
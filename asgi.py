@@ -0,0 +1,530 @@
+import asyncio
+import contextlib
+import functools
+import os
+import time
+import traceback
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+# Flask 应用挂载依赖 a2wsgi（线程池大小可配置）
+from a2wsgi import WSGIMiddleware
+
+from app import (
+    app as flask_app,
+    resolve_base_url,
+    resolve_client,
+    resolve_cache_user,
+    attach_session_token,
+    attach_pending_login,
+    resolve_pending_login,
+    wants_binary_captcha,
+    captcha_image_response,
+    block_catalog_key,
+    swap_course_params,
+    parse_batch_operations,
+    batch_cache_key,
+    batch_item,
+    BATCH_OPERATIONS,
+    BATCH_CONCURRENCY,
+    GRADE_HISTORY_CONCURRENCY,
+    resolve_enrollment_year,
+    grade_term_cache,
+    RASPISANIE,
+    IGNORE_TYPE,
+    DETAIL_CATEGORY_TYPE,
+    TIMEOUT,
+)
+from async_client import AsyncClient
+from zfn_api import Client
+from cache import reference_cache, response_cache, school_key
+from classroom_index import classroom_index
+from grade_history import academic_terms, merge_grade_history
+from transport import transport_manager
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    try:
+        return max(1, int(value)) if value else default
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+# 错误处理装饰器（异步版本）
+def handle_errors(func):
+    @functools.wraps(func)
+    async def wrapper(request: Request):
+        try:
+            return await func(request)
+        except Exception as e:
+            print(f"接口 {func.__name__} 发生错误: {str(e)}")
+            traceback.print_exc()
+            return JSONResponse({"code": 999, "msg": f"服务器内部错误: {str(e)}"})
+    return wrapper
+
+
+async def read_json(request: Request):
+    """读取请求 JSON，格式错误时返回 None"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def prepare(request: Request, required=None, required_msg=None, with_school=False):
+    """
+    读取参数、获取 base_url 与异步客户端，与 Flask 接口的校验规则保持一致
+    参数:
+        required: 必填参数校验函数，接收请求数据，返回是否通过
+        required_msg: 必填参数缺失时的提示
+        with_school: 新建客户端时是否传入 school_name
+    返回:
+        tuple: (data, base_url, stu, error_response)
+    """
+    data = await read_json(request)
+    if not data:
+        return None, None, None, JSONResponse({"code": 400, "msg": "请求数据为空"})
+
+    base_url, error = resolve_base_url(data)
+    if error:
+        return data, None, None, JSONResponse(error)
+
+    if required and not required(data):
+        return data, base_url, None, JSONResponse({"code": 400, "msg": required_msg})
+
+    kwargs = {"school_name": data.get('school_name')} if with_school else {}
+    stu, error = resolve_client(data, base_url, AsyncClient, **kwargs)
+    if error:
+        return data, base_url, None, JSONResponse(error)
+    return data, base_url, stu, None
+
+
+def has_year_term(data):
+    return all([data.get('year'), data.get('term')])
+
+
+YEAR_TERM_MSG = "参数不完整，需要 cookies(或 token), year, term 和 (base_url 或 school_name)"
+
+
+# 登录接口
+@handle_errors
+async def login(request: Request):
+    data = await read_json(request)
+    if not data:
+        return JSONResponse({"code": 400, "msg": "请求数据为空"})
+
+    sid = data.get('sid')
+    password = data.get('password')
+    base_url = data.get('base_url')
+    school_name = data.get('school_name', '九江学院')
+
+    if not sid or not password or (not base_url and not school_name):
+        return JSONResponse({"code": 400, "msg": "参数不完整，需要 sid, password 和 (base_url 或 school_name)"})
+    if not base_url:
+        base_url, error = resolve_base_url({"school_name": school_name})
+        if error:
+            return JSONResponse(error)
+
+    stu = AsyncClient(cookies={}, base_url=base_url, school_name=school_name, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT)
+    lgn = await stu.login_auto(sid, password, kaptcha_binary=True)
+    lgn = attach_session_token(lgn, stu, base_url, school_name, sid)
+    lgn = attach_pending_login(lgn, stu, base_url, school_name, sid, password, binary=wants_binary_captcha(data))
+    return JSONResponse(lgn)
+
+
+# 登录验证码提交
+@handle_errors
+async def login_with_kaptcha(request: Request):
+    data = await read_json(request)
+    if not data:
+        return JSONResponse({"code": 400, "msg": "请求数据为空"})
+
+    if data.get('login_token'):
+        pending, login_params, error = resolve_pending_login(data)
+        if error:
+            return JSONResponse(error)
+        stu = pending.get_client(AsyncClient)
+        ret = await stu.login_with_kaptcha(**login_params)
+        ret = attach_session_token(ret, stu, pending.base_url, pending.school_name, login_params["sid"])
+        return JSONResponse(ret)
+
+    base_url, error = resolve_base_url({"base_url": data.get('base_url'), "school_name": data.get('school_name')})
+    if error:
+        return JSONResponse(error)
+
+    school_name = data.get('school_name')
+    client_kwargs = {"school_name": school_name} if school_name else {}
+    stu = AsyncClient(cookies={}, base_url=base_url, raspisanie=RASPISANIE, ignore_type=IGNORE_TYPE, detail_category_type=DETAIL_CATEGORY_TYPE, timeout=TIMEOUT, **client_kwargs)
+
+    login_params = {k: v for k, v in data.items() if k != 'base_url'}
+    ret = await stu.login_with_kaptcha(**login_params)
+    ret = attach_session_token(ret, stu, base_url, school_name, data.get('sid'))
+    return JSONResponse(ret)
+
+
+# 验证码图片（二进制，与 login_token 绑定）
+@handle_errors
+async def captcha_image(request: Request):
+    image, content_type, headers, error = captcha_image_response(request.path_params['login_token'])
+    if error:
+        return JSONResponse(error, status_code=404)
+    return Response(image, media_type=content_type, headers=headers)
+
+
+# 个人信息
+@handle_errors
+async def get_info(request: Request):
+    data, base_url, stu, error_response = await prepare(request)
+    if error_response:
+        return error_response
+    result = await response_cache.afetch(
+        "info",
+        resolve_cache_user(data, base_url),
+        (),
+        lambda: stu.get_info(school_name=data.get('school_name'), base_url=base_url),
+        force_refresh=bool(data.get('force_refresh')),
+    )
+    return JSONResponse(result)
+
+
+# 成绩查询
+@handle_errors
+async def get_grade(request: Request):
+    data, base_url, stu, error_response = await prepare(request)
+    if error_response:
+        return error_response
+    result = await response_cache.afetch(
+        "grade",
+        resolve_cache_user(data, base_url),
+        (str(data.get('year')), str(data.get('term'))),
+        lambda: stu.get_grade(data.get('year'), data.get('term'), school_name=data.get('school_name'), base_url=base_url),
+        force_refresh=bool(data.get('force_refresh')),
+    )
+    return JSONResponse(result)
+
+
+# 历年成绩
+@handle_errors
+async def get_grade_history(request: Request):
+    data, base_url, stu, error_response = await prepare(request)
+    if error_response:
+        return error_response
+    school_name = data.get('school_name')
+    user = resolve_cache_user(data, base_url)
+    force_refresh = bool(data.get('force_refresh'))
+
+    info = None
+    if not data.get('enrollment_year'):
+        info = await response_cache.afetch("info", user, (), lambda: stu.get_info(school_name=school_name, base_url=base_url))
+    enrollment_year, error = resolve_enrollment_year(data, info)
+    if error:
+        return JSONResponse(error)
+    terms = academic_terms(enrollment_year)
+    if not terms:
+        return JSONResponse({"code": 400, "msg": f"入学年份无效: {enrollment_year}"})
+
+    semaphore = asyncio.Semaphore(GRADE_HISTORY_CONCURRENCY)
+
+    async def load(year, term):
+        async with semaphore:
+            result = await response_cache.afetch(
+                grade_term_cache(year, term),
+                user,
+                (str(year), str(term)),
+                lambda: stu.get_grade(year, term, school_name=school_name, base_url=base_url),
+                force_refresh=force_refresh,
+            )
+        return year, term, result
+
+    term_results = await asyncio.gather(*[load(year, term) for year, term in terms])
+    return JSONResponse(merge_grade_history(term_results, enrollment_year))
+
+
+# 考试信息
+@handle_errors
+async def get_exam(request: Request):
+    data, base_url, stu, error_response = await prepare(request, has_year_term, YEAR_TERM_MSG)
+    if error_response:
+        return error_response
+    result = await response_cache.afetch(
+        "exam",
+        resolve_cache_user(data, base_url),
+        (str(data.get('year')), str(data.get('term'))),
+        lambda: stu.get_exam_schedule(data.get('year'), data.get('term'), school_name=data.get('school_name'), base_url=base_url),
+        force_refresh=bool(data.get('force_refresh')),
+    )
+    return JSONResponse(result)
+
+
+# 详细成绩查询（含平时分）
+@handle_errors
+async def get_grade_detail(request: Request):
+    data, base_url, stu, error_response = await prepare(
+        request,
+        lambda data: data.get('year'),
+        "参数不完整，需要 cookies(或 token), year 和 (base_url 或 school_name)",
+        with_school=True,
+    )
+    if error_response:
+        return error_response
+    result = await stu.get_grade_detail(data.get('year'), data.get('term', 0), school_name=data.get('school_name'), base_url=base_url)
+    return JSONResponse(result)
+
+
+# 通知消息
+@handle_errors
+async def get_notifications(request: Request):
+    data, base_url, stu, error_response = await prepare(request)
+    if error_response:
+        return error_response
+    try:
+        result = await stu.get_notifications(school_name=data.get('school_name'), base_url=base_url)
+        return JSONResponse(result)
+    except Exception as e:
+        print(f"通知消息查询出错: {str(e)}")
+        traceback.print_exc()
+        return JSONResponse({"code": 999, "msg": f"通知消息查询失败: {str(e)}"})
+
+
+# 已选课程
+@handle_errors
+async def selected_courses(request: Request):
+    data, base_url, stu, error_response = await prepare(request, with_school=True)
+    if error_response:
+        return error_response
+    result = await stu.get_selected_courses(data.get('year', 2024), data.get('term', 1), data.get('school_name'), base_url)
+    return JSONResponse(result)
+
+
+# 板块课程列表
+@handle_errors
+async def block_courses(request: Request):
+    data, base_url, stu, error_response = await prepare(request, with_school=True)
+    if error_response:
+        return error_response
+    year = data.get('year', 2025)
+    term = data.get('term', 1)
+    block = data.get('block') or data.get('block_id', 1)
+    school_name = data.get('school_name')
+    params_result = await stu.get_block_params(year, term, school_name, base_url)
+    if params_result.get('code') != 1000:
+        return JSONResponse(params_result)
+    params = params_result['data']
+    result = await reference_cache.aget_or_load(
+        "block_courses",
+        block_catalog_key(base_url, block, params),
+        lambda: stu.get_block_courses(year, term, block, school_name, base_url, params=params),
+    )
+    return JSONResponse(result)
+
+
+# 教学班列表
+@handle_errors
+async def course_classes(request: Request):
+    data, base_url, stu, error_response = await prepare(
+        request,
+        lambda data: data.get('course_id'),
+        "参数不完整，需要 cookies(或 token), course_id 和 (base_url 或 school_name)",
+        with_school=True,
+    )
+    if error_response:
+        return error_response
+    result = await stu.get_course_classes(data.get('year', 2025), data.get('term', 1), data.get('course_id'), data.get('school_name'), base_url)
+    return JSONResponse(result)
+
+
+# 换教学班（退课后立即选课，失败时选回）
+@handle_errors
+async def swap_course(request: Request):
+    data, base_url, stu, error_response = await prepare(
+        request,
+        lambda data: all([data.get('sid'), data.get('course_id'), data.get('old_do_id') or data.get('do_id'), data.get('new_do_id')]),
+        "参数不完整，需要 cookies(或 token), sid, course_id, old_do_id, new_do_id 和 (base_url 或 school_name)",
+        with_school=True,
+    )
+    if error_response:
+        return error_response
+    result = await stu.swap_course(**swap_course_params(data), school_name=data.get('school_name'), base_url=base_url)
+    return JSONResponse(result)
+
+
+# 校区列表
+@handle_errors
+async def get_campus_list(request: Request):
+    data, base_url, stu, error_response = await prepare(request, with_school=True)
+    if error_response:
+        return error_response
+    result = await reference_cache.aget_or_load(
+        "campus_list",
+        (school_key(base_url),),
+        lambda: stu.get_campus_list(school_name=data.get('school_name'), base_url=base_url),
+    )
+    return JSONResponse(result)
+
+
+# 教学楼列表
+@handle_errors
+async def get_building_list(request: Request):
+    data, base_url, stu, error_response = await prepare(request, has_year_term, YEAR_TERM_MSG, with_school=True)
+    if error_response:
+        return error_response
+    campus_id = data.get('campus_id', '1')
+    result = await reference_cache.aget_or_load(
+        "building_list",
+        (school_key(base_url), str(data.get('year')), str(data.get('term')), str(campus_id)),
+        lambda: stu.get_building_list(data.get('year'), data.get('term'), campus_id=campus_id, school_name=data.get('school_name'), base_url=base_url),
+    )
+    return JSONResponse(result)
+
+
+# 空教室查询
+@handle_errors
+async def get_classroom(request: Request):
+    data, base_url, stu, error_response = await prepare(
+        request,
+        lambda data: all([
+            data.get('year'),
+            data.get('term'),
+            data.get('weeks') is not None,
+            data.get('day_of_weeks') is not None,
+            data.get('time_slots') is not None,
+        ]),
+        "参数不完整，需要 cookies(或 token), year, term, weeks, day_of_weeks, time_slots 和 (base_url 或 school_name)",
+        with_school=True,
+    )
+    if error_response:
+        return error_response
+    indexed = classroom_index.query(
+        base_url,
+        data.get('year'),
+        data.get('term'),
+        data.get('campus_id', '1'),
+        data.get('weeks'),
+        data.get('day_of_weeks'),
+        data.get('time_slots'),
+        data.get('building'),
+    )
+    if indexed:
+        return JSONResponse(indexed)
+    result = await stu.get_empty_classroom(
+        data.get('year'),
+        data.get('term'),
+        data.get('weeks'),
+        data.get('day_of_weeks'),
+        data.get('time_slots'),
+        campus_id=data.get('campus_id', '1'),
+        school_name=data.get('school_name'),
+        base_url=base_url,
+        building=data.get('building'),
+    )
+    return JSONResponse(result)
+
+
+# 批量接口（同一会话，有限并发）
+async def run_batch_operation(semaphore, stu, base_url, user, op_id, name, params, error=None):
+    """异步执行单个批量操作，返回单个操作的结果项"""
+    async with semaphore:
+        started = time.perf_counter()
+        if error:
+            return batch_item(op_id, name, error, started)
+        spec = BATCH_OPERATIONS[name]
+        try:
+            if spec.get('sync_only'):
+                # 只支持同步客户端的操作在线程中执行，与异步客户端共享 cookies
+                sync_stu = Client.from_client(stu)
+                loader = lambda: asyncio.to_thread(spec['call'], sync_stu, params, base_url)
+            else:
+                loader = lambda: spec['call'](stu, params, base_url)
+            if spec.get('cache'):
+                result = await response_cache.afetch(spec['cache'], user, batch_cache_key(spec, params), loader, force_refresh=bool(params.get('force_refresh')))
+            else:
+                result = await loader()
+        except Exception as e:
+            traceback.print_exc()
+            result = {"code": 999, "msg": f"操作执行失败: {str(e)}"}
+        return batch_item(op_id, name, result, started)
+
+
+@handle_errors
+async def batch(request: Request):
+    data, base_url, stu, error_response = await prepare(request, with_school=True)
+    if error_response:
+        return error_response
+    operations, error = parse_batch_operations(data)
+    if error:
+        return JSONResponse(error)
+    user = resolve_cache_user(data, base_url)
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    results = await asyncio.gather(*[
+        run_batch_operation(semaphore, stu, base_url, user, *operation)
+        for operation in operations
+    ])
+    return JSONResponse({
+        "code": 1000,
+        "msg": "批量请求完成",
+        "data": {
+            "count": len(results),
+            "elapsed": round(time.perf_counter() - started, 3),
+            "results": results,
+        }
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    yield
+    # 退出时关闭共享的异步连接
+    await transport_manager.ashutdown()
+
+
+# 异步实现的高频查询接口优先匹配，其余 /api/* 接口交给原 Flask 应用（在线程池中执行）
+routes = [
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/login_with_kaptcha', login_with_kaptcha, methods=['POST']),
+    Route('/api/captcha_image/{login_token}', captcha_image, methods=['GET']),
+    Route('/api/info', get_info, methods=['POST']),
+    Route('/api/grade', get_grade, methods=['POST']),
+    Route('/api/exam', get_exam, methods=['POST']),
+    Route('/api/grade_history', get_grade_history, methods=['POST']),
+    Route('/api/grade_detail', get_grade_detail, methods=['POST']),
+    Route('/api/notifications', get_notifications, methods=['POST']),
+    Route('/api/selected_courses', selected_courses, methods=['POST']),
+    Route('/api/block_courses', block_courses, methods=['POST']),
+    Route('/api/course_classes', course_classes, methods=['POST']),
+    Route('/api/swap_course', swap_course, methods=['POST']),
+    Route('/api/campus_list', get_campus_list, methods=['POST']),
+    Route('/api/building_list', get_building_list, methods=['POST']),
+    Route('/api/classroom', get_classroom, methods=['POST']),
+    Route('/api/batch', batch, methods=['POST']),
+    Mount('/', WSGIMiddleware(flask_app, workers=_env_int("ZFJW_WORKER_THREADS", 16))),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("启动 ZFJW Backend API 服务（ASGI 模式）...")
+    print("健康检查: http://localhost:5000/api/health")
+    uvicorn.run(
+        "asgi:app",
+        host=os.environ.get("ZFJW_HOST", "0.0.0.0"),
+        port=_env_int("ZFJW_PORT", 5000),
+        limit_concurrency=_env_int("ZFJW_LIMIT_CONCURRENCY", 2000),
+        timeout_keep_alive=5,
+        proxy_headers=True,
+    )
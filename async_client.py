@@ -0,0 +1,102 @@
+import asyncio
+
+from requests import exceptions
+
+from zfn_api import UPSTREAM_PARALLEL, BlockingCall, Client, UpstreamRequest
+from transport import transport_manager
+
+# 异步客户端依赖 httpx
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncClient(Client):
+    """
+    基于 asyncio 的教务系统客户端
+    接口方法与 Client 相同（login、get_grade、get_schedule、get_exam_schedule、get_empty_classroom 等），
+    调用时需 await，返回的结果字典与 Client 完全一致；页面解析逻辑与 Client 共用，仅替换请求发送方式
+    """
+
+    is_async = True
+
+    def __init__(self, cookies={}, **kwargs):
+        if httpx is None:
+            raise RuntimeError("AsyncClient 需要安装 httpx")
+        super().__init__(cookies, **kwargs)
+        self._http = None
+        self._http_loop = None
+
+    def _get_http(self):
+        """获取绑定当前事件循环的 httpx 客户端（cookies 与同步会话共用同一个 cookie jar）"""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http_loop is not loop:
+            self._http = httpx.AsyncClient(
+                transport=transport_manager.get_async_transport(self.base_url),
+                headers=dict(self.sess.headers),
+                cookies=self.sess.cookies,
+                follow_redirects=True,
+                timeout=self.timeout,
+            )
+            self._http_loop = loop
+        return self._http
+
+    async def _send(self, request: UpstreamRequest):
+        """通过 httpx 发送上游请求，参数按 requests 的语义转换，异常转换为 requests 的异常类型"""
+        kwargs = dict(request.kwargs)
+        kwargs.pop("verify", None)
+        kwargs.pop("stream", None)
+        if "allow_redirects" in kwargs:
+            kwargs["follow_redirects"] = kwargs.pop("allow_redirects")
+        cookies = kwargs.pop("cookies", None)
+        if cookies:
+            for key, value in cookies.items():
+                self.sess.cookies.set(key, value)
+        if isinstance(kwargs.get("data"), (str, bytes)):
+            kwargs["content"] = kwargs.pop("data")
+
+        try:
+            return await self._get_http().request(request.method.upper(), request.url, **kwargs)
+        except httpx.TimeoutException as e:
+            raise exceptions.Timeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise exceptions.ConnectionError(str(e)) from e
+
+    async def _send_all(self, requests_list):
+        """并发发送一组上游请求（最多 UPSTREAM_PARALLEL 个同时进行），按顺序返回响应或异常对象"""
+        semaphore = asyncio.Semaphore(UPSTREAM_PARALLEL)
+
+        async def send(request):
+            async with semaphore:
+                try:
+                    return await self._send(request)
+                except Exception as e:
+                    return e
+
+        return list(await asyncio.gather(*(send(request) for request in requests_list)))
+
+    async def _run_flow(self, flow):
+        """异步执行接口流程：等待每个上游请求完成后把响应（或异常）送回流程，本地耗时计算在线程池中执行"""
+        try:
+            request = next(flow)
+            while True:
+                if isinstance(request, list):
+                    request = flow.send(await self._send_all(request))
+                    continue
+                try:
+                    if isinstance(request, BlockingCall):
+                        response = await asyncio.to_thread(request.run)
+                    else:
+                        response = await self._send(request)
+                except Exception as e:
+                    request = flow.throw(e)
+                else:
+                    request = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def aclose(self):
+        """释放客户端（底层连接池按学校主机共享，不随单个客户端关闭）"""
+        self._http = None
+        self._http_loop = None
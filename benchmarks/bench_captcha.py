@@ -0,0 +1,126 @@
+"""
+离线验证码识别（captcha_solver）准确率与单张耗时基准
+
+用法: python benchmarks/bench_captcha.py [标注图片目录]
+指定目录时读取真实验证码（文件名即答案，如 ab3x.png），按 1:1 划分训练集与测试集；
+未指定时生成仿 kaptcha 样式（4 位字符、随机旋转与偏移、渐变背景、干扰曲线与噪点、水波纹扭曲）的固定语料
+"""
+import io
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from captcha_solver import CaptchaTemplates, load_labelled_samples  # noqa: E402
+
+# kaptcha 默认字符集
+CHARSET = "abcde2345678gfynmnpwx"
+LENGTH = 4
+WIDTH, HEIGHT = 160, 50
+TRAIN_SIZE = 300
+TEST_SIZE = 200
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8]
+
+
+def make_captcha(rng, text):
+    """生成一张仿 kaptcha 样式的验证码图片（PNG 字节）"""
+    image = Image.new("RGB", (WIDTH, HEIGHT))
+    draw = ImageDraw.Draw(image)
+    start, end = rng.randint(215, 245), rng.randint(235, 255)
+    for x in range(WIDTH):
+        shade = start + (end - start) * x // WIDTH
+        draw.line([(x, 0), (x, HEIGHT)], fill=(shade, shade, shade))
+
+    font = ImageFont.load_default(size=rng.randint(30, 34))
+    x = rng.randint(6, 14)
+    color = tuple(rng.randint(0, 90) for _ in range(3))
+    for char in text:
+        glyph = Image.new("L", (40, 48), 0)
+        ImageDraw.Draw(glyph).text((8, 2), char, font=font, fill=255)
+        glyph = glyph.rotate(rng.uniform(-12, 12), resample=Image.BILINEAR)
+        image.paste(Image.new("RGB", glyph.size, color), (x - 8, rng.randint(-2, 4)), glyph)
+        x += rng.randint(30, 35)
+
+    # 干扰曲线（贝塞尔曲线，线宽 1）与噪点
+    p0, p1, p2 = (0, rng.randint(10, 40)), (WIDTH // 2, rng.randint(0, HEIGHT)), (WIDTH, rng.randint(10, 40))
+    points = [
+        ((1 - t) ** 2 * p0[0] + 2 * (1 - t) * t * p1[0] + t * t * p2[0],
+         (1 - t) ** 2 * p0[1] + 2 * (1 - t) * t * p1[1] + t * t * p2[1])
+        for t in (i / 60 for i in range(61))
+    ]
+    draw.line(points, fill=color, width=1)
+    for _ in range(60):
+        draw.point((rng.randrange(WIDTH), rng.randrange(HEIGHT)), fill=tuple(rng.randint(0, 160) for _ in range(3)))
+
+    # 水波纹：每行按正弦偏移
+    phase, amplitude = rng.uniform(0, math.pi * 2), rng.uniform(0.8, 1.8)
+    rippled = Image.new("RGB", image.size, (end, end, end))
+    for y in range(HEIGHT):
+        shift = int(round(amplitude * math.sin(phase + y / 6)))
+        rippled.paste(image.crop((0, y, WIDTH, y + 1)), (shift, y))
+
+    buffer = io.BytesIO()
+    rippled.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_corpus(seed, size):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(size):
+        text = "".join(rng.choice(CHARSET) for _ in range(LENGTH))
+        samples.append((make_captcha(rng, text), text))
+    return samples
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    if len(sys.argv) > 1:
+        samples = load_labelled_samples(sys.argv[1])
+        random.Random(0).shuffle(samples)
+        train, test = samples[: len(samples) // 2], samples[len(samples) // 2:]
+        source = sys.argv[1]
+    else:
+        train, test = make_corpus(1, TRAIN_SIZE), make_corpus(2, TEST_SIZE)
+        source = "仿 kaptcha 生成语料"
+
+    started = time.perf_counter()
+    templates = CaptchaTemplates.train(train)
+    train_ms = (time.perf_counter() - started) * 1000
+    prototypes = sum(len(vectors) for vectors in templates.chars.values())
+    print(f"语料: {source}，训练 {len(train)} 张 / 测试 {len(test)} 张")
+    print(f"训练耗时: {train_ms:.0f} ms，字符数: {len(templates.chars)}，原型数: {prototypes}")
+
+    results = []
+    latencies = []
+    for image_bytes, label in test:
+        started = time.perf_counter()
+        text, confidence = templates.recognize(image_bytes)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append((text == label, confidence, sum(a == b for a, b in zip(text, label)), len(label)))
+
+    correct = sum(1 for ok, *_ in results if ok)
+    chars_correct = sum(hits for _, _, hits, _ in results)
+    chars_total = sum(total for *_, total in results)
+    print(f"整体准确率: {correct / len(results):.1%}，字符准确率: {chars_correct / chars_total:.1%}")
+    print(f"单张耗时(ms): 平均 {statistics.mean(latencies):.2f}，P50 {percentile(latencies, 0.5):.2f}，"
+          f"P95 {percentile(latencies, 0.95):.2f}，最大 {max(latencies):.2f}")
+    print(f"{'置信度阈值':>10} {'自动提交比例':>12} {'提交准确率':>10}")
+    for threshold in THRESHOLDS:
+        accepted = [ok for ok, confidence, *_ in results if confidence >= threshold]
+        accuracy = sum(accepted) / len(accepted) if accepted else 0.0
+        print(f"{threshold:>10.2f} {len(accepted) / len(results):>12.1%} {accuracy:>10.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+课表合并时段拆分（Client.split_merge_display）性能基准
+
+用法: python benchmarks/bench_schedule.py [git 版本]
+从 git 历史加载旧实现（逐对比较 + list.index，O(n³)），默认取替换旧实现的提交的父提交，
+与当前的一次分组实现对比，课表规模 20~500 条。
+
+输出一致性：旧实现只拆分内容完全相同的重复条目（list.index 按内容比较，
+内容不同的条目总是找到自己而被跳过），在这类输入上两种实现的输出必须一致（不比较新增的 sessions_mask）；
+同一课程两个时段教室等字段不同时旧实现不做拆分、当前实现会拆分，基准中统计这部分行为差异
+"""
+import copy
+import os
+import random
+import subprocess
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zfn_api import Client, RASPIANIE  # noqa: E402
+
+SIZES = [20, 50, 100, 200, 500]
+REPEAT = 3
+WEEKS = ["1-16周", "1-8周", "9-16周", "1-16周(单)"]
+PLACES = ["一教101", "一教203", "二教305", "实验楼402"]
+
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def load_baseline(ref=None):
+    """从 git 历史加载旧版 zfn_api 模块（默认为移除旧实现的提交的父提交）"""
+    if ref is None:
+        ref = git("log", "-1", "--format=%H", "-S", "repetIndex", "--", "zfn_api.py") + "^"
+    source = git("show", f"{ref}:zfn_api.py")
+    module = types.ModuleType("zfn_api_baseline")
+    module.__file__ = os.path.join(ROOT, "zfn_api.py")
+    exec(compile(source, f"{ref}:zfn_api.py", "exec"), module.__dict__)
+    module.Client.raspisanie = RASPIANIE
+    return module, git("rev-parse", "--short", ref)
+
+
+def make_course(client_cls, course_id, weekday, weeks, sessions, place):
+    """按 Client.get_schedule 的字段生成一条课程记录"""
+    return {
+        "course_id": course_id,
+        "title": f"课程{course_id}",
+        "weekday": weekday,
+        "time": client_cls.display_course_time(sessions),
+        "sessions": sessions,
+        "list_sessions": client_cls.list_sessions(sessions),
+        "weeks": weeks,
+        "list_weeks": client_cls.list_weeks(weeks),
+        "place": place,
+    }
+
+
+def make_schedule(size, identical_pairs, seed=0):
+    """
+    生成课表：约 1/5 的课程在同一天有两个合并时段（每对两条独立的记录）
+    identical_pairs 为 True 时同一对记录内容完全相同，否则两个时段的教室不同
+    """
+    rng = random.Random(seed)
+    courses = []
+    while len(courses) < size:
+        course_id = f"K{len(courses):05d}"
+        weekday, weeks = rng.randint(1, 7), rng.choice(WEEKS)
+        if rng.random() < 0.2 and len(courses) + 2 <= size:
+            first, second = rng.sample(PLACES, 2)
+            courses.append(make_course(Client, course_id, weekday, weeks, "1-2节,5-6节", first))
+            courses.append(make_course(Client, course_id, weekday, weeks, "1-2节,5-6节",
+                                       first if identical_pairs else second))
+        else:
+            start = rng.choice([1, 3, 5, 7, 9])
+            courses.append(make_course(Client, course_id, weekday, weeks, f"{start}-{start + 1}节", rng.choice(PLACES)))
+    return {"courses": courses}
+
+
+def without_masks(schedule):
+    return [{k: v for k, v in course.items() if k != "sessions_mask"} for course in schedule["courses"]]
+
+
+def bench(func, schedule):
+    best = None
+    for _ in range(REPEAT):
+        data = copy.deepcopy(schedule)
+        start = time.perf_counter()
+        func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    Client.raspisanie = RASPIANIE
+    baseline, ref = load_baseline(sys.argv[1] if len(sys.argv) > 1 else None)
+    legacy_split = baseline.Client.split_merge_display
+    print(f"旧实现: {ref}:zfn_api.py")
+    print(f"{'条数':>6} {'旧实现(ms)':>12} {'分组实现(ms)':>14} {'加速比':>8} {'输出一致':>8} {'行为差异条数':>12}")
+    for size in SIZES:
+        # 内容相同的重复时段：两种实现都会拆分，输出必须一致
+        identical = make_schedule(size, True)
+        expected = without_masks(legacy_split(copy.deepcopy(identical)))
+        actual = without_masks(Client.split_merge_display(copy.deepcopy(identical)))
+        assert actual == expected, f"{size} 条课表输出与旧实现不一致"
+
+        # 两个时段教室不同：旧实现不拆分，当前实现拆分
+        schedule = make_schedule(size, False)
+        legacy_out = without_masks(legacy_split(copy.deepcopy(schedule)))
+        current_out = without_masks(Client.split_merge_display(copy.deepcopy(schedule)))
+        changed = sum(1 for a, b in zip(legacy_out, current_out) if a != b)
+
+        legacy = bench(legacy_split, schedule)
+        current = bench(Client.split_merge_display, schedule)
+        print(f"{size:>6} {legacy * 1000:>12.3f} {current * 1000:>14.3f} {legacy / current:>8.1f}x "
+              f"{'是':>8} {changed:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+from cache_backend import create_backend
+from singleflight import SingleFlight
+
+# 导入共享传输层（用于把 base_url 归一化为学校主机）
+try:
+    from transport import transport_manager
+except ImportError:
+    transport_manager = None
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+def school_key(base_url: Optional[str]) -> str:
+    """缓存键中的学校部分：同一教务系统主机的不同写法归为同一学校"""
+    key = transport_manager.host_key(base_url) if transport_manager else None
+    return key or (base_url or "").rstrip("/").lower()
+
+
+async def run_backend(backend, func, *args):
+    """在异步接口中调用缓存读写：存储涉及文件 I/O（SQLite）时放到线程池执行，避免阻塞事件循环"""
+    if getattr(backend, "blocking", False):
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+
+def is_cacheable(result) -> bool:
+    """只缓存成功结果；会话失效、超时等错误与具体用户有关，不能共享"""
+    return isinstance(result, dict) and result.get("code") == 1000
+
+
+class SharedCache:
+    """
+    跨用户共享的学校公共数据缓存（校区、教学楼、节次等同一学校同一学期对所有学生相同的数据）
+    - 按命名空间设置 TTL，超出条目上限时淘汰最久未使用的条目
+    - 同键并发未命中时只有一个请求访问教务系统，其余请求等待并复用其结果
+    - 数据保存在可替换的存储中（进程内或 SQLite 文件，见 cache_backend）
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, max_entries: Optional[int] = None, backend=None):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = _env_int("ZFJW_REFERENCE_CACHE_TTL", 21600)
+        self.max_entries = max_entries or _env_int("ZFJW_REFERENCE_CACHE_MAX", 1024)
+        self.backend = backend or create_backend("reference_cache", max_entries=self.max_entries)
+        self.flights = SingleFlight()
+        self._stats = {"hits": 0, "misses": 0, "loads": 0}
+
+    def ttl_for(self, namespace: str) -> int:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def get(self, namespace: str, key: tuple):
+        """读取未过期的缓存结果，不存在时返回 None"""
+        item = self.backend.get((namespace,) + tuple(key))
+        return item[0] if item is not None else None
+
+    def set(self, namespace: str, key: tuple, result, ttl: Optional[int] = None):
+        now = time.time()
+        ttl = self.ttl_for(namespace) if ttl is None else ttl
+        self.backend.set((namespace,) + tuple(key), result, estimate_size(result), now, now + ttl)
+
+    def _lookup(self, full_key: tuple):
+        """命中时返回结果并计数"""
+        item = self.backend.get(full_key)
+        if item is None:
+            return None
+        self._stats["hits"] += 1
+        return item[0]
+
+    def get_or_load(self, namespace: str, key: tuple, loader: Callable[[], Dict], ttl: Optional[int] = None):
+        """
+        读取缓存，未命中时调用 loader 从教务系统加载（同键并发只加载一次）
+        loader 返回非成功结果时不写入缓存，等待中的请求改用自己的会话重新加载
+        """
+        full_key = (namespace,) + tuple(key)
+        cached = self._lookup(full_key)
+        if cached is not None:
+            return cached
+        self._stats["misses"] += 1
+        result, loaded = self.flights.do(full_key, loader, share=is_cacheable)
+        if loaded:
+            self._stats["loads"] += 1
+            if is_cacheable(result):
+                self.set(namespace, key, result, ttl)
+        return result
+
+    async def aget_or_load(self, namespace: str, key: tuple, loader, ttl: Optional[int] = None):
+        """get_or_load 的异步版本，loader 为返回可等待对象的函数（如 AsyncClient 的接口方法）"""
+        full_key = (namespace,) + tuple(key)
+        cached = await run_backend(self.backend, self._lookup, full_key)
+        if cached is not None:
+            return cached
+        self._stats["misses"] += 1
+        result, loaded = await self.flights.ado(full_key, loader, share=is_cacheable)
+        if loaded:
+            self._stats["loads"] += 1
+            if is_cacheable(result):
+                await run_backend(self.backend, self.set, namespace, key, result, ttl)
+        return result
+
+    def purge(self, namespace: Optional[str] = None, school: Optional[str] = None) -> int:
+        """
+        清除缓存条目
+        参数:
+            namespace: 只清除该命名空间（如 campus_list），为空时清除全部命名空间
+            school: 只清除该学校（school_key 的结果），为空时清除全部学校
+        返回:
+            int: 清除的条目数
+        """
+        purged = self.backend.purge(namespace, school)
+        if purged:
+            print(f"清除公共数据缓存 {purged} 条（命名空间: {namespace or '全部'}，学校: {school or '全部'}）")
+        return purged
+
+    def get_stats(self) -> Dict:
+        return dict(
+            self.backend.get_stats(),
+            **self._stats,
+            coalesced=self.flights.get_stats()["coalesced"],
+            ttls=dict(self.ttls, default=self.default_ttl),
+        )
+
+
+# 全局公共数据缓存实例：校区列表很少变化；教学楼与节次（jcList）按学期缓存；
+# 板块课列表含已选人数，选课期间变化快，只短时间缓存以合并同一时刻的大量相同查询
+reference_cache = SharedCache(ttls={
+    "campus_list": _env_int("ZFJW_CACHE_TTL_CAMPUS_LIST", 86400),
+    "building_list": _env_int("ZFJW_CACHE_TTL_BUILDING_LIST", 21600),
+    "block_courses": _env_int("ZFJW_CACHE_TTL_BLOCK_COURSES", 30),
+})
+
+
+def estimate_size(result) -> int:
+    """估算结果占用的字节数（按 JSON 序列化长度计）"""
+    try:
+        return len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(result).encode("utf-8"))
+
+
+# 视为教务系统不可用的结果码：此时对开启过期可用的接口继续返回最近一次成功结果
+UPSTREAM_DOWN_CODES = (1003, 2333)
+
+
+class ResponseCache:
+    """
+    按用户缓存查询结果（成绩、课表、考试、个人信息）
+    - 键为 (接口, 用户, 参数)，每个接口单独配置 TTL
+    - 按结果的序列化大小计算总字节数，超出上限时淘汰最久未使用的条目
+    - 数据保存在可替换的存储中（进程内或 SQLite 文件，见 cache_backend）
+    - 返回结果附带 cache 字段：{"hit": 是否命中, "age": 缓存年龄秒数}
+    - 配置了 stale_ttls 的接口使用 stale-while-revalidate：超过 TTL 但未超过过期可用时长的结果立即返回
+      （cache.stale 为 true），同时在后台通过用户会话刷新；教务系统不可用时继续返回最近一次成功结果
+    - 同一用户同时发出的相同请求（接口与参数相同）合并为一次上游调用，共享解析后的结果（即使该接口未开启缓存）
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, max_bytes: Optional[int] = None, stale_ttls: Optional[Dict[str, int]] = None, backend=None):
+        self.ttls = dict(ttls or {})
+        self.stale_ttls = dict(stale_ttls or {})
+        self.max_bytes = max_bytes or _env_int("ZFJW_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        self.backend = backend or create_backend("response_cache", max_bytes=self.max_bytes)
+        self._refreshing = set()  # 正在后台刷新的键
+        self._refresh_errors: Dict[tuple, str] = {}  # 键 -> 最近一次后台刷新失败原因
+        self._tasks = set()  # 异步后台刷新任务（保持引用直到完成）
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypass": 0, "stale": 0, "revalidations": 0, "fallbacks": 0}
+
+    def enabled(self, endpoint: str) -> bool:
+        return self.ttls.get(endpoint, 0) > 0
+
+    def is_swr(self, endpoint: str) -> bool:
+        return self.stale_ttls.get(endpoint, 0) > 0
+
+    def max_age(self, endpoint: str) -> int:
+        """条目保留时长：开启过期可用的接口保留到过期可用时长，否则到 TTL"""
+        return max(self.ttls.get(endpoint, 0), self.stale_ttls.get(endpoint, 0))
+
+    def get(self, endpoint: str, user: str, params: tuple, max_age: Optional[float] = None):
+        """读取缓存，返回 (结果, 年龄秒数)；不存在或超过 max_age（默认为 TTL）时返回 None"""
+        max_age = self.ttls.get(endpoint, 0) if max_age is None else max_age
+        item = self.backend.get((endpoint, user) + tuple(params))
+        if item is None:
+            return None
+        age = time.time() - item[1]
+        if age >= max_age:
+            return None
+        return item[0], age
+
+    def set(self, endpoint: str, user: str, params: tuple, result):
+        if not self.enabled(endpoint) or not is_cacheable(result):
+            return
+        key = (endpoint, user) + tuple(params)
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        # 条目保留到过期可用时长结束（未开启时即 TTL），由存储负责过期删除
+        self.backend.set(key, result, size, now, now + self.max_age(endpoint))
+        with self._lock:
+            self._refresh_errors.pop(key, None)
+
+    @staticmethod
+    def annotate(result, hit: bool, age: float = 0, stale: Optional[bool] = None, error: Optional[str] = None):
+        """附加缓存元数据（返回新字典，不修改缓存中的结果）"""
+        if not isinstance(result, dict):
+            return result
+        meta = {"hit": hit, "age": round(age, 1)}
+        if stale is not None:
+            meta["stale"] = stale
+        if error:
+            meta["upstream_error"] = error
+        return dict(result, cache=meta)
+
+    def _lookup(self, endpoint: str, user: Optional[str], params: tuple, force_refresh: bool):
+        """
+        查找缓存
+        返回:
+            tuple: (带元数据的结果, 是否需要后台刷新)；未命中时结果为 None
+        """
+        if not user or not self.enabled(endpoint):
+            return None, False
+        if force_refresh:
+            self._stats["bypass"] += 1
+            return None, False
+        swr = self.is_swr(endpoint)
+        found = self.get(endpoint, user, params, self.max_age(endpoint))
+        if found is None:
+            self._stats["misses"] += 1
+            return None, False
+        result, age = found
+        if age < self.ttls.get(endpoint, 0):
+            self._stats["hits"] += 1
+            return self.annotate(result, True, age, False if swr else None), False
+        # 超过 TTL 但仍在过期可用时长内（仅开启 stale-while-revalidate 的接口会走到这里）
+        self._stats["stale"] += 1
+        key = (endpoint, user) + tuple(params)
+        error = self._refresh_errors.get(key)
+        return self.annotate(result, True, age, True, error), True
+
+    def _store(self, endpoint: str, user: Optional[str], params: tuple, result, loaded: bool = True):
+        """
+        保存加载结果；开启过期可用的接口在教务系统不可用时改为返回最近一次成功结果
+        loaded 为 False 表示结果来自合并的并发请求（已由执行调用的请求保存）
+        """
+        if not user:
+            return self.annotate(result, False)
+        swr = self.is_swr(endpoint)
+        if is_cacheable(result):
+            if loaded:
+                self.set(endpoint, user, params, result)
+            return self.annotate(result, False, 0, False if swr else None)
+        if swr and isinstance(result, dict) and result.get("code") in UPSTREAM_DOWN_CODES:
+            found = self.get(endpoint, user, params, self.max_age(endpoint))
+            if found is not None:
+                self._stats["fallbacks"] += 1
+                print(f"教务系统不可用（{result.get('code')}），返回缓存结果: {endpoint}，缓存年龄 {found[1]:.0f} 秒")
+                return self.annotate(found[0], True, found[1], True, result.get("msg"))
+        return self.annotate(result, False, 0, False if swr else None)
+
+    def _begin_refresh(self, key: tuple) -> bool:
+        """标记键正在后台刷新，已有刷新在进行时返回 False"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self._stats["revalidations"] += 1
+            return True
+
+    def _finish_refresh(self, endpoint: str, user: str, params: tuple, result):
+        key = (endpoint, user) + tuple(params)
+        if is_cacheable(result):
+            self.set(endpoint, user, params, result)
+        else:
+            msg = result.get("msg") if isinstance(result, dict) else str(result)
+            print(f"后台刷新失败，继续使用缓存结果: {endpoint}，{msg}")
+            with self._lock:
+                self._refresh_errors[key] = msg
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _revalidate(self, endpoint: str, user: str, params: tuple, loader: Callable[[], Dict]):
+        """在后台线程中通过用户会话刷新缓存"""
+        if not self._begin_refresh((endpoint, user) + tuple(params)):
+            return
+
+        def run():
+            try:
+                result = loader()
+            except Exception as e:
+                traceback.print_exc()
+                result = {"code": 999, "msg": str(e)}
+            self._finish_refresh(endpoint, user, params, result)
+
+        threading.Thread(target=run, name=f"cache-revalidate-{endpoint}", daemon=True).start()
+
+    def _arevalidate(self, endpoint: str, user: str, params: tuple, loader):
+        """在当前事件循环中创建后台刷新任务"""
+        if not self._begin_refresh((endpoint, user) + tuple(params)):
+            return
+
+        async def run():
+            try:
+                result = await loader()
+            except Exception as e:
+                traceback.print_exc()
+                result = {"code": 999, "msg": str(e)}
+            await run_backend(self.backend, self._finish_refresh, endpoint, user, params, result)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def fetch(self, endpoint: str, user: Optional[str], params: tuple, loader: Callable[[], Dict], force_refresh: bool = False):
+        """
+        读取缓存，未命中（或 force_refresh）时调用 loader 访问教务系统并写入缓存
+        user 为空（无法识别用户）时不使用缓存
+        """
+        cached, refresh = self._lookup(endpoint, user, params, force_refresh)
+        if cached is not None:
+            if refresh:
+                self._revalidate(endpoint, user, params, loader)
+            return cached
+        if not user:
+            return self.annotate(loader(), False)
+        result, loaded = self.flights.do((endpoint, user) + tuple(params), loader)
+        return self._store(endpoint, user, params, result, loaded)
+
+    async def afetch(self, endpoint: str, user: Optional[str], params: tuple, loader, force_refresh: bool = False):
+        """fetch 的异步版本，loader 为返回可等待对象的函数；缓存读写涉及文件 I/O 时在线程池中执行"""
+        cached, refresh = await run_backend(self.backend, self._lookup, endpoint, user, params, force_refresh)
+        if cached is not None:
+            if refresh:
+                self._arevalidate(endpoint, user, params, loader)
+            return cached
+        if not user:
+            return self.annotate(await loader(), False)
+        result, loaded = await self.flights.ado((endpoint, user) + tuple(params), loader)
+        return await run_backend(self.backend, self._store, endpoint, user, params, result, loaded)
+
+    def purge_user(self, user: Optional[str]) -> int:
+        """清除某个用户的全部缓存（退出登录时调用）"""
+        if not user:
+            return 0
+        with self._lock:
+            for key in [key for key in self._refresh_errors if key[1] == user]:
+                del self._refresh_errors[key]
+        return self.backend.purge(owner=user)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            refreshing = len(self._refreshing)
+        return dict(
+            self.backend.get_stats(),
+            **self._stats,
+            refreshing=refreshing,
+            coalesced=self.flights.get_stats()["coalesced"],
+            ttls=dict(self.ttls),
+            stale_ttls=dict(self.stale_ttls),
+        )
+
+
+# 全局用户查询结果缓存实例：个人信息很少变化；成绩在出分期间变化频繁，TTL 较短（设为 0 可关闭某个接口的缓存）
+# 已关闭学期（早于上一学期）的成绩不再变化，历年成绩查询对其使用 grade_closed 长期缓存
+# 课表与考试安排在学期内很少变化，超过 TTL 后仍先返回旧结果并在后台刷新
+response_cache = ResponseCache(
+    ttls={
+        "info": _env_int("ZFJW_CACHE_TTL_INFO", 86400),
+        "grade": _env_int("ZFJW_CACHE_TTL_GRADE", 300),
+        "grade_closed": _env_int("ZFJW_CACHE_TTL_GRADE_CLOSED", 30 * 86400),
+        "schedule": _env_int("ZFJW_CACHE_TTL_SCHEDULE", 3600),
+        "exam": _env_int("ZFJW_CACHE_TTL_EXAM", 1800),
+    },
+    stale_ttls={
+        "schedule": _env_int("ZFJW_CACHE_STALE_TTL_SCHEDULE", 30 * 86400),
+        "exam": _env_int("ZFJW_CACHE_STALE_TTL_EXAM", 7 * 86400),
+    },
+)
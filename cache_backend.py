@@ -0,0 +1,299 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+# 缓存键统一为 (命名空间, 所属者, *参数)：命名空间为接口名，所属者为学校或用户
+
+
+class MemoryBackend:
+    """进程内缓存存储：OrderedDict 维护最近使用顺序，按总字节数（及可选的条目数）淘汰"""
+
+    name = "memory"
+    # 读写不涉及 I/O，异步接口可直接在事件循环中调用
+    blocking = False
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # 键 -> (值, 字节数, 写入时间, 过期时间)
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key: tuple):
+        """删除条目（调用方需持有锁）"""
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+    def get(self, key: tuple):
+        """返回 (值, 写入时间)，不存在或已过期时返回 None"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[3] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[0], item[2]
+
+    def set(self, key: tuple, value, size: int, stored_at: float, expires_at: float):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, stored_at, expires_at)
+            self._bytes += size
+            while self._entries and (
+                (self.max_bytes and self._bytes > self.max_bytes)
+                or (self.max_entries and len(self._entries) > self.max_entries)
+            ):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def delete(self, key: tuple):
+        with self._lock:
+            self._remove(key)
+
+    def purge(self, namespace: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """删除匹配命名空间/所属者的条目，参数为空表示不限"""
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (namespace is None or key[0] == namespace) and (owner is None or key[1] == owner)
+            ]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def get_stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            namespaces: Dict[str, int] = {}
+            for key, item in self._entries.items():
+                if item[3] > now:
+                    namespaces[key[0]] = namespaces.get(key[0], 0) + 1
+            return {
+                "backend": self.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "namespaces": namespaces,
+            }
+
+
+class SQLiteBackend:
+    """
+    SQLite 文件缓存存储（WAL 模式）：进程重启后保留，同一节点的多个工作进程共享
+    - 值以 JSON 序列化后 zlib 压缩保存
+    - 超出总字节数（或条目数）上限时按最近访问时间淘汰
+    - 后台线程定期清理过期条目、执行淘汰并回收文件空间
+    """
+
+    name = "sqlite"
+    # 读写涉及文件 I/O，异步接口需在线程池中调用
+    blocking = True
+    # 读取时访问时间的刷新间隔（秒），避免每次读取都写库
+    TOUCH_INTERVAL = 60
+    # 每写入多少次检查一次容量
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, table: str, max_bytes: Optional[int] = None, max_entries: Optional[int] = None, vacuum_interval: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.vacuum_interval = vacuum_interval or _env_int("ZFJW_CACHE_VACUUM_INTERVAL", 600)
+        self._local = threading.local()
+        self._writes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "namespace TEXT NOT NULL, owner TEXT NOT NULL, params TEXT NOT NULL, "
+            "value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "stored_at REAL NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, owner, params))"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires_at)")
+        conn.commit()
+
+        thread = threading.Thread(target=self._maintain, name=f"cache-vacuum-{table}", daemon=True)
+        thread.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # 新建文件时启用增量回收（需在建表前设置）
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _split(key: tuple):
+        return str(key[0]), str(key[1]), json.dumps(list(key[2:]), ensure_ascii=False, default=str)
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    @staticmethod
+    def decode(blob: bytes):
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def get(self, key: tuple):
+        """返回 (值, 写入时间)，不存在或已过期时返回 None"""
+        namespace, owner, params = self._split(key)
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            f"SELECT value, stored_at, expires_at, accessed_at FROM {self.table} WHERE namespace=? AND owner=? AND params=?",
+            (namespace, owner, params),
+        ).fetchone()
+        if row is None:
+            return None
+        if row[2] <= now:
+            self.delete(key)
+            return None
+        if now - row[3] >= self.TOUCH_INTERVAL:
+            conn.execute(
+                f"UPDATE {self.table} SET accessed_at=? WHERE namespace=? AND owner=? AND params=?",
+                (now, namespace, owner, params),
+            )
+        try:
+            return self.decode(row[0]), row[1]
+        except (zlib.error, ValueError):
+            self.delete(key)
+            return None
+
+    def set(self, key: tuple, value, size: int, stored_at: float, expires_at: float):
+        namespace, owner, params = self._split(key)
+        blob = self.encode(value)
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} "
+            "(namespace, owner, params, value, size, stored_at, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (namespace, owner, params, blob, len(blob), stored_at, expires_at, stored_at),
+        )
+        with self._lock:
+            self._writes += 1
+            check = self._writes % self.EVICT_EVERY == 0
+        if check:
+            self.evict()
+
+    def delete(self, key: tuple):
+        namespace, owner, params = self._split(key)
+        self._conn().execute(
+            f"DELETE FROM {self.table} WHERE namespace=? AND owner=? AND params=?",
+            (namespace, owner, params),
+        )
+
+    def purge(self, namespace: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """删除匹配命名空间/所属者的条目，参数为空表示不限"""
+        cursor = self._conn().execute(
+            f"DELETE FROM {self.table} WHERE (? IS NULL OR namespace=?) AND (? IS NULL OR owner=?)",
+            (namespace, namespace, owner, owner),
+        )
+        return cursor.rowcount
+
+    def evict(self) -> int:
+        """删除过期条目，并按最近访问时间淘汰超出容量的条目"""
+        conn = self._conn()
+        removed = conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)).rowcount
+        entries, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        evicted = 0
+        if (self.max_bytes and total > self.max_bytes) or (self.max_entries and entries > self.max_entries):
+            # 先累计出需要保留的最近访问条目，再一次删除其余条目
+            rows = conn.execute(f"SELECT accessed_at, size FROM {self.table} ORDER BY accessed_at DESC").fetchall()
+            kept_bytes = 0
+            cutoff = None
+            for count, (accessed_at, size) in enumerate(rows, 1):
+                kept_bytes += size
+                if (self.max_bytes and kept_bytes > self.max_bytes) or (self.max_entries and count > self.max_entries):
+                    cutoff = accessed_at
+                    break
+            if cutoff is not None:
+                evicted = conn.execute(f"DELETE FROM {self.table} WHERE accessed_at <= ?", (cutoff,)).rowcount
+                with self._lock:
+                    self._evictions += evicted
+        return removed + evicted
+
+    def vacuum(self):
+        """清理并回收文件空间（增量回收 + WAL 检查点）"""
+        removed = self.evict()
+        conn = self._conn()
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if removed:
+            print(f"缓存清理完成: {self.table}，删除 {removed} 条")
+
+    def _maintain(self):
+        while True:
+            time.sleep(self.vacuum_interval)
+            try:
+                self.vacuum()
+            except sqlite3.Error as e:
+                print(f"缓存清理失败: {self.table}，{e}")
+
+    def get_stats(self) -> Dict:
+        conn = self._conn()
+        entries, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        rows = conn.execute(
+            f"SELECT namespace, COUNT(*) FROM {self.table} WHERE expires_at > ? GROUP BY namespace", (time.time(),)
+        ).fetchall()
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_entries": self.max_entries,
+            "evictions": self._evictions,
+            "namespaces": dict(rows),
+        }
+
+
+def create_backend(table: str, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+    """
+    按环境变量 ZFJW_CACHE_BACKEND 创建缓存存储
+    - memory（默认）: 进程内存储
+    - sqlite: SQLite 文件存储，路径由 ZFJW_CACHE_PATH 指定（默认 logs/cache.sqlite3，与日志目录共用数据卷）
+    SQLite 打开失败时退回进程内存储
+    """
+    backend = (os.environ.get("ZFJW_CACHE_BACKEND") or "memory").lower()
+    if backend == "sqlite":
+        path = os.environ.get("ZFJW_CACHE_PATH") or os.path.join("logs", "cache.sqlite3")
+        try:
+            return SQLiteBackend(path, table, max_bytes=max_bytes, max_entries=max_entries)
+        except (sqlite3.Error, OSError) as e:
+            print(f"SQLite 缓存初始化失败（{path}）: {e}，改用进程内缓存")
+    elif backend != "memory":
+        print(f"未知的缓存存储类型: {backend}，使用进程内缓存")
+    return MemoryBackend(max_bytes=max_bytes, max_entries=max_entries)
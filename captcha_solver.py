@@ -0,0 +1,379 @@
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from operator import mul
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageFilter
+
+# 字符归一化尺寸（按长边等比缩放后居中放入正方形）
+GLYPH_SIZE = 20
+# 连通区域面积小于此值（像素）视为噪点
+MIN_SPECK_AREA = 12
+# 宽度小于此值（像素）的列投影片段视为噪声
+MIN_SEGMENT_WIDTH = 2
+# 训练时每个字符最多保留的原型数，与已有原型相关系数高于 PROTOTYPE_MERGE 时合并
+MAX_PROTOTYPES = 8
+PROTOTYPE_MERGE = 0.9
+# 匹配时先与各字符的平均模板比较，只对最接近的几个字符比较全部原型
+MATCH_CANDIDATES = 3
+TEMPLATE_VERSION = 1
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取数值环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """大津法求灰度图的二值化阈值（类间方差最大）"""
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_back = 0
+    weight_back = 0
+    best = -1.0
+    threshold = 127
+    for i in range(256):
+        weight_back += histogram[i]
+        if weight_back == 0:
+            continue
+        weight_fore = total - weight_back
+        if weight_fore == 0:
+            break
+        sum_back += i * histogram[i]
+        mean_back = sum_back / weight_back
+        mean_fore = (sum_all - sum_back) / weight_fore
+        between = weight_back * weight_fore * (mean_back - mean_fore) ** 2
+        if between > best:
+            best = between
+            threshold = i
+    return threshold
+
+
+def _remove_specks(pixels: bytearray, width: int, height: int, min_area: int):
+    """删除面积过小的连通区域（4 邻接），去掉干扰点与中值滤波后残留的干扰线片段"""
+    size = width * height
+    seen = bytearray(size)
+    for start in range(size):
+        if not pixels[start] or seen[start]:
+            continue
+        seen[start] = 1
+        stack = [start]
+        component = []
+        while stack:
+            p = stack.pop()
+            component.append(p)
+            x = p % width
+            for q in (p - width, p + width, p - 1 if x > 0 else -1, p + 1 if x < width - 1 else -1):
+                if 0 <= q < size and pixels[q] and not seen[q]:
+                    seen[q] = 1
+                    stack.append(q)
+        if len(component) < min_area:
+            for p in component:
+                pixels[p] = 0
+
+
+def binarize(image: Image.Image) -> Image.Image:
+    """灰度化、大津法二值化（字符为 255）、中值滤波去除细干扰线，再删除小连通区域"""
+    gray = image.convert("L")
+    threshold = otsu_threshold(gray.histogram())
+    mask = gray.point(lambda p: 255 if p <= threshold else 0).filter(ImageFilter.MedianFilter(3))
+    pixels = bytearray(mask.tobytes())
+    _remove_specks(pixels, mask.width, mask.height, MIN_SPECK_AREA)
+    return Image.frombytes("L", mask.size, bytes(pixels))
+
+
+def segment(mask: Image.Image, length: int) -> List[Tuple[int, int]]:
+    """
+    按列投影切分字符，返回 [(起始列, 结束列), ...]
+    片段数多于字符数时合并相邻最窄的两段，少于字符数时在最宽片段中部的投影最低处拆分
+    """
+    width = mask.width
+    data = mask.tobytes()
+    counts = [sum(data[x::width]) // 255 for x in range(width)]
+    runs = []
+    start = None
+    for x, count in enumerate(counts + [0]):
+        if count and start is None:
+            start = x
+        elif not count and start is not None:
+            if x - start >= MIN_SEGMENT_WIDTH:
+                runs.append([start, x])
+            start = None
+    if not runs:
+        return []
+
+    while len(runs) > length:
+        index = min(range(len(runs) - 1), key=lambda i: runs[i + 1][1] - runs[i][0])
+        runs[index:index + 2] = [[runs[index][0], runs[index + 1][1]]]
+    char_width = sum(right - left for left, right in runs) / length
+    while len(runs) < length:
+        index = max(range(len(runs)), key=lambda i: runs[i][1] - runs[i][0])
+        left, right = runs[index]
+        if right - left < MIN_SEGMENT_WIDTH * 2:
+            break
+        # 按平均字符宽度估计片段中的字符数，只在靠近第一个理论切分点的范围内寻找投影最低的列
+        parts = min(length - len(runs) + 1, max(2, round((right - left) / char_width)))
+        center = left + (right - left) // parts
+        margin = max(1, (right - left) // (parts * 3))
+        cut = min(range(center - margin, center + margin + 1), key=lambda x: (counts[x], abs(x - center)))
+        runs[index:index + 1] = [[left, cut], [cut, right]]
+    return [tuple(run) for run in runs]
+
+
+def _normalize(vector: List[float]) -> Optional[List[float]]:
+    """去均值并归一化为单位向量（点积即相关系数）"""
+    mean = sum(vector) / len(vector)
+    centered = [value - mean for value in vector]
+    norm = math.sqrt(sum(value * value for value in centered))
+    if not norm:
+        return None
+    return [value / norm for value in centered]
+
+
+def glyph_vector(mask: Image.Image, span: Tuple[int, int]) -> Optional[List[float]]:
+    """截取单个字符，按长边等比缩放居中放入正方形，得到归一化特征向量"""
+    crop = mask.crop((span[0], 0, span[1], mask.height))
+    bbox = crop.getbbox()
+    if not bbox:
+        return None
+    crop = crop.crop(bbox)
+    side = max(crop.size)
+    canvas = Image.new("L", (side, side), 0)
+    canvas.paste(crop, ((side - crop.width) // 2, (side - crop.height) // 2))
+    glyph = canvas.resize((GLYPH_SIZE, GLYPH_SIZE), Image.BILINEAR)
+    return _normalize(list(glyph.tobytes()))
+
+
+def extract_glyphs(image_bytes: bytes, length: int) -> List[Optional[List[float]]]:
+    """解码验证码图片、二值化并切分，返回每个字符的特征向量"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        mask = binarize(image)
+    return [glyph_vector(mask, span) for span in segment(mask, length)]
+
+
+class CaptchaTemplates:
+    """单个学校的字符模板：每个字符若干原型向量，以及验证码长度"""
+
+    def __init__(self, chars: Dict[str, List[List[float]]], length: int):
+        self.chars = chars
+        self.length = length
+        self._centroids = []
+        for char, prototypes in chars.items():
+            centroid = _normalize([sum(values) for values in zip(*prototypes)]) if prototypes else None
+            if centroid:
+                self._centroids.append((char, centroid))
+
+    def match(self, vector: List[float]) -> Tuple[str, float]:
+        """返回相关系数最高的字符及相关系数"""
+        candidates = sorted(
+            self._centroids, key=lambda item: sum(map(mul, vector, item[1])), reverse=True
+        )[:MATCH_CANDIDATES]
+        best_char = ""
+        best_score = -1.0
+        for char, _ in candidates:
+            for prototype in self.chars[char]:
+                score = sum(map(mul, vector, prototype))
+                if score > best_score:
+                    best_char = char
+                    best_score = score
+        return best_char, best_score
+
+    def recognize(self, image_bytes: bytes) -> Tuple[str, float]:
+        """
+        识别验证码
+        返回:
+            tuple: (识别结果, 置信度)，置信度为各字符相关系数的最小值，切分失败时为 0
+        """
+        glyphs = extract_glyphs(image_bytes, self.length)
+        if len(glyphs) != self.length or any(vector is None for vector in glyphs):
+            return "", 0.0
+        text = []
+        confidence = 1.0
+        for vector in glyphs:
+            char, score = self.match(vector)
+            text.append(char)
+            confidence = min(confidence, score)
+        return "".join(text), max(0.0, confidence)
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[bytes, str]]) -> "CaptchaTemplates":
+        """
+        从已标注的验证码图片训练模板
+        参数:
+            samples: [(图片字节, 正确文本), ...]
+        """
+        sums: Dict[str, List[List[float]]] = {}
+        lengths = Counter()
+        for image_bytes, label in samples:
+            lengths[len(label)] += 1
+            glyphs = extract_glyphs(image_bytes, len(label))
+            if len(glyphs) != len(label):
+                continue
+            for char, vector in zip(label, glyphs):
+                if vector is None:
+                    continue
+                prototypes = sums.setdefault(char, [])
+                # 与最相近的原型合并（累加后重新归一化），差异较大时作为新原型
+                best = None
+                best_score = -1.0
+                for prototype in prototypes:
+                    normalized = _normalize(prototype)
+                    score = sum(map(mul, vector, normalized)) if normalized else -1.0
+                    if score > best_score:
+                        best = prototype
+                        best_score = score
+                if best is not None and (best_score >= PROTOTYPE_MERGE or len(prototypes) >= MAX_PROTOTYPES):
+                    for i, value in enumerate(vector):
+                        best[i] += value
+                else:
+                    prototypes.append(list(vector))
+        chars = {
+            char: [vector for vector in map(_normalize, prototypes) if vector]
+            for char, prototypes in sums.items()
+        }
+        length = lengths.most_common(1)[0][0] if lengths else 4
+        return cls(chars, length)
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": TEMPLATE_VERSION,
+            "glyph_size": GLYPH_SIZE,
+            "length": self.length,
+            "chars": {char: [[round(value, 4) for value in vector] for vector in prototypes]
+                      for char, prototypes in self.chars.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CaptchaTemplates":
+        if data.get("version") != TEMPLATE_VERSION or data.get("glyph_size") != GLYPH_SIZE:
+            raise ValueError("验证码模板版本不匹配，请重新训练")
+        return cls(data["chars"], int(data["length"]))
+
+
+class CaptchaSolver:
+    """
+    离线验证码识别：按学校加载字符模板（captcha_templates/<school_code>.json，缺省使用 default.json），
+    置信度低于阈值或没有模板时返回 None，由用户手动输入
+    """
+
+    def __init__(self, template_dir: Optional[str] = None, min_confidence: Optional[float] = None):
+        self.template_dir = template_dir or os.environ.get("ZFJW_CAPTCHA_TEMPLATES") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "captcha_templates")
+        self.min_confidence = (
+            min_confidence if min_confidence is not None else _env_float("ZFJW_CAPTCHA_MIN_CONFIDENCE", 0.7)
+        )
+        self._templates: Dict[Optional[str], Optional[CaptchaTemplates]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"solved": 0, "rejected": 0, "no_templates": 0, "accepted": 0, "wrong": 0}
+
+    def _load(self, name: str) -> Optional[CaptchaTemplates]:
+        path = os.path.join(self.template_dir, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                templates = CaptchaTemplates.from_dict(json.load(f))
+            print(f"加载验证码模板: {path}，字符数: {len(templates.chars)}")
+            return templates
+        except Exception as e:
+            print(f"加载验证码模板失败: {path}，{e}")
+            return None
+
+    def templates(self, school: Optional[str] = None) -> Optional[CaptchaTemplates]:
+        """获取学校的字符模板（结果缓存，包括不存在的情况）"""
+        with self._lock:
+            if school in self._templates:
+                return self._templates[school]
+        templates = (self._load(school) if school else None) or self._load("default")
+        with self._lock:
+            self._templates[school] = templates
+        return templates
+
+    def solve(self, image_bytes: bytes, school: Optional[str] = None) -> Optional[Dict]:
+        """
+        识别验证码
+        返回:
+            dict: {"text", "confidence", "elapsed_ms"}；没有模板、识别失败或置信度不足时返回 None
+        """
+        templates = self.templates(school)
+        if templates is None:
+            self._count("no_templates")
+            return None
+        started = time.perf_counter()
+        try:
+            text, confidence = templates.recognize(image_bytes)
+        except Exception as e:
+            print(f"验证码识别失败: {e}")
+            text, confidence = "", 0.0
+        elapsed = round((time.perf_counter() - started) * 1000, 2)
+        if not text or confidence < self.min_confidence:
+            self._count("rejected")
+            print(f"验证码识别置信度不足: {confidence:.3f}，转为手动输入")
+            return None
+        self._count("solved")
+        return {"text": text, "confidence": round(confidence, 3), "elapsed_ms": elapsed}
+
+    def report(self, accepted: bool):
+        """记录自动识别结果是否被教务系统接受"""
+        self._count("accepted" if accepted else "wrong")
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                min_confidence=self.min_confidence,
+                schools=sorted(str(school) for school, templates in self._templates.items() if templates),
+            )
+
+
+def load_labelled_samples(directory: str) -> List[Tuple[bytes, str]]:
+    """读取标注目录：文件名（不含扩展名，"_" 之后的部分忽略）即验证码文本，如 ab3x.png、ab3x_2.jpg"""
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in (".png", ".jpg", ".jpeg", ".gif", ".bmp"):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            samples.append((f.read(), stem.split("_")[0]))
+    return samples
+
+
+# 全局验证码识别实例
+captcha_solver = CaptchaSolver()
+
+
+if __name__ == "__main__":
+    # 训练: python captcha_solver.py train <school_code|default> <标注图片目录>
+    # 识别: python captcha_solver.py solve <school_code|default> <图片文件>
+    if len(sys.argv) != 4 or sys.argv[1] not in ("train", "solve"):
+        print("用法: python captcha_solver.py train|solve <school_code|default> <目录|图片>")
+        sys.exit(1)
+    command, school, target = sys.argv[1:]
+    if command == "train":
+        samples = load_labelled_samples(target)
+        trained = CaptchaTemplates.train(samples)
+        os.makedirs(captcha_solver.template_dir, exist_ok=True)
+        output = os.path.join(captcha_solver.template_dir, f"{school}.json")
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(trained.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        print(f"训练完成: {len(samples)} 张图片，{len(trained.chars)} 个字符，模板已保存到 {output}")
+    else:
+        with open(target, "rb") as f:
+            print(captcha_solver.solve(f.read(), school))
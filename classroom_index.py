@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from zfn_api import Client
+
+try:
+    from transport import transport_manager
+except ImportError:
+    transport_manager = None
+
+# 每天最多节次数，决定位图中每个（周次, 星期）单元占用的位数
+SLOTS_PER_DAY = 16
+DAYS_PER_WEEK = 7
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取数值环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+def cell_bit(week: int, weekday: int, slot: int) -> int:
+    """（周次, 星期, 节次）在占用位图中对应的位"""
+    return 1 << (((week - 1) * DAYS_PER_WEEK + (weekday - 1)) * SLOTS_PER_DAY + (slot - 1))
+
+
+def cells_mask(weeks: List[int], weekdays: List[int], slots: List[int]) -> int:
+    """查询条件（各周次 × 各星期 × 各节次）对应的位图"""
+    mask = 0
+    for week in weeks:
+        for weekday in weekdays:
+            for slot in slots:
+                mask |= cell_bit(week, weekday, slot)
+    return mask
+
+
+class TermIndex:
+    """
+    单个学校、学年学期、校区的空教室索引
+    每间教室一个整数位图，位为 1 表示该（周次, 星期, 节次）空闲；
+    查询"这些时段全部空闲"只需对每间教室做一次按位与
+    """
+
+    def __init__(self, key: tuple, max_week: int, max_slot: int):
+        self.key = key
+        self.max_week = max_week
+        self.max_slot = max_slot
+        self.rooms: Dict[str, Dict] = {}  # 教室编号 -> 教室信息（与接口返回格式一致）
+        self.free: Dict[str, int] = {}  # 教室编号 -> 空闲位图
+        self.crawled = 0  # 已抓取单元位图
+        self.cell_updated: Dict[tuple, float] = {}  # (周次, 星期, 节次) -> 抓取时间
+        self.created_at = time.time()
+        self.completed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def all_cells(self) -> List[tuple]:
+        return [
+            (week, weekday, slot)
+            for week in range(1, self.max_week + 1)
+            for weekday in range(1, DAYS_PER_WEEK + 1)
+            for slot in range(1, self.max_slot + 1)
+        ]
+
+    def update_cell(self, week: int, weekday: int, slot: int, classrooms: List[Dict]):
+        """写入一个单元的抓取结果（该时段的全部空闲教室）"""
+        bit = cell_bit(week, weekday, slot)
+        free_codes = set()
+        with self._lock:
+            for room in classrooms:
+                code = room.get("code")
+                if not code:
+                    continue
+                free_codes.add(code)
+                self.rooms[code] = room
+                self.free[code] = self.free.get(code, 0) | bit
+            # 本次未出现的教室在该时段被占用
+            for code in self.free:
+                if code not in free_codes:
+                    self.free[code] &= ~bit
+            self.crawled |= bit
+            self.cell_updated[(week, weekday, slot)] = time.time()
+
+    def query(self, weeks: List[int], weekdays: List[int], slots: List[int], building: Optional[str] = None):
+        """
+        查询全部指定时段都空闲的教室
+        返回:
+            tuple: (教室列表, 索引数据年龄秒数)；包含未抓取的时段时返回 None
+        """
+        mask = cells_mask(weeks, weekdays, slots)
+        with self._lock:
+            if not mask or mask & ~self.crawled:
+                return None
+            codes = [code for code, free in self.free.items() if free & mask == mask]
+            oldest = min(
+                self.cell_updated[(week, weekday, slot)]
+                for week in weeks for weekday in weekdays for slot in slots
+            )
+            rooms = [self.rooms[code] for code in codes]
+        if building:
+            rooms = [room for room in rooms if building in (room.get("name") or "")]
+        rooms.sort(key=lambda room: room.get("code") or "")
+        return rooms, time.time() - oldest
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = len(self.all_cells())
+            crawled = bin(self.crawled).count("1")
+            updated = list(self.cell_updated.values())
+            return {
+                "school": self.key[0],
+                "year": self.key[1],
+                "term": self.key[2],
+                "campus_id": self.key[3],
+                "rooms": len(self.rooms),
+                "cells_crawled": crawled,
+                "cells_total": total,
+                "oldest_cell_age": round(time.time() - min(updated), 1) if updated else None,
+                "completed_at": self.completed_at,
+            }
+
+
+class ClassroomIndexManager:
+    """
+    学期空教室索引管理：后台使用一个已登录会话逐个时段抓取空教室，建立索引后循环增量刷新，
+    /api/classroom 的查询在索引覆盖时直接本地计算
+    """
+
+    def __init__(self):
+        self.request_interval = _env_float("ZFJW_CLASSROOM_CRAWL_INTERVAL", 0.2)
+        self.refresh_interval = _env_float("ZFJW_CLASSROOM_REFRESH_INTERVAL", 3600)
+        self._indexes: Dict[tuple, TermIndex] = {}
+        self._crawlers: Dict[tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(base_url: str, year, term, campus_id) -> tuple:
+        school = transport_manager.host_key(base_url) if transport_manager else None
+        return (school or (base_url or "").rstrip("/"), str(year), str(term), str(campus_id or "1"))
+
+    def query(self, base_url, year, term, campus_id, weeks, day_of_weeks, time_slots, building=None) -> Optional[Dict]:
+        """在索引中查询空教室，返回与 Client.get_empty_classroom 一致的结果；索引未覆盖时返回 None"""
+        index = self._indexes.get(self.make_key(base_url, year, term, campus_id))
+        if index is None:
+            return None
+        try:
+            week_list, xqj, slot_list = Client.parse_classroom_query(weeks, day_of_weeks, time_slots)
+            weekdays = [int(day) for day in xqj.split(",") if day]
+            week_list = [int(week) for week in week_list]
+            slot_list = [int(slot) for slot in slot_list]
+        except (TypeError, ValueError):
+            return None
+        if not (week_list and weekdays and slot_list):
+            return None
+        if max(week_list) > index.max_week or max(slot_list) > index.max_slot or min(week_list + weekdays + slot_list) < 1 or max(weekdays) > DAYS_PER_WEEK:
+            return None
+
+        found = index.query(week_list, weekdays, slot_list, building)
+        if found is None:
+            return None
+        classrooms, age = found
+        if not classrooms:
+            return {"code": 1005, "msg": "该时间段无空闲教室", "source": "index", "index_age": round(age, 1)}
+        return {
+            "code": 1000,
+            "msg": "获取空教室信息成功",
+            "data": {
+                "year": year,
+                "term": term,
+                "weeks": week_list,
+                "day_of_weeks": xqj,
+                "time_slots": slot_list,
+                "building": building or "全部",
+                "count": len(classrooms),
+                "classrooms": classrooms,
+            },
+            "source": "index",
+            "index_age": round(age, 1),
+        }
+
+    def start(self, client, base_url, year, term, campus_id="1", max_week=20, max_slot=12, school_name=None) -> Dict:
+        """启动（或返回已在运行的）后台抓取任务"""
+        key = self.make_key(base_url, year, term, campus_id)
+        with self._lock:
+            crawler = self._crawlers.get(key)
+            if crawler and crawler["thread"].is_alive():
+                return self._crawler_status(key)
+            index = self._indexes.get(key)
+            if index is None or index.max_week != max_week or index.max_slot != max_slot:
+                index = TermIndex(key, max_week, max_slot)
+                self._indexes[key] = index
+            stop_event = threading.Event()
+            crawler = {
+                "status": "running",
+                "error": None,
+                "requests": 0,
+                "started_at": time.time(),
+                "stop": stop_event,
+            }
+            thread = threading.Thread(
+                target=self._crawl,
+                args=(crawler, index, client, base_url, year, term, campus_id, school_name),
+                name=f"classroom-index-{key[0]}-{key[1]}-{key[2]}",
+                daemon=True,
+            )
+            crawler["thread"] = thread
+            self._crawlers[key] = crawler
+            thread.start()
+        print(f"启动空教室索引抓取: {key}")
+        return self._crawler_status(key)
+
+    def stop(self, base_url, year, term, campus_id="1") -> bool:
+        key = self.make_key(base_url, year, term, campus_id)
+        crawler = self._crawlers.get(key)
+        if not crawler:
+            return False
+        crawler["stop"].set()
+        return True
+
+    def _crawl(self, crawler, index, client, base_url, year, term, campus_id, school_name):
+        """后台抓取：首轮补全所有时段，之后按时段抓取时间从旧到新循环刷新"""
+        stop_event = crawler["stop"]
+        try:
+            while not stop_event.is_set():
+                cells = sorted(index.all_cells(), key=lambda cell: index.cell_updated.get(cell, 0))
+                for week, weekday, slot in cells:
+                    if stop_event.is_set():
+                        break
+                    result = client.get_empty_classroom(
+                        year, term, [week], str(weekday), [slot],
+                        campus_id=campus_id, school_name=school_name, base_url=base_url,
+                    )
+                    crawler["requests"] += 1
+                    code = result.get("code")
+                    if code == 1000:
+                        index.update_cell(week, weekday, slot, result["data"]["classrooms"])
+                    elif code == 1005:
+                        index.update_cell(week, weekday, slot, [])
+                    elif code == 1006:
+                        crawler["status"] = "session_expired"
+                        crawler["error"] = result.get("msg")
+                        print(f"空教室索引抓取停止，会话已失效: {index.key}")
+                        return
+                    else:
+                        # 单个时段失败不影响其他时段，下一轮优先重试
+                        crawler["error"] = result.get("msg")
+                    stop_event.wait(self.request_interval)
+                else:
+                    if index.completed_at is None:
+                        index.completed_at = time.time()
+                        print(f"空教室索引首轮抓取完成: {index.key}，教室数: {len(index.rooms)}")
+                    crawler["status"] = "idle"
+                    stop_event.wait(self.refresh_interval)
+                    crawler["status"] = "running"
+            crawler["status"] = "stopped"
+        except Exception as e:
+            crawler["status"] = "failed"
+            crawler["error"] = str(e)
+            print(f"空教室索引抓取异常: {index.key}，{e}")
+
+    def _crawler_status(self, key) -> Dict:
+        crawler = self._crawlers.get(key)
+        index = self._indexes.get(key)
+        status = index.get_stats() if index else {"school": key[0], "year": key[1], "term": key[2], "campus_id": key[3]}
+        if crawler:
+            status.update({
+                "crawler_status": crawler["status"],
+                "crawler_error": crawler["error"],
+                "crawler_requests": crawler["requests"],
+                "crawler_started_at": crawler["started_at"],
+            })
+        return status
+
+    def get_stats(self) -> List[Dict]:
+        with self._lock:
+            keys = list(set(self._indexes) | set(self._crawlers))
+        return [self._crawler_status(key) for key in keys]
+
+
+# 全局空教室索引实例
+classroom_index = ClassroomIndexManager()
@@ -0,0 +1,284 @@
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from zfn_api import select_succeeded
+
+# 单个抢课任务最多的目标课程数（每门课程占用一个并发连接）
+MAX_TARGETS = 8
+# 开放时间支持的字符串格式（服务器本地时间）
+OPEN_AT_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M")
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取数值环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+def parse_open_at(value) -> Optional[float]:
+    """解析选课开放时间：Unix 时间戳（秒）或 "YYYY-MM-DD HH:MM[:SS]"（服务器本地时间），无效时返回 None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in OPEN_AT_FORMATS:
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+    return None
+
+
+class CourseRushManager:
+    """
+    抢课任务管理：选课开放前保持并预热会话与连接、提前构建选课表单，
+    到点后并发提交各目标课程，失败时有限次重试，并记录每次提交的耗时
+    """
+
+    def __init__(self):
+        self.warm_lead = _env_float("ZFJW_RUSH_WARM_LEAD", 20)
+        self.keepalive_interval = _env_float("ZFJW_RUSH_KEEPALIVE_INTERVAL", 300)
+        self.attempt_timeout = _env_float("ZFJW_RUSH_TIMEOUT", 5)
+        self.max_ahead = _env_float("ZFJW_RUSH_MAX_AHEAD", 86400)
+        self.retention = _env_float("ZFJW_RUSH_RETENTION", 3600)
+        self.max_jobs = int(_env_float("ZFJW_RUSH_MAX_JOBS", 200))
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        """删除结束超过保留时长的任务（调用方需持有锁）"""
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def start(self, client, owner: str, url_select: str, targets: List[Dict], open_at: float,
+              max_attempts: int = 5, retry_interval: float = 0.3, advance: float = 0.0,
+              school_name: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        创建抢课任务
+        参数:
+            client: 已登录的 Client（任务期间一直使用该会话）
+            owner: 任务所属用户，查询与取消任务时校验
+            url_select: 选课地址（提前解析）
+            targets: [{"course_id", "do_id", "select_data"}, ...]，select_data 为提前构建的选课表单
+            open_at: 选课开放时间（Unix 时间戳）
+            advance: 提前提交的秒数（抵消请求到达教务系统的网络延迟）
+        返回:
+            tuple: (任务状态, error)，error 为错误结果字典
+        """
+        now = time.time()
+        if open_at - now > self.max_ahead:
+            return None, {"code": 400, "msg": f"开放时间过远，最多提前 {int(self.max_ahead)} 秒创建抢课任务"}
+        with self._lock:
+            self._prune(now)
+            running = sum(1 for job in self._jobs.values() if not job["finished_at"])
+            if running >= self.max_jobs:
+                return None, {"code": 429, "msg": "抢课任务过多，请稍后再试"}
+            job_id = secrets.token_urlsafe(12)
+            job = {
+                "id": job_id,
+                "owner": owner,
+                "status": "scheduled",
+                "error": None,
+                "open_at": open_at,
+                "fire_at": open_at - advance,
+                "max_attempts": max_attempts,
+                "retry_interval": retry_interval,
+                "created_at": now,
+                "warmed_at": None,
+                "warm_ms": None,
+                "fired_at": None,
+                "finished_at": None,
+                "targets": [
+                    {"course_id": target["course_id"], "do_id": target["do_id"], "status": "pending", "attempts": []}
+                    for target in targets
+                ],
+                "stop": threading.Event(),
+            }
+            self._jobs[job_id] = job
+        thread = threading.Thread(
+            target=self._run,
+            args=(job, client, url_select, [target["select_data"] for target in targets], school_name, base_url),
+            name=f"course-rush-{job_id}",
+            daemon=True,
+        )
+        thread.start()
+        print(f"创建抢课任务: {job_id}，课程数: {len(targets)}，开放时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(open_at))}")
+        return self._public(job), None
+
+    def status(self, job_id: str, owner: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return None
+        return self._public(job)
+
+    def cancel(self, job_id: str, owner: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return None
+        job["stop"].set()
+        return self._public(job)
+
+    def _run(self, job, client, url_select, select_datas, school_name, base_url):
+        stop_event = job["stop"]
+        try:
+            # 距开放时间较远时定期访问选课首页，确认会话有效并防止教务系统会话超时
+            while not stop_event.is_set() and time.time() < job["fire_at"] - self.warm_lead:
+                result = client.warm_select(1, school_name=school_name, base_url=base_url)
+                if result.get("code") == 1006:
+                    self._finish(job, "session_expired", result.get("msg"))
+                    return
+                remaining = job["fire_at"] - self.warm_lead - time.time()
+                stop_event.wait(max(0.0, min(self.keepalive_interval, remaining)))
+            if stop_event.is_set():
+                self._finish(job, "cancelled")
+                return
+
+            # 开放前预热：为每门目标课程建立一个连接（完成 TLS 握手）
+            job["status"] = "warming"
+            started = time.perf_counter()
+            result = client.warm_select(len(select_datas), school_name=school_name, base_url=base_url)
+            job["warm_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            job["warmed_at"] = time.time()
+            if result.get("code") == 1006:
+                self._finish(job, "session_expired", result.get("msg"))
+                return
+            if result.get("code") != 1000:
+                # 预热失败不影响到点提交，只记录原因
+                job["error"] = result.get("msg")
+
+            job["status"] = "waiting"
+            self._sleep_until(job["fire_at"], stop_event)
+            if stop_event.is_set():
+                self._finish(job, "cancelled")
+                return
+
+            job["status"] = "firing"
+            job["fired_at"] = time.time()
+            with ThreadPoolExecutor(max_workers=len(select_datas)) as pool:
+                list(pool.map(
+                    lambda index: self._fire(job, client, url_select, index, select_datas[index]),
+                    range(len(select_datas)),
+                ))
+
+            statuses = [target["status"] for target in job["targets"]]
+            if all(status == "succeeded" for status in statuses):
+                self._finish(job, "succeeded")
+            elif "succeeded" in statuses:
+                self._finish(job, "partial")
+            elif "session_expired" in statuses:
+                self._finish(job, "session_expired", "未登录或已过期，请重新登录")
+            elif stop_event.is_set():
+                self._finish(job, "cancelled")
+            else:
+                self._finish(job, "failed")
+        except Exception as e:
+            self._finish(job, "failed", str(e))
+            print(f"抢课任务异常: {job['id']}，{e}")
+
+    @staticmethod
+    def _sleep_until(deadline: float, stop_event: threading.Event):
+        """等待到指定时间：先粗粒度等待，最后 50 毫秒以 1 毫秒为间隔，减少唤醒误差"""
+        while not stop_event.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            if remaining > 0.05:
+                stop_event.wait(remaining - 0.05)
+            else:
+                time.sleep(0.001)
+
+    def _fire(self, job, client, url_select, index, select_data):
+        """提交一门目标课程，直到成功、会话失效或达到最大次数"""
+        target = job["targets"][index]
+        target["status"] = "firing"
+        stop_event = job["stop"]
+        for attempt in range(1, job["max_attempts"] + 1):
+            if stop_event.is_set():
+                target["status"] = "cancelled"
+                return
+            sent_at = time.time()
+            started = time.perf_counter()
+            result = client.submit_select(url_select, select_data, timeout=self.attempt_timeout)
+            latency = round((time.perf_counter() - started) * 1000, 1)
+            data = result.get("data") if isinstance(result.get("data"), dict) else {}
+            target["attempts"].append({
+                "attempt": attempt,
+                "sent_at": round(sent_at, 3),
+                "latency_ms": latency,
+                "code": result.get("code"),
+                "flag": data.get("flag"),
+                "msg": data.get("msg") or result.get("msg"),
+            })
+            if select_succeeded(result):
+                target["status"] = "succeeded"
+                return
+            if result.get("code") == 1006:
+                target["status"] = "session_expired"
+                return
+            if attempt < job["max_attempts"]:
+                stop_event.wait(job["retry_interval"])
+        target["status"] = "failed"
+
+    @staticmethod
+    def _finish(job, status: str, error: Optional[str] = None):
+        job["status"] = status
+        if error:
+            job["error"] = error
+        job["finished_at"] = time.time()
+        print(f"抢课任务结束: {job['id']}，状态: {status}")
+
+    @staticmethod
+    def _public(job) -> Dict:
+        """任务状态（不含所属用户与内部对象）"""
+        targets = []
+        for target in job["targets"]:
+            latencies = [attempt["latency_ms"] for attempt in target["attempts"]]
+            targets.append(dict(
+                target,
+                attempts=list(target["attempts"]),
+                min_latency_ms=min(latencies) if latencies else None,
+            ))
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "error": job["error"],
+            "open_at": job["open_at"],
+            "fire_at": job["fire_at"],
+            "created_at": job["created_at"],
+            "warmed_at": job["warmed_at"],
+            "warm_ms": job["warm_ms"],
+            "fired_at": job["fired_at"],
+            "finished_at": job["finished_at"],
+            "max_attempts": job["max_attempts"],
+            "targets": targets,
+        }
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+            return {"jobs": len(self._jobs), "max_jobs": self.max_jobs, "statuses": statuses}
+
+
+# 全局抢课任务实例
+course_rush = CourseRushManager()
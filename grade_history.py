@@ -0,0 +1,181 @@
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 通过的等级制成绩
+PASSING_GRADES = {"优秀", "良好", "中等", "及格", "合格", "通过", "优", "良", "中", "A", "B", "C", "D"}
+# 入学年份合理范围（早于此年份或晚于当前年份的解析结果视为无效）
+MIN_ENROLLMENT_YEAR = 2000
+# 历年成绩最多查询的学期数（每个学期对应一次教务系统请求），超出时只保留最近的学期
+MAX_TERMS = 24
+
+
+def current_term(now: Optional[float] = None) -> Tuple[int, int]:
+    """
+    当前学年学期（学年以开始年份表示）
+    8 月至次年 1 月为第一学期，2 月至 7 月为第二学期
+    """
+    local = time.localtime(now if now is not None else time.time())
+    if local.tm_mon >= 8:
+        return local.tm_year, 1
+    if local.tm_mon == 1:
+        return local.tm_year - 1, 1
+    return local.tm_year - 1, 2
+
+
+def term_index(year: int, term: int) -> int:
+    return year * 2 + (term - 1)
+
+
+def is_term_closed(year: int, term: int, now: Optional[float] = None) -> bool:
+    """学期是否已关闭：早于上一学期的成绩不再变化（上一学期可能仍有补考成绩录入）"""
+    return term_index(year, term) <= term_index(*current_term(now)) - 2
+
+
+def is_valid_enrollment_year(year: int, now: Optional[float] = None) -> bool:
+    """入学年份是否在合理范围内（MIN_ENROLLMENT_YEAR 至当前年份）"""
+    return MIN_ENROLLMENT_YEAR <= year <= time.localtime(now if now is not None else time.time()).tm_year
+
+
+def academic_terms(enrollment_year: int, now: Optional[float] = None) -> List[Tuple[int, int]]:
+    """入学以来的所有学年学期（到当前学期为止，最多 MAX_TERMS 个最近的学期）"""
+    current = term_index(*current_term(now))
+    start = max(enrollment_year, MIN_ENROLLMENT_YEAR, current // 2 - MAX_TERMS // 2)
+    terms = [
+        (year, term)
+        for year in range(start, current // 2 + 1)
+        for term in (1, 2)
+        if term_index(year, term) <= current
+    ]
+    return terms[-MAX_TERMS:]
+
+
+def enrollment_year_from_info(info: Optional[Dict], sid: Optional[str] = None) -> Optional[int]:
+    """从个人信息的入学日期（如 2021-09-01、20210901）解析入学年份，失败时尝试学号前四位"""
+    candidates = []
+    if info:
+        candidates.append(str(info.get("enrollment_date") or ""))
+        sid = sid or info.get("sid")
+    if sid:
+        candidates.append(str(sid))
+    for value in candidates:
+        match = re.match(r"\s*(\d{4})", value)
+        if match and is_valid_enrollment_year(int(match.group(1))):
+            return int(match.group(1))
+    return None
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_passed(course: Dict) -> bool:
+    """是否取得学分：有绩点时以绩点大于 0 为准，否则按百分制 60 分或等级制成绩判断"""
+    grade_point = _to_float(course.get("grade_point"))
+    if grade_point is not None:
+        return grade_point > 0
+    grade = course.get("grade")
+    if isinstance(grade, int):
+        return grade >= 60
+    numeric = _to_float(grade)
+    if numeric is not None:
+        return numeric >= 60
+    return str(grade or "").strip() in PASSING_GRADES
+
+
+def _attempt_rank(course: Dict):
+    """同一课程多次修读时的排序依据：绩点高者优先，相同时取较晚的学期"""
+    grade_point = _to_float(course.get("grade_point"))
+    return (grade_point if grade_point is not None else -1.0, term_index(course["year"], course["term"]))
+
+
+def best_attempts(courses: List[Dict]) -> List[Dict]:
+    """按课程号去重（重修、补考），每门课程保留最好的一次成绩"""
+    best: Dict[str, Dict] = {}
+    for course in courses:
+        key = course.get("course_id") or course.get("title")
+        if key not in best or _attempt_rank(course) >= _attempt_rank(best[key]):
+            best[key] = course
+    return list(best.values())
+
+
+def summarize(courses: List[Dict]) -> Dict:
+    """学分加权平均绩点与学分合计（参与计算的课程需已去重）"""
+    credits = 0.0
+    earned = 0.0
+    weighted = 0.0
+    gpa_credits = 0.0
+    for course in courses:
+        credit = _to_float(course.get("credit")) or 0.0
+        credits += credit
+        if is_passed(course):
+            earned += credit
+        grade_point = _to_float(course.get("grade_point"))
+        if grade_point is not None and credit > 0:
+            weighted += credit * grade_point
+            gpa_credits += credit
+    return {
+        "course_count": len(courses),
+        "credits": round(credits, 2),
+        "earned_credits": round(earned, 2),
+        "gpa": round(weighted / gpa_credits, 3) if gpa_credits else None,
+    }
+
+
+def merge_grade_history(term_results: List[Tuple[int, int, Dict]], enrollment_year: Optional[int] = None) -> Dict:
+    """
+    合并各学期成绩查询结果
+    参数:
+        term_results: [(学年, 学期, get_grade 结果字典), ...]
+    返回:
+        dict: 结果字典；所有学期都失败时返回首个错误
+    """
+    terms = []
+    all_courses = []
+    errors = []
+    sid = name = None
+    for year, term, result in sorted(term_results, key=lambda item: term_index(item[0], item[1])):
+        code = result.get("code") if isinstance(result, dict) else 999
+        entry = {"year": year, "term": term, "code": code}
+        if isinstance(result, dict) and result.get("cache"):
+            entry["cache"] = result["cache"]
+        if code == 1000:
+            data = result.get("data") or {}
+            sid = sid or data.get("sid")
+            name = name or data.get("name")
+            courses = [dict(course, year=year, term=term) for course in data.get("courses") or []]
+            all_courses.extend(courses)
+            entry.update(summarize(best_attempts(courses)))
+            entry["courses"] = courses
+        elif code != 1005:
+            entry["msg"] = result.get("msg") if isinstance(result, dict) else str(result)
+            errors.append(result)
+        terms.append(entry)
+
+    if errors and len(errors) == len(term_results):
+        return errors[0]
+
+    best = best_attempts(all_courses)
+    best_ids = {id(course) for course in best}
+    # 标记被更好成绩取代的修读记录（重修前的成绩、补考前的成绩）
+    for entry in terms:
+        for course in entry.get("courses", []):
+            course["superseded"] = id(course) not in best_ids
+    overall = summarize(best)
+    overall["retakes"] = len(all_courses) - len(best)
+    return {
+        "code": 1000,
+        "msg": "获取历年成绩成功" if not errors else "部分学期成绩获取失败",
+        "data": {
+            "sid": sid,
+            "name": name,
+            "enrollment_year": enrollment_year,
+            "term_count": len(terms),
+            "failed_terms": len(errors),
+            "overall": overall,
+            "terms": terms,
+        },
+    }
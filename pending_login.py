@@ -0,0 +1,120 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+class PendingLogin:
+    """等待用户输入验证码的登录握手状态（会话、CSRF token、公钥、验证码图片，以及 /api/login 时的学号和密码）"""
+
+    def __init__(self, client, base_url: str, csrf_token: str, modulus: str, exponent: str,
+                 school_name: Optional[str] = None, sid: Optional[str] = None, password: Optional[str] = None,
+                 kaptcha: Optional[bytes] = None, kaptcha_type: Optional[str] = None):
+        self.client = client
+        self.base_url = base_url
+        self.csrf_token = csrf_token
+        self.modulus = modulus
+        self.exponent = exponent
+        self.school_name = school_name
+        self.sid = sid
+        self.password = password
+        # 教务系统返回的验证码图片原始字节，图片接口直接输出
+        self.kaptcha = kaptcha
+        self.kaptcha_type = kaptcha_type
+        self.created_at = time.time()
+        self._clients = {}
+
+    def get_client(self, client_cls=None):
+        """获取指定类型的客户端（同步/异步），与握手时的客户端共享 cookies 与连接池"""
+        if client_cls is None or type(self.client) is client_cls:
+            return self.client
+        client = self._clients.get(client_cls)
+        if client is None:
+            client = client_cls.from_client(self.client)
+            self._clients[client_cls] = client
+        return client
+
+
+class PendingLoginStore:
+    """
+    待完成登录存储：需要验证码时在服务端保留握手状态，客户端只持有不透明的 login_token，
+    提交验证码后即删除（一次性），按创建时间过期，并限制最大数量
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl or _env_int("ZFJW_PENDING_LOGIN_TTL", 300)
+        self.max_entries = max_entries or _env_int("ZFJW_PENDING_LOGIN_MAX", 2000)
+        self._entries: "OrderedDict[str, PendingLogin]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> int:
+        """淘汰过期的握手状态（调用方需持有锁），按创建顺序只扫描过期部分"""
+        evicted = 0
+        while self._entries:
+            token, entry = next(iter(self._entries.items()))
+            if now - entry.created_at < self.ttl:
+                break
+            del self._entries[token]
+            evicted += 1
+        return evicted
+
+    def create(self, client, base_url: str, csrf_token: str, modulus: str, exponent: str,
+               school_name: Optional[str] = None, sid: Optional[str] = None, password: Optional[str] = None,
+               kaptcha: Optional[bytes] = None, kaptcha_type: Optional[str] = None) -> str:
+        """保存握手状态并返回 login_token"""
+        token = secrets.token_urlsafe(24)
+        entry = PendingLogin(client, base_url, csrf_token, modulus, exponent, school_name, sid, password,
+                             kaptcha, kaptcha_type)
+        with self._lock:
+            self._evict_expired(entry.created_at)
+            while len(self._entries) >= self.max_entries:
+                # 超出上限时淘汰最早的握手状态
+                self._entries.popitem(last=False)
+            self._entries[token] = entry
+        return token
+
+    def get(self, token: Optional[str]) -> Optional[PendingLogin]:
+        """获取握手状态（不删除），不存在或已过期时返回 None"""
+        if not token:
+            return None
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and time.time() - entry.created_at >= self.ttl:
+                del self._entries[token]
+                return None
+            return entry
+
+    def remove(self, token: Optional[str]) -> bool:
+        """删除握手状态（验证码登录提交后即失效）；已被删除时返回 False"""
+        if not token:
+            return False
+        with self._lock:
+            return self._entries.pop(token, None) is not None
+
+    def get_stats(self) -> Dict:
+        """待完成登录统计信息"""
+        with self._lock:
+            self._evict_expired(time.time())
+            return {
+                "pending": len(self._entries),
+                "max_pending": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+# 全局待完成登录存储实例
+pending_logins = PendingLoginStore()
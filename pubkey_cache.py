@@ -0,0 +1,116 @@
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import rsa
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+def parse_public_key(modulus: str, exponent: str) -> rsa.PublicKey:
+    """把教务系统返回的 base64 模数/指数解析为 RSA 公钥"""
+    n = int.from_bytes(base64.b64decode(modulus), "big")
+    e = int.from_bytes(base64.b64decode(exponent), "big")
+    return rsa.PublicKey(n, e)
+
+
+class PublicKeyCache:
+    """
+    登录公钥缓存：按学校（公钥地址）记录当前公钥，公钥固定的学校（static_public_key）登录时跳过公钥请求；
+    解析后的 RSA 公钥按 (modulus, exponent) 复用。
+    每次实际获取公钥时与缓存比较，发现轮换立即替换，
+    TTL 内发生轮换的学校（公钥可能按会话生成）在一个 TTL 内不再使用缓存
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_keys: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else _env_int("ZFJW_PUBKEY_TTL", 3600)
+        self.max_keys = max_keys or _env_int("ZFJW_PUBKEY_MAX_KEYS", 256)
+        self._current: Dict[str, Dict] = {}
+        self._parsed: "OrderedDict[Tuple[str, str], rsa.PublicKey]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rotations": 0, "parsed": 0, "parse_hits": 0}
+
+    def current(self, school: Optional[str]) -> Optional[Tuple[str, str]]:
+        """学校当前的 (modulus, exponent)；未缓存、已过期或公钥不稳定时返回 None"""
+        if not school or self.ttl <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._current.get(school)
+            if entry is None or now - entry["checked_at"] > self.ttl or now < entry["volatile_until"]:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return entry["modulus"], entry["exponent"]
+
+    def observe(self, school: Optional[str], modulus: str, exponent: str) -> bool:
+        """
+        记录从教务系统获取到的公钥
+        返回:
+            bool: 与缓存中未过期的公钥不同（发生轮换）时为 True
+        """
+        if not school:
+            return False
+        now = time.time()
+        with self._lock:
+            entry = self._current.get(school)
+            rotated = (
+                entry is not None
+                and (entry["modulus"], entry["exponent"]) != (modulus, exponent)
+                and now - entry["checked_at"] <= self.ttl
+            )
+            volatile_until = entry["volatile_until"] if entry else 0.0
+            if rotated:
+                self._stats["rotations"] += 1
+                volatile_until = now + self.ttl
+                print(f"检测到登录公钥轮换: {school}")
+            self._current[school] = {
+                "modulus": modulus,
+                "exponent": exponent,
+                "checked_at": now,
+                "volatile_until": volatile_until,
+            }
+            return rotated
+
+    def invalidate(self, school: Optional[str]):
+        with self._lock:
+            self._current.pop(school, None)
+
+    def public_key(self, modulus: str, exponent: str) -> rsa.PublicKey:
+        """获取解析后的 RSA 公钥（按 modulus/exponent 复用，LRU 淘汰）"""
+        cache_key = (modulus, exponent)
+        with self._lock:
+            key = self._parsed.get(cache_key)
+            if key is not None:
+                self._parsed.move_to_end(cache_key)
+                self._stats["parse_hits"] += 1
+                return key
+        key = parse_public_key(modulus, exponent)
+        with self._lock:
+            self._parsed[cache_key] = key
+            self._parsed.move_to_end(cache_key)
+            while len(self._parsed) > self.max_keys:
+                self._parsed.popitem(last=False)
+            self._stats["parsed"] += 1
+        return key
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, schools=len(self._current), keys=len(self._parsed), ttl=self.ttl)
+
+
+# 全局登录公钥缓存
+pubkey_cache = PublicKeyCache()
@@ -0,0 +1,65 @@
+import re
+
+# 响应类型
+RESPONSE_JSON = "json"
+RESPONSE_HTML = "html"
+RESPONSE_LOGIN = "login"
+RESPONSE_ERROR = "error"
+RESPONSE_EMPTY = "empty"
+RESPONSE_TEXT = "text"
+
+# 前缀扫描长度：判断 JSON 与错误页标题只需要响应开头的一小段
+PREFIX_SIZE = 2048
+
+# 登录页特征：页面中的 <h5>用户登录</h5> 或登录表单地址
+_LOGIN_H5_PATTERN = re.compile(r"<h5[^>]*>\s*用户登录\s*</h5>")
+_LOGIN_FORM_MARK = "login_slogin.html"
+# 错误页特征：<title> 含“错误”（如“错误提示”）
+_TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.S | re.I)
+
+
+def _prefix(response, size: int = PREFIX_SIZE) -> str:
+    """读取响应开头的一小段文本（按字节截取后解码，不解码整个响应体）"""
+    content = response.content or b""
+    return content[:size].decode("utf-8", errors="ignore")
+
+
+def triage(response) -> str:
+    """
+    对上游响应做轻量分类，避免对 JSON 响应构建 DOM
+    返回:
+        RESPONSE_JSON: JSON 数据（依据 Content-Type 或内容以 { / [ 开头）
+        RESPONSE_LOGIN: 被重定向到登录页（会话失效）
+        RESPONSE_ERROR: 教务系统错误提示页
+        RESPONSE_HTML: 普通 HTML 页面
+        RESPONSE_EMPTY: 空响应
+        RESPONSE_TEXT: 其他纯文本（如选课接口返回的 "0"）
+    """
+    if not response.content:
+        return RESPONSE_EMPTY
+
+    # 重定向到登录页时最终地址即为登录页
+    if _LOGIN_FORM_MARK in str(getattr(response, "url", "") or ""):
+        return RESPONSE_LOGIN
+
+    content_type = (response.headers.get("Content-Type") or "").lower()
+    head = _prefix(response).lstrip("\ufeff \t\r\n")
+    if "json" in content_type or head[:1] in ("{", "["):
+        return RESPONSE_JSON
+
+    if "html" in content_type or head[:1] == "<":
+        # 登录标记可能位于页面任意位置，HTML 页面做一次全文子串扫描（远比构建 DOM 便宜）
+        text = response.text
+        if _LOGIN_H5_PATTERN.search(text):
+            return RESPONSE_LOGIN
+        title = _TITLE_PATTERN.search(head)
+        if title and "错误" in title.group(1):
+            return RESPONSE_ERROR
+        return RESPONSE_HTML
+
+    return RESPONSE_TEXT
+
+
+def is_login_page(response) -> bool:
+    """响应是否为登录页（会话失效）"""
+    return triage(response) == RESPONSE_LOGIN
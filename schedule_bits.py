@@ -0,0 +1,94 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+# 周次/节次位掩码：与空教室查询的 zcd/jcd 编码一致，第 n 周（节）对应 2^(n-1)
+# 同一门课的周次、节次字符串在不同学生之间大量重复，解析结果做有界缓存
+CACHE_SIZE = 4096
+
+_NUMBER_PATTERN = re.compile(r"(\d+)")
+
+
+def _bit(value: int) -> int:
+    """第 value 周（节）对应的位，非法值（小于1）忽略"""
+    return 1 << (value - 1) if value >= 1 else 0
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def weeks_mask(weeks: Optional[str]) -> int:
+    """
+    解析周次字符串为位掩码
+    支持 "1-16周"、"1-16周(单)"、"2-16周(双)"、"3周" 及逗号分隔的组合
+    """
+    if not weeks:
+        return 0
+    mask = 0
+    for item in weeks.split(","):
+        numbers = _NUMBER_PATTERN.findall(item)
+        if "-" in item:
+            if len(numbers) != 2:
+                continue
+            start, end = int(numbers[0]), int(numbers[1])
+            for week in range(start, end + 1):
+                if "单" in item and week % 2 == 0:
+                    continue
+                if "双" in item and week % 2 == 1:
+                    continue
+                mask |= _bit(week)
+        elif len(numbers) == 1:
+            mask |= _bit(int(numbers[0]))
+    return mask
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def sessions_mask(sessions: Optional[str]) -> int:
+    """解析节次字符串为位掩码，支持 "1-2节"、"3节" 及合并时段 "1-2节,5-6节" """
+    if not sessions:
+        return 0
+    mask = 0
+    for item in sessions.split(","):
+        numbers = [int(n) for n in _NUMBER_PATTERN.findall(item)]
+        if len(numbers) >= 2:
+            for session in range(numbers[0], numbers[1] + 1):
+                mask |= _bit(session)
+        elif len(numbers) == 1:
+            mask |= _bit(numbers[0])
+    return mask
+
+
+def list_to_mask(values: Iterable[int]) -> int:
+    """周次/节次列表转位掩码"""
+    mask = 0
+    for value in values:
+        mask |= _bit(int(value))
+    return mask
+
+
+def mask_to_list(mask: int) -> List[int]:
+    """位掩码转周次/节次列表（升序），仅在需要展示时调用"""
+    result = []
+    position = 1
+    while mask:
+        if mask & 1:
+            result.append(position)
+        mask >>= 1
+        position += 1
+    return result
+
+
+def overlaps(mask_a: int, mask_b: int) -> bool:
+    """两个周次（或节次）位掩码是否有交集，用于冲突检测与按周过滤"""
+    return bool(mask_a & mask_b)
+
+
+def contains(mask: int, value: int) -> bool:
+    """位掩码是否包含第 value 周（节）"""
+    return bool(mask >> (value - 1) & 1)
+
+
+def cache_info():
+    """解析缓存命中情况"""
+    return {
+        "weeks": weeks_mask.cache_info()._asdict(),
+        "sessions": sessions_mask.cache_info()._asdict(),
+    }
@@ -117,6 +117,13 @@ class SchoolConfigManager:
             return True  # 默认需要验证码
         return config.get("requires_captcha", True)
     
+    def static_public_key(self, school_name: str) -> bool:
+        """检查学校的登录公钥是否固定（不随会话生成），固定时登录可使用缓存的公钥"""
+        config = self.get_school_config(school_name)
+        if not config:
+            return False  # 默认每次登录获取本会话的公钥
+        return config.get("static_public_key", False)
+    
     def get_term_mapping(self, school_name: str, term: int) -> str:
         """获取学校的学期参数映射"""
         config = self.get_school_config(school_name)
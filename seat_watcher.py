@@ -0,0 +1,332 @@
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+
+from zfn_api import select_succeeded
+
+try:
+    from transport import transport_manager
+except ImportError:
+    transport_manager = None
+
+# 每个监控保留的最近选课尝试记录数
+MAX_ATTEMPT_RECORDS = 20
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取数值环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+class WatchGroup:
+    """同一学校、学年学期、课程的所有监控：共用一个轮询线程，一次查询教学班列表服务所有学生"""
+
+    def __init__(self, key: tuple, year, term, course_id: str, school_name: Optional[str], base_url: str, interval: float):
+        self.key = key
+        self.year = year
+        self.term = term
+        self.course_id = course_id
+        self.school_name = school_name
+        self.base_url = base_url
+        self.interval = interval
+        self.watchers: List[Dict] = []
+        self.polls = 0
+        self.errors = 0
+        self.last_poll_at = None
+        self.last_error = None
+        self.snapshot: Dict[str, tuple] = {}  # 教学班 -> (已选人数, 容量)，用于判断是否有变化
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def active_watchers(self) -> List[Dict]:
+        return [watcher for watcher in self.watchers if watcher["status"] == "watching"]
+
+
+class SeatWatcher:
+    """
+    余量监控：学生登记要抢的教学班，服务端按课程轮询教学班列表（同一课程的所有监控共用一次轮询），
+    出现余量时立即用登记学生的会话选课，结果通过状态接口查询
+    - 轮询间隔自适应：人数有变化时回到最短间隔，无变化时逐步放慢，出错时退避
+    - 同一教学班有多个学生监控时按登记顺序依次选课，每轮最多尝试余量个数的学生
+    """
+
+    def __init__(self):
+        self.min_interval = _env_float("ZFJW_WATCH_MIN_INTERVAL", 2)
+        self.max_interval = _env_float("ZFJW_WATCH_MAX_INTERVAL", 30)
+        self.ttl = _env_float("ZFJW_WATCH_TTL", 21600)
+        self.retention = _env_float("ZFJW_WATCH_RETENTION", 3600)
+        self.max_watchers = int(_env_float("ZFJW_WATCH_MAX", 1000))
+        self.max_per_owner = int(_env_float("ZFJW_WATCH_MAX_PER_USER", 10))
+        self._groups: Dict[tuple, WatchGroup] = {}
+        self._watchers: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(base_url: str, year, term, course_id) -> tuple:
+        school = transport_manager.host_key(base_url) if transport_manager else None
+        return (school or (base_url or "").rstrip("/"), str(year), str(term), str(course_id))
+
+    def _prune(self, now: float):
+        """删除结束超过保留时长的监控（调用方需持有锁）"""
+        expired = [
+            watch_id for watch_id, watcher in self._watchers.items()
+            if watcher["finished_at"] and now - watcher["finished_at"] > self.retention
+        ]
+        for watch_id in expired:
+            del self._watchers[watch_id]
+
+    def add(self, client, owner: str, year, term, course_id: str, do_id: str, url_select: str, select_data: Dict,
+            class_id: Optional[str] = None, school_name: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        登记余量监控
+        参数:
+            client: 已登录的 Client（轮询与选课都使用登记学生的会话）
+            owner: 监控所属用户，查询与取消时校验
+            do_id: 要选的教学班（选课用 do_jxb_id）
+            url_select, select_data: 提前准备的选课地址与表单
+        返回:
+            tuple: (监控状态, error)，error 为错误结果字典
+        """
+        now = time.time()
+        key = self.make_key(base_url, year, term, course_id)
+        with self._lock:
+            self._prune(now)
+            active = [watcher for watcher in self._watchers.values() if watcher["status"] == "watching"]
+            if len(active) >= self.max_watchers:
+                return None, {"code": 429, "msg": "余量监控过多，请稍后再试"}
+            if sum(1 for watcher in active if watcher["owner"] == owner) >= self.max_per_owner:
+                return None, {"code": 429, "msg": f"每个用户最多同时监控 {self.max_per_owner} 个教学班"}
+            for watcher in active:
+                if watcher["owner"] == owner and watcher["group"] == key and watcher["do_id"] == do_id:
+                    return self._public(watcher), None
+
+            watch_id = secrets.token_urlsafe(12)
+            watcher = {
+                "id": watch_id,
+                "owner": owner,
+                "group": key,
+                "course_id": course_id,
+                "do_id": do_id,
+                "class_id": class_id,
+                "status": "watching",
+                "error": None,
+                "created_at": now,
+                "expires_at": now + self.ttl,
+                "finished_at": None,
+                "last_seen": None,
+                "attempts": [],
+                "client": client,
+                "url_select": url_select,
+                "select_data": select_data,
+            }
+            self._watchers[watch_id] = watcher
+            group = self._groups.get(key)
+            if group is None or not group.thread or not group.thread.is_alive():
+                group = WatchGroup(key, year, term, course_id, school_name, base_url, self.min_interval)
+                self._groups[key] = group
+                group.watchers.append(watcher)
+                group.thread = threading.Thread(target=self._poll, args=(group,), name=f"seat-watch-{key[0]}-{course_id}", daemon=True)
+                group.thread.start()
+                print(f"启动余量监控轮询: {key}")
+            else:
+                group.watchers.append(watcher)
+                # 新登记的监控尽快得到一次结果
+                group.interval = self.min_interval
+                group.wakeup.set()
+        return self._public(watcher), None
+
+    def status(self, owner: str, watch_id: Optional[str] = None):
+        """查询监控：指定 watch_id 时返回该监控（不存在返回 None），否则返回该用户的全部监控"""
+        if watch_id:
+            watcher = self._watchers.get(watch_id)
+            if watcher is None or watcher["owner"] != owner:
+                return None
+            return self._public(watcher)
+        with self._lock:
+            watchers = [watcher for watcher in self._watchers.values() if watcher["owner"] == owner]
+        return [self._public(watcher) for watcher in watchers]
+
+    def cancel(self, watch_id: str, owner: str) -> Optional[Dict]:
+        watcher = self._watchers.get(watch_id)
+        if watcher is None or watcher["owner"] != owner:
+            return None
+        if watcher["status"] == "watching":
+            self._finish(watcher, "cancelled")
+            group = self._groups.get(watcher["group"])
+            if group:
+                # 没有其他监控时让轮询线程尽快退出
+                group.wakeup.set()
+        return self._public(watcher)
+
+    def _poll(self, group: WatchGroup):
+        """轮询线程：查询教学班列表，有余量时为监控该教学班的学生选课，没有监控时退出"""
+        while True:
+            now = time.time()
+            with self._lock:
+                for watcher in group.active_watchers():
+                    if now >= watcher["expires_at"]:
+                        self._finish(watcher, "expired")
+                watchers = group.active_watchers()
+                group.watchers = watchers
+                if not watchers:
+                    if self._groups.get(group.key) is group:
+                        del self._groups[group.key]
+                    print(f"余量监控轮询结束: {group.key}")
+                    return
+
+            try:
+                result = self._fetch_classes(group, watchers)
+            except Exception as e:
+                result = {"code": 999, "msg": str(e)}
+            group.polls += 1
+            group.last_poll_at = time.time()
+
+            if result.get("code") == 1000:
+                group.last_error = None
+                changed = self._handle_classes(group, result["data"].get("classes") or [])
+                group.interval = self.min_interval if changed else min(self.max_interval, group.interval * 1.5)
+            else:
+                group.errors += 1
+                group.last_error = result.get("msg")
+                group.interval = min(self.max_interval, max(self.min_interval, group.interval * 2))
+
+            group.wakeup.wait(group.interval)
+            group.wakeup.clear()
+
+    def _fetch_classes(self, group: WatchGroup, watchers: List[Dict]) -> Dict:
+        """用监控学生的会话查询教学班列表（轮流使用，会话失效的学生结束监控）"""
+        offset = group.polls % len(watchers)
+        result = {"code": 1006, "msg": "未登录或已过期，请重新登录"}
+        for watcher in watchers[offset:] + watchers[:offset]:
+            if watcher["status"] != "watching":
+                continue
+            result = watcher["client"].get_course_classes(
+                group.year, group.term, group.course_id,
+                school_name=group.school_name, base_url=group.base_url, verbose=False,
+            )
+            if result.get("code") != 1006:
+                return result
+            self._finish(watcher, "session_expired", result.get("msg"))
+        return result
+
+    def _handle_classes(self, group: WatchGroup, classes: List[Dict]) -> bool:
+        """
+        根据最新教学班列表更新监控并为有余量的教学班选课
+        返回:
+            bool: 已选人数或容量是否有变化
+        """
+        now = time.time()
+        snapshot = {}
+        by_class = {}
+        for item in classes:
+            for class_key in (item.get("do_id"), item.get("class_id")):
+                if class_key:
+                    by_class[class_key] = item
+            snapshot[item.get("do_id") or item.get("class_id")] = (item.get("selected_number"), item.get("capacity"))
+        changed = bool(group.snapshot) and snapshot != group.snapshot
+        group.snapshot = snapshot
+
+        seats: Dict[str, int] = {}
+        for watcher in group.active_watchers():
+            item = by_class.get(watcher["do_id"]) or by_class.get(watcher["class_id"])
+            if item is None:
+                watcher["error"] = "教学班列表中未找到该教学班"
+                continue
+            watcher["last_seen"] = {
+                "available": item.get("available"),
+                "capacity": item.get("capacity"),
+                "selected_number": item.get("selected_number"),
+                "at": round(now, 3),
+            }
+            class_key = watcher["do_id"]
+            seats.setdefault(class_key, item.get("available") or 0)
+            # 按登记顺序为学生选课，每个余量最多尝试一名学生
+            if seats[class_key] > 0:
+                seats[class_key] -= 1
+                if self._enroll(watcher):
+                    changed = True
+        return changed
+
+    def _enroll(self, watcher: Dict) -> bool:
+        """提交选课，成功时结束监控"""
+        started = time.perf_counter()
+        result = watcher["client"].submit_select(watcher["url_select"], watcher["select_data"])
+        data = result.get("data") if isinstance(result.get("data"), dict) else {}
+        watcher["attempts"].append({
+            "at": round(time.time(), 3),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "code": result.get("code"),
+            "flag": data.get("flag"),
+            "msg": data.get("msg") or result.get("msg"),
+        })
+        del watcher["attempts"][:-MAX_ATTEMPT_RECORDS]
+        if select_succeeded(result):
+            self._finish(watcher, "enrolled")
+            return True
+        if result.get("code") == 1006:
+            self._finish(watcher, "session_expired", result.get("msg"))
+        else:
+            watcher["error"] = data.get("msg") or result.get("msg")
+        return False
+
+    @staticmethod
+    def _finish(watcher: Dict, status: str, error: Optional[str] = None):
+        watcher["status"] = status
+        if error:
+            watcher["error"] = error
+        watcher["finished_at"] = time.time()
+        print(f"余量监控结束: {watcher['id']}（课程 {watcher['course_id']}，教学班 {watcher['do_id']}），状态: {status}")
+
+    def _public(self, watcher: Dict) -> Dict:
+        """监控状态（不含所属用户、会话与表单）"""
+        group = self._groups.get(watcher["group"])
+        return {
+            "watch_id": watcher["id"],
+            "course_id": watcher["course_id"],
+            "do_id": watcher["do_id"],
+            "class_id": watcher["class_id"],
+            "status": watcher["status"],
+            "error": watcher["error"],
+            "created_at": watcher["created_at"],
+            "expires_at": watcher["expires_at"],
+            "finished_at": watcher["finished_at"],
+            "last_seen": watcher["last_seen"],
+            "attempts": list(watcher["attempts"]),
+            "poll_interval": round(group.interval, 2) if group and watcher["status"] == "watching" else None,
+            "watchers_in_course": len(group.active_watchers()) if group else 0,
+        }
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for watcher in self._watchers.values():
+                statuses[watcher["status"]] = statuses.get(watcher["status"], 0) + 1
+            groups = [
+                {
+                    "school": group.key[0],
+                    "year": group.key[1],
+                    "term": group.key[2],
+                    "course_id": group.key[3],
+                    "watchers": len(group.active_watchers()),
+                    "polls": group.polls,
+                    "errors": group.errors,
+                    "interval": round(group.interval, 2),
+                    "last_poll_at": group.last_poll_at,
+                    "last_error": group.last_error,
+                }
+                for group in self._groups.values()
+            ]
+        return {"watchers": len(self._watchers), "statuses": statuses, "groups": groups}
+
+
+# 全局余量监控实例
+seat_watcher = SeatWatcher()
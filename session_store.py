@@ -0,0 +1,114 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+class SessionEntry:
+    """服务端保存的已登录会话"""
+
+    def __init__(self, client, base_url: str, school_name: Optional[str] = None, sid: Optional[str] = None):
+        self.client = client
+        self.base_url = base_url
+        self.school_name = school_name
+        self.sid = sid
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self._clients = {}
+
+    def get_client(self, client_cls=None):
+        """获取指定类型的客户端（同步/异步），与登录时的客户端共享 cookies"""
+        if client_cls is None or type(self.client) is client_cls:
+            return self.client
+        client = self._clients.get(client_cls)
+        if client is None:
+            client = client_cls.from_client(self.client)
+            self._clients[client_cls] = client
+        return client
+
+
+class SessionStore:
+    """
+    登录会话存储：登录成功后保留 Client（cookie jar 与已预热的连接），
+    通过不透明 token 复用，按空闲时间淘汰，并限制最大会话数
+    """
+
+    def __init__(self, idle_timeout: Optional[int] = None, max_sessions: Optional[int] = None):
+        self.idle_timeout = idle_timeout or _env_int("ZFJW_SESSION_IDLE_TIMEOUT", 1800)
+        self.max_sessions = max_sessions or _env_int("ZFJW_SESSION_MAX", 2000)
+        self._entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> int:
+        """淘汰空闲超时的会话（调用方需持有锁），按最近访问顺序只扫描过期部分"""
+        evicted = 0
+        while self._entries:
+            token, entry = next(iter(self._entries.items()))
+            if now - entry.last_access < self.idle_timeout:
+                break
+            del self._entries[token]
+            evicted += 1
+        return evicted
+
+    def create(self, client, base_url: str, school_name: Optional[str] = None, sid: Optional[str] = None) -> str:
+        """保存会话并返回 token"""
+        token = secrets.token_urlsafe(32)
+        entry = SessionEntry(client, base_url, school_name, sid)
+        with self._lock:
+            self._evict_expired(entry.created_at)
+            while len(self._entries) >= self.max_sessions:
+                # 超出上限时淘汰最久未使用的会话
+                self._entries.popitem(last=False)
+            self._entries[token] = entry
+        return token
+
+    def get(self, token: Optional[str]) -> Optional[SessionEntry]:
+        """根据 token 获取会话，同时刷新访问时间"""
+        if not token:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if now - entry.last_access >= self.idle_timeout:
+                del self._entries[token]
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(token)
+            return entry
+
+    def remove(self, token: Optional[str]) -> bool:
+        """删除会话（退出登录）"""
+        if not token:
+            return False
+        with self._lock:
+            return self._entries.pop(token, None) is not None
+
+    def get_stats(self) -> Dict:
+        """会话存储统计信息"""
+        with self._lock:
+            self._evict_expired(time.time())
+            return {
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+            }
+
+
+# 全局会话存储实例
+session_store = SessionStore()
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+
+class _Flight:
+    """进行中的一次调用，同键的并发请求等待其结果"""
+
+    __slots__ = ("event", "result", "ok")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.ok = False
+
+
+def _always(result) -> bool:
+    return True
+
+
+class SingleFlight:
+    """
+    相同请求合并：同一键同时只有一个调用访问教务系统，其余并发调用等待并共享其（已解析的）结果
+    - share 判断领头调用的结果能否给等待者使用；不能使用（或领头调用抛出异常）时等待者自行调用
+    - 同步调用与异步调用分别维护（异步调用按事件循环区分）
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable, share: Optional[Callable] = None):
+        """
+        执行（或等待）同键调用
+        返回:
+            tuple: (结果, 是否由本次调用执行 fn)；为 False 表示共享了其他调用的结果
+        """
+        share = share or _always
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.ok and share(flight.result):
+                return flight.result, False
+            return fn(), True
+
+        try:
+            flight.result = fn()
+            flight.ok = True
+            return flight.result, True
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    async def ado(self, key: Hashable, fn: Callable, share: Optional[Callable] = None):
+        """do 的异步版本，fn 为返回可等待对象的函数"""
+        share = share or _always
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = self._async_flights.get(key)
+            leader = future is None or future.get_loop() is not loop
+            if leader:
+                future = loop.create_future()
+                self._async_flights[key] = future
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            ok, result = await asyncio.shield(future)
+            if ok and share(result):
+                return result, False
+            return await fn(), True
+
+        ok, result = False, None
+        try:
+            result = await fn()
+            ok = True
+            return result, True
+        finally:
+            with self._lock:
+                if self._async_flights.get(key) is future:
+                    del self._async_flights[key]
+            if not future.done():
+                future.set_result((ok, result))
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights) + len(self._async_flights))
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 异步传输依赖 httpx（仅 AsyncClient 需要）
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def _default_pool_size() -> int:
+    """连接池大小默认与工作线程数保持一致"""
+    value = os.environ.get("ZFJW_POOL_MAXSIZE") or os.environ.get("ZFJW_WORKER_THREADS")
+    try:
+        return max(1, int(value)) if value else 16
+    except ValueError:
+        print(f"连接池大小配置无效: {value}，使用默认值 16")
+        return 16
+
+
+def _default_async_max_connections() -> int:
+    """异步模式下每个学校主机的最大并发连接数"""
+    value = os.environ.get("ZFJW_ASYNC_MAX_CONNECTIONS")
+    try:
+        return max(1, int(value)) if value else 100
+    except ValueError:
+        print(f"异步连接数配置无效: {value}，使用默认值 100")
+        return 100
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """
+    可被多个 Session 共享的连接适配器
+    Session.close() 会关闭挂载的适配器，共享适配器忽略该调用，只在 shutdown() 时真正释放连接
+    """
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class TransportManager:
+    """按学校主机共享的HTTP传输层管理器（连接池进程内共享，cookies 仍按用户隔离）"""
+
+    def __init__(self, pool_maxsize: Optional[int] = None, pool_block: bool = False):
+        self.pool_maxsize = pool_maxsize or _default_pool_size()
+        self.pool_block = pool_block
+        self._adapters: Dict[str, SharedHTTPAdapter] = {}
+        self._sessions_created: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.async_max_connections = _default_async_max_connections()
+        # 异步连接池与事件循环绑定，按事件循环分别维护
+        self._async_transports = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def host_key(base_url: Optional[str]) -> Optional[str]:
+        """将 base_url 归一化为 scheme://host[:port] 形式"""
+        if not base_url:
+            return None
+        parsed = urlparse(base_url)
+        if not parsed.scheme or not parsed.netloc:
+            return None
+        return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+    def get_adapter(self, base_url: Optional[str]) -> Optional[SharedHTTPAdapter]:
+        """获取（或创建）学校主机对应的共享适配器"""
+        key = self.host_key(base_url)
+        if not key:
+            return None
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            with self._lock:
+                adapter = self._adapters.get(key)
+                if adapter is None:
+                    adapter = SharedHTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block,
+                    )
+                    self._adapters[key] = adapter
+                    print(f"创建共享连接池: {key}，大小: {self.pool_maxsize}")
+        return adapter
+
+    def create_session(self, base_url: Optional[str] = None) -> requests.Session:
+        """创建挂载共享连接池的新会话，每个会话拥有独立的 cookie jar"""
+        sess = requests.Session()
+        key = self.host_key(base_url)
+        adapter = self.get_adapter(base_url)
+        if adapter is not None:
+            sess.mount(f"{key}/", adapter)
+            with self._lock:
+                self._sessions_created[key] = self._sessions_created.get(key, 0) + 1
+        return sess
+
+    def get_async_transport(self, base_url: Optional[str] = None):
+        """获取当前事件循环中学校主机对应的共享异步连接池（httpx）"""
+        if httpx is None:
+            raise RuntimeError("异步模式需要安装 httpx")
+        key = self.host_key(base_url) or ""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transports = self._async_transports.get(loop)
+            if transports is None:
+                transports = {}
+                self._async_transports[loop] = transports
+            transport = transports.get(key)
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(
+                    verify=False,
+                    limits=httpx.Limits(
+                        max_connections=self.async_max_connections,
+                        max_keepalive_connections=self.pool_maxsize,
+                    ),
+                )
+                transports[key] = transport
+                print(f"创建共享异步连接池: {key or '(未设置主机)'}，最大连接数: {self.async_max_connections}")
+        return transport
+
+    def get_stats(self) -> Dict:
+        """连接池统计信息：连接数、请求数与连接复用率"""
+        hosts = []
+        with self._lock:
+            items = list(self._adapters.items())
+            sessions_created = dict(self._sessions_created)
+        for key, adapter in items:
+            num_connections = 0
+            num_requests = 0
+            idle_connections = 0
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                num_connections += pool.num_connections
+                num_requests += pool.num_requests
+                if pool.pool is not None:
+                    # 空闲队列中以 None 占位，只统计真实连接
+                    idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            reused = max(num_requests - num_connections, 0)
+            hosts.append({
+                "host": key,
+                "sessions_created": sessions_created.get(key, 0),
+                "connections_opened": num_connections,
+                "idle_connections": idle_connections,
+                "requests": num_requests,
+                "reuse_rate": round(reused / num_requests, 4) if num_requests else 0.0,
+            })
+        with self._lock:
+            async_hosts = sorted({key for transports in self._async_transports.values() for key in transports})
+        return {
+            "pool_maxsize": self.pool_maxsize,
+            "host_count": len(hosts),
+            "hosts": hosts,
+            "async_max_connections": self.async_max_connections,
+            "async_hosts": async_hosts,
+        }
+
+    def shutdown(self):
+        """关闭全部共享连接"""
+        with self._lock:
+            adapters = list(self._adapters.values())
+            self._adapters.clear()
+        for adapter in adapters:
+            adapter.shutdown()
+
+    async def ashutdown(self):
+        """关闭当前事件循环中的共享异步连接"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transports = self._async_transports.pop(loop, {})
+        for transport in transports.values():
+            await transport.aclose()
+
+
+# 全局传输层实例
+transport_manager = TransportManager()
@@ -1,10 +1,13 @@
 import base64
 import binascii
+import functools
 import json
+import os
 import re
 import time
 import traceback
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from urllib.parse import urljoin, urlparse
 
@@ -20,6 +23,125 @@ try:
 except ImportError:
     school_config_manager = None
 
+from schedule_bits import list_to_mask, mask_to_list, sessions_mask, weeks_mask
+from response_triage import RESPONSE_ERROR, RESPONSE_LOGIN, is_login_page, triage
+from pubkey_cache import pubkey_cache
+
+# 导入共享传输层（按学校主机复用连接池）
+try:
+    from transport import transport_manager
+except ImportError:
+    transport_manager = None
+
+# 导入离线验证码识别（依赖 Pillow）
+try:
+    from captcha_solver import captcha_solver
+except ImportError:
+    captcha_solver = None
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数环境变量，无效时使用默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"环境变量 {name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+# 流程一次产出多个请求（如分页查询的剩余页）时，单个客户端同时发送的最大请求数
+UPSTREAM_PARALLEL = max(1, _env_int("ZFJW_UPSTREAM_PARALLEL", 4))
+# 详细成绩分页：每页条数与最多获取的页数
+GRADE_DETAIL_PAGE_SIZE = 100
+GRADE_DETAIL_MAX_PAGES = 50
+# 板块课列表分页：首页行数（之后逐轮翻倍）、单页最大行数、最多获取的行数
+BLOCK_COURSES_PAGE_SIZE = 20
+BLOCK_COURSES_MAX_PAGE_SIZE = 100
+BLOCK_COURSES_MAX_ROWS = 500
+# 自动识别验证码登录的最多尝试次数（识别错误时重新获取验证码），设为 0 关闭自动识别
+CAPTCHA_AUTO_ATTEMPTS = max(0, _env_int("ZFJW_CAPTCHA_AUTO_ATTEMPTS", 2))
+# 验证码登录结果中表示验证码已被教务系统接受的状态码（登录成功、密码错误、其他账号提示）；
+# 超时、请求异常、状态未知无法判断识别是否正确，不计入识别统计
+CAPTCHA_ACCEPTED_CODES = (1000, 1002, 998)
+# 换课时选回原教学班的最多尝试次数
+SWAP_ROLLBACK_ATTEMPTS = 3
+# 选课首页隐藏字段的别名：first* 为默认（第一个）板块的参数，对应板块课列表表单中的同名参数
+BLOCK_FORM_ALIASES = {
+    "firstXkkzId": "xkkz_id",
+    "firstKklxdm": "kklxdm",
+    "firstNjdmId": "njdm_id",
+    "firstZyhId": "zyh_id",
+}
+
+
+def _elapsed_ms(started: float) -> float:
+    """距 perf_counter 起点的毫秒数"""
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _response_ms(response) -> Optional[float]:
+    """单个响应的耗时（毫秒），并发请求时用于区分各步骤耗时"""
+    elapsed = getattr(response, "elapsed", None)
+    return round(elapsed.total_seconds() * 1000, 1) if elapsed is not None else None
+
+
+def select_succeeded(result) -> bool:
+    """选课是否成功（教务系统返回的 flag 为 1）"""
+    data = result.get("data") if result.get("code") == 1000 else None
+    return isinstance(data, dict) and str(data.get("flag")) == "1"
+
+
+class UpstreamRequest:
+    """
+    上游请求描述：接口方法只产出请求并解析响应，由同步/异步客户端负责实际发送
+    参数与 requests.Session.get/post 保持一致
+    """
+
+    __slots__ = ("method", "url", "kwargs")
+
+    def __init__(self, method: str, url: str, **kwargs):
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return f"<UpstreamRequest {self.method.upper()} {self.url}>"
+
+
+class BlockingCall:
+    """
+    流程中的耗时本地计算（如验证码识别、读取模板文件）：同步客户端直接调用，
+    AsyncClient 在线程池中执行，避免阻塞事件循环；调用结果（或异常）送回流程
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def run(self):
+        return self.func(*self.args)
+
+
+def upstream(func):
+    """
+    将产出 UpstreamRequest 的生成器方法包装为普通接口方法
+    同步 Client 直接返回结果字典，AsyncClient 返回可等待对象；
+    原始生成器保存在 flow 属性上，供方法之间嵌套调用（yield from）
+    产出 UpstreamRequest 列表时并发发送，按顺序送回响应列表（发送失败的位置为异常对象）；
+    产出 BlockingCall 时执行本地计算并送回结果
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self._run_flow(func(self, *args, **kwargs))
+    wrapper.flow = func
+    return wrapper
+
+
 RASPIANIE = [
     ["8:00", "8:40"],
     ["8:45", "9:25"],
@@ -40,6 +162,7 @@ RASPIANIE = [
 class Client:
     raspisanie = []
     ignore_type = []
+    is_async = False
 
     def __init__(self, cookies={}, **kwargs):
         # 基础配置
@@ -98,8 +221,11 @@ class Client:
             'Referer': self.login_url
         }
         
-        # 创建会话
-        self.sess = requests.Session()
+        # 创建会话（连接池按学校主机共享，cookies 按用户独立）
+        if transport_manager:
+            self.sess = transport_manager.create_session(self.base_url)
+        else:
+            self.sess = requests.Session()
         self.sess.headers.update(self.headers)
         # self.sess.keep_alive = False  # keep_alive 属性已弃用
         self.cookies = cookies
@@ -109,6 +235,56 @@ class Client:
             for key, value in cookies.items():
                 self.sess.cookies.set(key, value)
 
+    @classmethod
+    def from_client(cls, client: "Client"):
+        """创建与已有客户端共享会话（cookies）的新客户端，用于同步/异步客户端互相转换"""
+        other = cls(
+            cookies={},
+            base_url=client.base_url,
+            school_name=client.school_name,
+            raspisanie=client.raspisanie,
+            ignore_type=client.ignore_type,
+            detail_category_type=client.detail_category_type,
+            timeout=client.timeout,
+        )
+        other.sess = client.sess
+        other.cookies = client.cookies
+        return other
+
+    def _send(self, request: UpstreamRequest):
+        """通过 requests 会话发送上游请求"""
+        return getattr(self.sess, request.method)(request.url, **request.kwargs)
+
+    def _send_all(self, requests_list):
+        """并发发送一组上游请求（最多 UPSTREAM_PARALLEL 个同时进行），按顺序返回响应或异常对象"""
+        def send(request):
+            try:
+                return self._send(request)
+            except Exception as e:
+                return e
+
+        if len(requests_list) <= 1:
+            return [send(request) for request in requests_list]
+        with ThreadPoolExecutor(max_workers=min(UPSTREAM_PARALLEL, len(requests_list))) as pool:
+            return list(pool.map(send, requests_list))
+
+    def _run_flow(self, flow):
+        """同步执行接口流程：依次发送流程产出的请求，并把响应（或异常）送回流程"""
+        try:
+            request = next(flow)
+            while True:
+                if isinstance(request, list):
+                    request = flow.send(self._send_all(request))
+                    continue
+                try:
+                    response = request.run() if isinstance(request, BlockingCall) else self._send(request)
+                except Exception as e:
+                    request = flow.throw(e)
+                else:
+                    request = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
     def get_school_url(self, url_type: str, fallback_path: Optional[str] = None, school_name: Optional[str] = None, base_url: Optional[str] = None) -> str:
         """
         获取学校功能URL，支持多种方式：
@@ -163,8 +339,13 @@ class Client:
         if cookies:
             self.sess.cookies.update(cookies)
 
-    def login(self, sid, password):
-        """登录教务系统"""
+    @upstream
+    def login(self, sid, password, kaptcha_binary=False):
+        """
+        登录教务系统
+        需要验证码时返回 1001；kaptcha_binary 为 True 时验证码图片以原始字节返回（kaptcha_bytes、kaptcha_type），
+        否则以 base64 返回（kaptcha_pic）
+        """
         print(f"开始登录流程:")
         print(f"  学号: {sid}")
         print(f"  密码长度: {len(password)}")
@@ -179,85 +360,39 @@ class Client:
         
         need_verify = False
         try:
-            # 步骤1: 访问登录页面
-            print(f"步骤1: 访问登录页面 {self.login_url}")
-            req_csrf = self.sess.get(self.login_url, timeout=self.timeout, verify=False)
-            
-            if req_csrf.status_code != 200:
-                print(f"登录页面访问失败，状态码: {req_csrf.status_code}")
-                return {"code": 2333, "msg": f"登录页面访问失败，状态码: {req_csrf.status_code}"}
-            
-            print(f"登录页面访问成功，内容长度: {len(req_csrf.text)}")
-            
-            # 解析CSRF令牌
-            print("步骤2: 解析CSRF token")
-            doc = pq(req_csrf.text)
-            csrf_token = doc("#csrftoken").attr("value")
-            
-            if not csrf_token:
-                print("CSRF token解析失败")
-                return {"code": 2333, "msg": "无法获取CSRF token"}
-            
-            print(f"CSRF token: {csrf_token}")
-            
-            # 缓存当前会话cookies
-            pre_cookies = self.sess.cookies.get_dict()
-            print(f"当前cookies: {pre_cookies}")
-            
-            # 获取公钥并加密密码
-            print(f"步骤3: 获取公钥 {self.key_url}")
-            req_pubkey = self.sess.get(self.key_url, timeout=self.timeout, verify=False)
-            
-            if req_pubkey.status_code != 200:
-                print(f"公钥获取失败，状态码: {req_pubkey.status_code}")
-                return {"code": 2333, "msg": f"公钥获取失败，状态码: {req_pubkey.status_code}"}
-            
-            try:
-                pubkey_data = req_pubkey.json()
-                print(f"公钥数据: {pubkey_data}")
-            except Exception as e:
-                print(f"公钥解析失败: {str(e)}")
-                return {"code": 2333, "msg": f"公钥解析失败: {str(e)}"}
-            
-            modulus = pubkey_data.get("modulus")
-            exponent = pubkey_data.get("exponent")
-            
-            if not modulus or not exponent:
-                return {"code": 2333, "msg": "公钥数据不完整"}
-            
-            # 步骤4: 检查是否需要验证码
-            print("步骤4: 检查验证码需求")
-            yzm_input = doc("input#yzm")
-            needs_captcha = str(yzm_input) != ""
-            print(f"需要验证码: {needs_captcha}")
-            
-            if needs_captcha:
-                print("需要验证码，获取验证码图片")
+            # 步骤1-4: 登录握手（登录页面，之后并发获取公钥与验证码）
+            print(f"步骤1: 登录握手 {self.login_url}")
+            handshake = yield from self.login_handshake.flow(self)
+            if handshake["code"] != 1000:
+                return handshake
+            state = handshake["data"]
+            timing = state["timing"]
+            csrf_token = state["csrf_token"]
+            modulus = state["modulus"]
+            exponent = state["exponent"]
+            cached_key = state["key_cached"]
+            print(f"CSRF token: {csrf_token}，需要验证码: {state['needs_captcha']}，使用缓存公钥: {cached_key}")
+            
+            if state["needs_captcha"]:
                 need_verify = True
+                print(f"验证码获取成功，大小: {len(state['kaptcha'])} bytes")
+                print(f"登录握手耗时: {timing}")
                 
-                req_kaptcha = self.sess.get(self.kaptcha_url, timeout=self.timeout, verify=False)
-                
-                if req_kaptcha.status_code != 200:
-                    print(f"验证码获取失败，状态码: {req_kaptcha.status_code}")
-                    return {"code": 2333, "msg": f"验证码获取失败，状态码: {req_kaptcha.status_code}"}
-                
-                kaptcha_pic = base64.b64encode(req_kaptcha.content).decode()
-                print(f"验证码获取成功，大小: {len(req_kaptcha.content)} bytes")
-                
-                return {
-                    "code": 1001,
-                    "msg": "获取验证码成功",
-                    "data": {
-                        "sid": sid,
-                        "csrf_token": csrf_token,
-                        "cookies": pre_cookies,
-                        "password": password,
-                        "modulus": modulus,
-                        "exponent": exponent,
-                        "kaptcha_pic": kaptcha_pic,
-                        "timestamp": time.time(),
-                    },
+                data = {
+                    "sid": sid,
+                    "csrf_token": csrf_token,
+                    "cookies": state["cookies"],
+                    "password": password,
+                    "modulus": modulus,
+                    "exponent": exponent,
+                    "timestamp": time.time(),
                 }
+                if kaptcha_binary:
+                    data["kaptcha_bytes"] = state["kaptcha"]
+                    data["kaptcha_type"] = state["kaptcha_type"]
+                else:
+                    data["kaptcha_pic"] = base64.b64encode(state["kaptcha"]).decode()
+                return {"code": 1001, "msg": "获取验证码成功", "data": data}
             
             # 步骤5: 不需要验证码，直接登录
             print("步骤5: 加密密码并登录")
@@ -282,15 +417,20 @@ class Client:
             if not self.login_url:
                 return {"code": 2333, "msg": "登录URL未设置，请检查base_url配置"}
                 
-            req_login = self.sess.post(
+            started = time.perf_counter()
+            req_login = yield UpstreamRequest(
+                "post",
                 self.login_url,
                 data=login_data,
                 timeout=self.timeout,
                 verify=False
             )
+            timing["login_ms"] = _elapsed_ms(started)
+            timing["total_ms"] = round(timing["handshake_ms"] + timing["login_ms"], 1)
             
             print(f"登录响应状态码: {req_login.status_code}")
             print(f"登录后cookies: {self.sess.cookies.get_dict()}")
+            print(f"登录耗时: {timing}")
             
             if req_login.status_code != 200:
                 return {"code": 2333, "msg": f"登录请求失败，状态码: {req_login.status_code}"}
@@ -305,6 +445,9 @@ class Client:
                 print(f"发现错误提示: {tip_text}")
                 
                 if "用户名或密码" in tip_text:
+                    if cached_key:
+                        # 不重试（每次失败都会计入教务系统的锁定次数），只让下次登录重新获取公钥
+                        pubkey_cache.invalidate(self.key_url)
                     return {"code": 1002, "msg": "用户名或密码不正确"}
                 return {"code": 998, "msg": tip_text}
             
@@ -324,7 +467,8 @@ class Client:
                 "debug": {
                     "content_length": content_length,
                     "has_tips": str(tips) != "",
-                    "cookies": self.sess.cookies.get_dict()
+                    "cookies": self.sess.cookies.get_dict(),
+                    "timing": timing,
                 }
             }
             
@@ -342,6 +486,177 @@ class Client:
             msg = "获取验证码时未记录的错误" if need_verify else "登录时未记录的错误"
             return {"code": 999, "msg": f"{msg}：{str(e)}"}
 
+    @upstream
+    def login_auto(self, sid, password, kaptcha_binary=False):
+        """
+        登录教务系统，需要验证码时先尝试离线识别并自动提交；
+        没有该学校的验证码模板、置信度不足或多次识别错误时，返回需要手动输入验证码的结果（1001），
+        验证码图片的返回形式与 login 的 kaptcha_binary 参数相同
+        """
+        result = yield from self.login.flow(self, sid, password, True)
+        if result.get("code") == 1001:
+            result = yield from self._auto_kaptcha(sid, password, result)
+            if result.get("code") == 1001 and not kaptcha_binary:
+                data = result["data"]
+                data["kaptcha_pic"] = base64.b64encode(data.pop("kaptcha_bytes")).decode()
+                data.pop("kaptcha_type", None)
+        return result
+
+    def _auto_kaptcha(self, sid, password, result):
+        """自动识别验证码并提交（login_auto 的子流程），参数 result 为 login 返回的 1001 结果（图片为原始字节）"""
+        if captcha_solver is None or CAPTCHA_AUTO_ATTEMPTS == 0:
+            return result
+        school_config = school_config_manager.get_school_config(self.school_name) if school_config_manager else None
+        school_code = (school_config or {}).get("school_code")
+        templates = yield BlockingCall(captcha_solver.templates, school_code)
+        if templates is None:
+            return result
+
+        attempt = 0
+        while True:
+            attempt += 1
+            data = result["data"]
+            # 识别为纯 CPU 计算（数毫秒），异步客户端在线程池中执行
+            solved = yield BlockingCall(captcha_solver.solve, data["kaptcha_bytes"], school_code)
+            if not solved:
+                data["auto_captcha"] = {"attempts": attempt - 1, "reason": "low_confidence"}
+                return result
+            print(f"自动识别验证码: {solved['text']}，置信度: {solved['confidence']}，耗时: {solved['elapsed_ms']} ms")
+            login_result = yield from self.login_with_kaptcha.flow(
+                self, sid, data["csrf_token"], {}, password, data["modulus"], data["exponent"], solved["text"]
+            )
+            if login_result.get("code") != 1004:
+                if login_result.get("code") in CAPTCHA_ACCEPTED_CODES:
+                    captcha_solver.report(True)
+                if login_result.get("code") == 1000:
+                    login_result["data"]["auto_captcha"] = {"attempts": attempt, "confidence": solved["confidence"]}
+                return login_result
+            captcha_solver.report(False)
+            # 识别错误：重新握手获取新的验证码
+            result = yield from self.login.flow(self, sid, password, True)
+            if result.get("code") != 1001:
+                return result
+            if attempt >= CAPTCHA_AUTO_ATTEMPTS:
+                result["data"]["auto_captcha"] = {"attempts": attempt, "reason": "wrong"}
+                return result
+
+    @upstream
+    def login_handshake(self, with_captcha: Optional[bool] = None):
+        """
+        登录握手：先访问登录页面（建立会话 cookie 并取得 CSRF token），
+        再在同一会话上并发获取公钥（未缓存时）与验证码，两者都不依赖 CSRF token
+        参数:
+            with_captcha: True 总是获取验证码，False 不获取，None 按登录页面是否有验证码输入框决定
+        返回:
+            dict: data 为 {"csrf_token", "cookies", "modulus", "exponent", "key_cached",
+                  "needs_captcha", "kaptcha"（验证码图片字节，未获取时为 None）, "kaptcha_type", "timing"}
+        """
+        if not self.login_url or not self.key_url or not self.kaptcha_url:
+            return {"code": 2333, "msg": "学校配置不完整，无法获取登录、公钥或验证码URL"}
+        
+        timing = {}
+        started = time.perf_counter()
+        req_csrf = yield UpstreamRequest("get", self.login_url, timeout=self.timeout, verify=False)
+        timing["login_page_ms"] = _elapsed_ms(started)
+        
+        if req_csrf.status_code != 200:
+            print(f"登录页面访问失败，状态码: {req_csrf.status_code}")
+            return {"code": 2333, "msg": f"登录页面访问失败，状态码: {req_csrf.status_code}"}
+        
+        doc = pq(req_csrf.text)
+        csrf_token = doc("#csrftoken").attr("value")
+        if not csrf_token:
+            print("CSRF token解析失败")
+            return {"code": 2333, "msg": "无法获取CSRF token"}
+        
+        needs_captcha = str(doc("input#yzm")) != ""
+        fetch_captcha = needs_captcha if with_captcha is None else with_captcha
+        # 默认总是获取本会话的公钥（部分学校的密钥对保存在服务端会话中，使用其他会话的公钥无法解密）；
+        # 只有配置了 static_public_key 的学校在不需要验证码时使用缓存公钥，需要验证码时与验证码并发获取，不增加往返
+        cached_key = None
+        if not fetch_captcha and school_config_manager and school_config_manager.static_public_key(self.school_name):
+            cached_key = pubkey_cache.current(self.key_url)
+        
+        batch = []
+        if not cached_key:
+            batch.append(UpstreamRequest("get", self.key_url, timeout=self.timeout, verify=False))
+        if fetch_captcha:
+            batch.append(UpstreamRequest("get", self.kaptcha_url, timeout=self.timeout, verify=False))
+        
+        responses = []
+        if batch:
+            started = time.perf_counter()
+            responses = yield batch
+            timing["parallel_ms"] = _elapsed_ms(started)
+            for response in responses:
+                if isinstance(response, Exception):
+                    raise response
+        
+        if cached_key:
+            modulus, exponent = cached_key
+        else:
+            req_pubkey = responses.pop(0)
+            timing["public_key_ms"] = _response_ms(req_pubkey)
+            key_result = self._parse_public_key(req_pubkey)
+            if key_result["code"] != 1000:
+                return key_result
+            modulus = key_result["data"]["modulus"]
+            exponent = key_result["data"]["exponent"]
+        
+        kaptcha = None
+        kaptcha_type = None
+        if fetch_captcha:
+            req_kaptcha = responses.pop(0)
+            timing["kaptcha_ms"] = _response_ms(req_kaptcha)
+            if req_kaptcha.status_code != 200:
+                print(f"验证码获取失败，状态码: {req_kaptcha.status_code}")
+                return {"code": 2333, "msg": f"验证码获取失败，状态码: {req_kaptcha.status_code}"}
+            kaptcha = req_kaptcha.content
+            kaptcha_type = req_kaptcha.headers.get("Content-Type", "").split(";")[0].strip()
+            if not kaptcha_type.startswith("image/"):
+                # kaptcha 默认输出 JPEG
+                kaptcha_type = "image/jpeg"
+        
+        timing["handshake_ms"] = round(timing["login_page_ms"] + timing.get("parallel_ms", 0), 1)
+        return {
+            "code": 1000,
+            "msg": "登录握手成功",
+            "data": {
+                "csrf_token": csrf_token,
+                "cookies": self.sess.cookies.get_dict(),
+                "modulus": modulus,
+                "exponent": exponent,
+                "key_cached": bool(cached_key),
+                "needs_captcha": needs_captcha,
+                "kaptcha": kaptcha,
+                "kaptcha_type": kaptcha_type,
+                "timing": timing,
+            },
+        }
+
+    def _parse_public_key(self, req_pubkey):
+        """解析公钥响应并记录到公钥缓存"""
+        if req_pubkey.status_code != 200:
+            print(f"公钥获取失败，状态码: {req_pubkey.status_code}")
+            return {"code": 2333, "msg": f"公钥获取失败，状态码: {req_pubkey.status_code}"}
+        
+        try:
+            pubkey_data = req_pubkey.json()
+            print(f"公钥数据: {pubkey_data}")
+        except Exception as e:
+            print(f"公钥解析失败: {str(e)}")
+            return {"code": 2333, "msg": f"公钥解析失败: {str(e)}"}
+        
+        modulus = pubkey_data.get("modulus")
+        exponent = pubkey_data.get("exponent")
+        
+        if not modulus or not exponent:
+            return {"code": 2333, "msg": "公钥数据不完整"}
+        
+        rotated = pubkey_cache.observe(self.key_url, modulus, exponent)
+        return {"code": 1000, "msg": "获取公钥成功", "data": {"modulus": modulus, "exponent": exponent, "rotated": rotated}}
+
+    @upstream
     def login_with_kaptcha(
         self, sid, csrf_token, cookies, password, modulus, exponent, kaptcha, **kwargs
     ):
@@ -370,7 +685,8 @@ class Client:
             print(f"验证码登录数据: {login_data}")
             
             # 执行登录
-            req_login = self.sess.post(
+            req_login = yield UpstreamRequest(
+                "post",
                 self.login_url,
                 data=login_data,
                 cookies=cookies,
@@ -436,6 +752,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"验证码登录未知错误: {str(e)}"}
 
+    @upstream
     def get_info(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取个人信息"""
         try:
@@ -444,7 +761,8 @@ class Client:
             return {"code": 2333, "msg": str(e)}
             
         try:
-            req_info = self.sess.get(
+            req_info = yield UpstreamRequest(
+                "get",
                 url,
                 headers=self.headers,
                 timeout=self.timeout,
@@ -452,17 +770,16 @@ class Client:
             )
             if req_info.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_info.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_info):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}              # 检查是否返回了错误页面（比如"无功能权限"）
             if "无功能权限" in req_info.text or "错误提示" in req_info.text:
                 print("主要个人信息接口返回权限错误，尝试使用备选接口")
-                return self._get_info(school_name, base_url)
+                return (yield from self._get_info.flow(self, school_name, base_url))
               # 解析JSON响应
             try:
                 info = req_info.json()
                 if info is None:
-                    return self._get_info(school_name, base_url)
+                    return (yield from self._get_info.flow(self, school_name, base_url))
                 result = {
                     "sid": info.get("xh"),
                     "name": info.get("xm"),
@@ -487,7 +804,7 @@ class Client:
             except json.decoder.JSONDecodeError:
                 # JSON解析失败，可能返回的是HTML页面，使用备选方法
                 print("主要个人信息接口JSON解析失败，尝试使用备选接口")
-                return self._get_info(school_name, base_url)
+                return (yield from self._get_info.flow(self, school_name, base_url))
         except exceptions.Timeout:
             return {"code": 1003, "msg": "获取个人信息超时"}
         except (
@@ -501,6 +818,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取个人信息时未记录的错误：" + str(e)}
 
+    @upstream
     def _get_info(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取个人信息"""
         try:
@@ -510,14 +828,15 @@ class Client:
             fallback_base = base_url or self.base_url or ""
             url = urljoin(fallback_base, "xsxxxggl/xsgrxxwh_cxXsgrxx.html?gnmkdm=N100801")
         try:
-            req_info = self.sess.get(
+            req_info = yield UpstreamRequest(
+                "get",
                 url, headers=self.headers, timeout=self.timeout, verify=False
             )
             if req_info.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_info.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_info):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
+            doc = pq(req_info.text)
             pending_result = {}
             # 学生基本信息
             for ul_item in doc.find("div.col-sm-6").items():
@@ -599,7 +918,8 @@ class Client:
                     self.base_url or '',
                     "xszbbgl/xszbbgl_cxXszbbsqIndex.html?doType=details&gnmkdm=N106005",
                 )
-                _req_info = self.sess.post(
+                _req_info = yield UpstreamRequest(
+                    "post",
                     _url,
                     headers=self.headers,
                     timeout=self.timeout,
@@ -645,6 +965,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取个人信息时未记录的错误：" + str(e)}
 
+    @upstream
     def get_grade(self, year, term = 0, use_personal_info: bool = False, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """
         获取成绩
@@ -756,7 +1077,8 @@ class Client:
             print(f"成绩查询 - 数据: {data}")
             print(f"成绩查询 - Headers: {grade_headers}")
             
-            req_grade = self.sess.post(
+            req_grade = yield UpstreamRequest(
+                "post",
                 url,
                 headers=grade_headers,
                 data=data,
@@ -771,8 +1093,7 @@ class Client:
             if req_grade.status_code != 200:
                 return {"code": 2333, "msg": f"教务系统服务异常，状态码: {req_grade.status_code}"}
             
-            doc = pq(req_grade.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_grade):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             
             # 解析JSON响应
@@ -827,6 +1148,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取成绩时未记录的错误：" + str(e)}
 
+    @upstream
     def get_grade_detail(self, year: int, term: int = 0, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """
         获取详细成绩（含平时分、期末分等细节）
@@ -835,6 +1157,8 @@ class Client:
             term: 学期，1-第一学期，2-第二学期，0-全学年
             school_name: 学校名称（可选）
             base_url: 基础URL（可选）
+        返回:
+            dict: 按教学班合并后的成绩，超过一页时自动并发获取剩余页
         """
         try:
             # 从配置获取详细成绩查询URL
@@ -866,7 +1190,7 @@ class Client:
             "xqm": term_param,  # 学期数，第一学期为3，第二学期为12, 全学年为空''
             "_search": "false",
             "nd": int(time.time() * 1000),
-            "queryModel.showCount": "100",  # 每页最多条数
+            "queryModel.showCount": str(GRADE_DETAIL_PAGE_SIZE),  # 每页最多条数
             "queryModel.currentPage": "1",
             "queryModel.sortName": "",
             "queryModel.sortOrder": "asc",
@@ -909,41 +1233,50 @@ class Client:
         try:
             print(f"详细成绩查询 - URL: {url}")
             print(f"详细成绩查询 - 数据: {data}")
-            
-            req_grade = self.sess.post(
+
+            req_grade = yield UpstreamRequest(
+                "post",
                 url,
                 headers=detail_headers,
                 data=data,
                 timeout=self.timeout,
                 verify=False,
             )
-            
-            print(f"详细成绩查询 - 响应状态码: {req_grade.status_code}")
-            
-            if req_grade.status_code != 200:
-                return {"code": 2333, "msg": f"教务系统响应异常，状态码: {req_grade.status_code}"}
-            
-            # 检查是否被重定向到登录页面
-            doc = pq(req_grade.text)
-            if doc("h5").text() == "用户登录":
-                return {"code": 1013, "msg": "登录过期，请重新登录"}
-            
-            # 解析JSON响应
-            try:
-                grade_response = req_grade.json()
-                print(f"详细成绩查询 - JSON解析成功")
-            except json.JSONDecodeError as json_err:
-                print(f"详细成绩查询 - JSON解析失败: {json_err}")
-                print(f"详细成绩查询 - 原始响应前500字符: {req_grade.text[:500]}")
-                return {"code": 2333, "msg": f"响应格式错误: {str(json_err)}"}
-            
-            # 检查是否有数据
-            if not grade_response.get("items"):
+            first_page = self._parse_grade_detail_page(req_grade)
+            if "code" in first_page:
+                return first_page
+
+            # 第一页给出总页数，其余页并发获取
+            items = list(first_page["items"])
+            total_pages = min(first_page["total_pages"], GRADE_DETAIL_MAX_PAGES)
+            if total_pages > 1:
+                print(f"详细成绩查询 - 共 {total_pages} 页，并发获取剩余页")
+                responses = yield [
+                    UpstreamRequest(
+                        "post",
+                        url,
+                        headers=detail_headers,
+                        data=dict(data, **{"queryModel.currentPage": str(page), "nd": int(time.time() * 1000)}),
+                        timeout=self.timeout,
+                        verify=False,
+                    )
+                    for page in range(2, total_pages + 1)
+                ]
+                for response in responses:
+                    if isinstance(response, Exception):
+                        raise response
+                    page = self._parse_grade_detail_page(response)
+                    if "code" in page:
+                        return page
+                    items.extend(page["items"])
+
+            if not items:
                 return {"code": 1005, "msg": "获取内容为空"}
-            
-            # 返回原始响应数据
-            return {"code": 1000, "msg": "获取详细成绩成功", "data": grade_response}
-            
+
+            result = self._normalize_grade_detail(items, year, term)
+            result["total"] = max(first_page["total"], len(items))
+            return {"code": 1000, "msg": "获取详细成绩成功", "data": result}
+
         except exceptions.Timeout:
             return {"code": 1003, "msg": "获取详细成绩超时"}
         except exceptions.RequestException:
@@ -953,6 +1286,64 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取详细成绩时未记录的错误：" + str(e)}
 
+    @staticmethod
+    def _parse_grade_detail_page(response):
+        """
+        解析详细成绩的一页响应
+        返回:
+            dict: {"items", "total", "total_pages"}；响应异常时返回错误结果字典（含 code）
+        """
+        print(f"详细成绩查询 - 响应状态码: {response.status_code}")
+        if response.status_code != 200:
+            return {"code": 2333, "msg": f"教务系统响应异常，状态码: {response.status_code}"}
+
+        # 检查是否被重定向到登录页面
+        if is_login_page(response):
+            return {"code": 1013, "msg": "登录过期，请重新登录"}
+
+        try:
+            page = response.json()
+        except json.JSONDecodeError as json_err:
+            print(f"详细成绩查询 - JSON解析失败: {json_err}")
+            print(f"详细成绩查询 - 原始响应前500字符: {response.text[:500]}")
+            return {"code": 2333, "msg": f"响应格式错误: {str(json_err)}"}
+
+        items = page.get("items") or []
+        try:
+            total = int(page.get("totalResult") or len(items))
+            total_pages = int(page.get("totalPage") or 1)
+        except (TypeError, ValueError):
+            total, total_pages = len(items), 1
+        return {"items": items, "total": total, "total_pages": max(1, total_pages)}
+
+    def _normalize_grade_detail(self, items, year: int, term: int):
+        """将详细成绩的原始记录按教学班合并：每门课程一条，成绩项目（平时、期末、总评等）放在 items 中"""
+        courses = {}
+        for i in items:
+            key = i.get("jxb_id") or i.get("kch_id") or i.get("kcmc")
+            course = courses.get(key)
+            if course is None:
+                course = courses[key] = {
+                    "course_id": i.get("kch_id"),
+                    "title": i.get("kcmc"),
+                    "class_name": i.get("jxbmc"),
+                    "credit": self.align_floats(i.get("xf")),
+                    "start_college": i.get("kkbmmc"),
+                    "year": i.get("xnmmc"),
+                    "term": i.get("xqmmc"),
+                    "items": [],
+                }
+            course["items"].append({"name": i.get("xmblmc"), "score": i.get("xmcj")})
+        return {
+            "sid": items[0].get("xh"),
+            "name": items[0].get("xm"),
+            "year": year,
+            "term": term,
+            "count": len(items),
+            "courses": list(courses.values()),
+        }
+
+    @upstream
     def get_exam_schedule(self, year: int, term: int = 0, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取考试信息"""
         try:
@@ -984,7 +1375,8 @@ class Client:
             print(f"考试查询 - URL: {url}")
             print(f"考试查询 - 数据: {data}")
             
-            req_grade = self.sess.post(
+            req_grade = yield UpstreamRequest(
+                "post",
                 url,
                 headers=self.headers,
                 data=data,
@@ -997,8 +1389,7 @@ class Client:
             
             if req_grade.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_grade.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_grade):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             
             # 解析JSON响应
@@ -1055,6 +1446,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取考试信息时未记录的错误：" + str(e)}
 
+    @upstream
     def get_schedule(self, year: int, term: int, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取课程表信息"""
         try:
@@ -1077,7 +1469,7 @@ class Client:
                 'Upgrade-Insecure-Requests': '1'
             })
             
-            index_response = self.sess.get(index_url, headers=index_headers, timeout=self.timeout, verify=False)
+            index_response = yield UpstreamRequest("get", index_url, headers=index_headers, timeout=self.timeout, verify=False)
             if index_response.status_code != 200:
                 return {"code": 2333, "msg": f"无法访问课表首页，状态码: {index_response.status_code}"}
                   
@@ -1107,7 +1499,8 @@ class Client:
                 'Pragma': 'no-cache'
             })
             
-            req_schedule = self.sess.post(
+            req_schedule = yield UpstreamRequest(
+                "post",
                 url,
                 headers=headers,
                 data=data,
@@ -1116,8 +1509,7 @@ class Client:
             )
             if req_schedule.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_schedule.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_schedule):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             schedule = req_schedule.json()
             if not schedule.get("kbList"):
@@ -1139,8 +1531,10 @@ class Client:
                         "time": self.display_course_time(i.get("jc")),
                         "sessions": i.get("jc"),
                         "list_sessions": self.list_sessions(i.get("jc")),
+                        "sessions_mask": sessions_mask(i.get("jc")),
                         "weeks": i.get("zcd"),
                         "list_weeks": self.list_weeks(i.get("zcd")),
+                        "weeks_mask": weeks_mask(i.get("zcd")),
                         "evaluation_mode": i.get("khfsmc"),
                         "campus": i.get("xqmc"),
                         "place": i.get("cdmc"),
@@ -1167,417 +1561,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取课表时未记录的错误：" + str(e)}
 
-    #def get_academia(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
-        """获取学业生涯情况"""
-        try:
-            url_main = self.get_school_url("academia", "xsxy/xsxyqk_cxXsxyqkIndex.html?gnmkdm=N105515&layout=default", school_name, base_url)
-        except ValueError as e:
-            return {"code": 2333, "msg": str(e)}
-        try:
-            url_info = self.get_school_url("academia_info", "xsxy/xsxyqk_cxJxzxjhxfyqKcxx.html?gnmkdm=N105515", school_name, base_url)
-        except ValueError as e:
-            return {"code": 2333, "msg": str(e)}
-        try:
-            req_main = self.sess.get(
-                url_main,
-                headers=self.headers,
-                timeout=self.timeout,
-                stream=True,
-                verify=False,
-            )
-            if req_main.status_code != 200:
-                return {"code": 2333, "msg": "教务系统服务异常"}
-            doc_main = pq(req_main.text)
-            if doc_main("h5").text() == "用户登录":
-                return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
-            if str(doc_main("div.alert-danger")) != "":
-                return {"code": 998, "msg": doc_main("div.alert-danger").text()}
-            sid = doc_main("form#form input#xh_id").attr("value")
-            display_statistics = (
-                doc_main("div#alertBox").text().replace(" ", "").replace("\n", "")
-            )
-            sid = doc_main("input#xh_id").attr("value")
-            statistics = self.get_academia_statistics(display_statistics)
-            type_statistics = self.get_academia_type_statistics(req_main.text)
-            details = {}
-            for type in type_statistics.keys():
-                details[type] = self.sess.post(
-                    url_info,
-                    headers=self.headers,
-                    data={"xfyqjd_id": type_statistics[type]["id"]},
-                    timeout=self.timeout,
-                    verify=False,
-                    stream=True,
-                ).json()
-            result = {
-                "sid": sid,
-                "statistics": statistics,
-                "details": [
-                    {
-                        "type": type,
-                        "credits": type_statistics[type]["credits"],
-                        "courses": [
-                            {
-                                "course_id": i.get("KCH"),
-                                "title": i.get("KCMC"),
-                                "situation": self.parse_int(i.get("XDZT")),
-                                "display_term": self.get_display_term(
-                                    sid, i.get("JYXDXNM"), i.get("JYXDXQMC")
-                                ),
-                                "credit": self.align_floats(i.get("XF")),
-                                "category": self.get_course_category(type, i),
-                                "nature": i.get("KCXZMC"),
-                                "max_grade": self.parse_int(i.get("MAXCJ")),
-                                "grade_point": self.align_floats(i.get("JD")),
-                            }
-                            for i in details[type]
-                        ],
-                    }
-                    for type in type_statistics.keys()
-                    if len(details[type]) > 0
-                ],
-            }
-            return {"code": 1000, "msg": "获取学业情况成功", "data": result}
-        except exceptions.Timeout:
-            return {"code": 1003, "msg": "获取学业情况超时"}
-        except (
-            exceptions.RequestException,
-            json.decoder.JSONDecodeError,
-            AttributeError,
-        ):
-            traceback.print_exc()
-            return {"code": 2333, "msg": "服务请求失败，可能是系统维护或接口异常"}
-        except Exception as e:
-            traceback.print_exc()
-            return {"code": 999, "msg": "获取学业情况时未记录的错误：" + str(e)}
-
-    #def get_academia_pdf(self):
-        """获取学业生涯（学生成绩总表）pdf"""
-        url_view = urljoin(self.base_url, "bysxxcx/xscjzbdy_dyXscjzbView.html")
-        url_window = urljoin(self.base_url, "bysxxcx/xscjzbdy_dyCjdyszxView.html")
-        url_policy = urljoin(self.base_url, "xtgl/bysxxcx/xscjzbdy_cxXsCount.html")
-        url_filetype = urljoin(self.base_url, "bysxxcx/xscjzbdy_cxGswjlx.html")
-        url_common = urljoin(self.base_url, "common/common_cxJwxtxx.html")
-        url_file = urljoin(self.base_url, "bysxxcx/xscjzbdy_dyList.html")
-        url_progress = urljoin(self.base_url, "xtgl/progress_cxProgressStatus.html")
-        data = {
-            "gsdygx": "10628-zw-mrgs",
-            "ids": "",
-            "bdykcxzDms": "",
-            "cytjkcxzDms": "",
-            "cytjkclbDms": "",
-            "cytjkcgsDms": "",
-            "bjgbdykcxzDms": "",
-            "bjgbdyxxkcxzDms": "",
-            "djksxmDms": "",
-            "cjbzmcDms": "",
-            "cjdySzxs": "",
-            "wjlx": "pdf",
-        }
-
-        try:
-            data_view = {"time": str(round(time.time() * 1000)), "gnmkdm": "N558020"}
-            data_params = data_view
-            del data_params["time"]
-            # View接口
-            req_view = self.sess.post(
-                url_view,
-                headers=self.headers,
-                data=data_view,
-                params=data_view,
-                timeout=self.timeout,
-                verify=False,
-            )
-            if req_view.status_code != 200:
-                return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_view.text)
-            if doc("h5").text() == "用户登录":
-                return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
-            # Window接口
-            data_window = {"xh": ""}
-            self.sess.post(
-                url_window,
-                headers=self.headers,
-                data=data_window,
-                params=data_params,
-                timeout=self.timeout,
-                verify=False,
-            )
-            # 许可接口
-            data_policy = data
-            del data_policy["wjlx"]
-            self.sess.post(
-                url_policy,
-                headers=self.headers,
-                data=data_policy,
-                params=data_params,
-                timeout=self.timeout,
-                verify=False,
-            )
-            # 文件类型接口
-            data_filetype = data_policy
-            self.sess.post(
-                url_filetype,
-                headers=self.headers,
-                data=data_filetype,
-                params=data_params,
-                timeout=self.timeout,
-            )
-            # Common接口
-            self.sess.post(
-                url_common,
-                headers=self.headers,
-                data=data_params,
-                params=data_params,
-                timeout=self.timeout,
-            )
-            # 获取PDF文件URL
-            req_file = self.sess.post(
-                url_file,
-                headers=self.headers,
-                data=data,
-                params=data_params,
-                timeout=self.timeout,
-                verify=False,
-            )
-            doc = pq(req_file.text)
-            if "错误" in doc("title").text():
-                error = doc("p.error_title").text()
-                return {"code": 998, "msg": error}
-            # 调用进度查询接口
-            data_progress = {
-                "key": "score_print_processed",
-                "gnmkdm": "N558020",
-            }
-            self.sess.post(
-                url_progress,
-                headers=self.headers,
-                data=data_progress,
-                params=data_progress,
-                timeout=self.timeout,
-                verify=False,
-            )
-            # 生成PDF文件URL
-            pdf = (
-                req_file.text.replace("#成功", "")
-                .replace('"', "")
-                .replace("/", "\\")
-                .replace("\\\\", "/")
-            )
-            # 下载PDF文件
-            req_pdf = self.sess.get(
-                urljoin(self.base_url, pdf),
-                headers=self.headers,
-                timeout=self.timeout + 2,
-            )
-            result = req_pdf.content  # PDF文件二进制数据
-            return {"code": 1000, "msg": "获取学生成绩总表pdf成功", "data": result}
-        except exceptions.Timeout:
-            return {"code": 1003, "msg": "获取成绩总表pdf超时"}
-        except (
-            exceptions.RequestException,
-            json.decoder.JSONDecodeError,
-            AttributeError,
-        ):
-            traceback.print_exc()
-            return {"code": 2333, "msg": "服务请求失败，可能是系统维护或接口异常"}
-        except Exception as e:
-            traceback.print_exc()
-            return {"code": 999, "msg": "获取成绩总表pdf时未记录的错误：" + str(e)}
-
-    #def get_schedule_pdf(self, year: int, term: int, name: str = "导出", student_id: str = "", school_name: Optional[str] = None, base_url: Optional[str] = None):
-        """获取课表PDF"""
-        try:
-            # 使用配置获取schedule_pdf URL，这就是你提供的 kbdy/bjkbdy_cxXnxqsfkz.html 地址
-            url = self.get_school_url("schedule_pdf", None, school_name, base_url)
-        except ValueError as e:
-            return {"code": 2333, "msg": str(e)}
-            
-        origin_term = term
-        term = term**2 * 3
-        
-        # 构建课表查询表单数据
-        data = {
-            "xnm": str(year),
-            "xqm": str(term),
-            "xnmc": f"{year}-{year + 1}",
-            "xqmmc": str(origin_term),
-            "xm": name,  # 学生姓名
-            "xxdm": "",
-            "xszd.sj": "true",       # 时间显示配置
-            "xszd.cd": "true",       # 显示场地
-            "xszd.js": "true",       # 显示教师
-            "xszd.jszc": "false",    # 教师职称
-            "xszd.jxb": "false",     # 教学班
-            "xszd.jxbzc": "true",    # 教学班组成
-            "xszd.xkbz": "false",    # 选课备注
-            "xszd.kcxszc": "false",  # 课程学时组成显示配置
-            "xszd.zhxs": "false",    # 总学时显示配置
-            "xszd.zxs": "false",     # 周学时
-            "xszd.khfs": "false",    # 考核方式
-            "xszd.ksfs": "false",    # 考试方式
-            "xszd.xf": "false",      # 学分
-            "xszd.skfsmc": "false",  # 上课方式名称
-            "xszd.zfj": "false",     # 主副教师
-            "xszd.cxbj": "false",    # 重修班级
-            "xszd.kcxz": "false",    # 课程性质
-            "xszd.kcbj": "false",    # 课程备注
-            "xszd.kczxs": "false",   # 课程总学时
-            "xsdm": "",              # 学生代码
-            "kclbdm": "",            # 课程类别代码
-            "kzlx": "dy"             # 控制类型：打印
-        }
-        
-        # 如果提供了学生ID，添加modelList数据（根据你的示例）
-        if student_id:
-            data.update({
-                f"modelList[0].xnm": str(year),
-                f"modelList[0].xqm": str(term),
-                f"modelList[0].xnmc": f"{year}-{year + 1}",
-                f"modelList[0].xqmmc": str(origin_term),
-                f"modelList[0].xh_id": student_id,
-                f"modelList[0].xh": student_id,
-                f"modelList[0].xm": name,
-                f"modelList[0].bjmc": "",        # 班级名称，可以从其他接口获取或留空
-                f"modelList[0].xsdm": "",        # 学生代码
-                f"modelList[0].kclbdm": "",      # 课程类别代码
-            })
-
-        try:
-            # 构建请求头
-            headers = self.headers.copy()
-            headers.update({
-                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.8,en-US;q=0.5,en;q=0.3',
-            })
-            
-            # 发送请求
-            response = self.sess.post(
-                url,
-                headers=headers,
-                data=data,
-                timeout=self.timeout,
-            )
-            
-            if response.status_code != 200:
-                return {"code": 2333, "msg": f"请求失败，状态码: {response.status_code}"}
-            
-            # 检查是否被重定向到登录页
-            doc = pq(response.text)
-            if doc("h5").text() == "用户登录":
-                return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
-              # 检查响应内容类型
-            content_type = response.headers.get('Content-Type', '')
-            
-            # 根据真实请求分析，响应是JSON格式
-            if 'json' in content_type.lower():
-                try:
-                    json_response = response.json()
-                    print(f"PDF导出JSON响应: {json_response}")
-                    
-                    # 检查JSON响应结构，可能包含PDF下载链接或状态
-                    if isinstance(json_response, dict):
-                        # 如果有错误信息
-                        if 'error' in json_response or 'msg' in json_response:
-                            error_msg = json_response.get('msg') or json_response.get('error') or "PDF生成失败"
-                            return {"code": 998, "msg": f"服务器错误: {error_msg}"}
-                        
-                        # 如果有PDF链接
-                        if 'url' in json_response or 'link' in json_response or 'data' in json_response:
-                            pdf_link = json_response.get('url') or json_response.get('link') or json_response.get('data')
-                            if pdf_link:
-                                # 构建PDF下载链接
-                                if pdf_link.startswith('http'):
-                                    full_pdf_url = pdf_link
-                                else:
-                                    # 相对链接，需要拼接base_url
-                                    base_domain = url.split('/')[0] + '//' + url.split('/')[2]
-                                    full_pdf_url = urljoin(base_domain, pdf_link)
-                                
-                                print(f"PDF下载链接: {full_pdf_url}")
-                                
-                                # 下载实际的PDF文件
-                                try:
-                                    pdf_response = self.sess.get(full_pdf_url, headers=self.headers, timeout=self.timeout, verify=False)
-                                    if pdf_response.status_code == 200:
-                                        if pdf_response.content.startswith(b'%PDF') or 'pdf' in pdf_response.headers.get('Content-Type', '').lower():
-                                            return {
-                                                "code": 1000,
-                                                "msg": "获取课程表PDF成功",
-                                                "data": pdf_response.content,
-                                                "content_type": "application/pdf",
-                                                "pdf_url": full_pdf_url
-                                            }
-                                        else:
-                                            return {"code": 998, "msg": "PDF链接返回的不是有效的PDF文件"}
-                                    else:
-                                        return {"code": 998, "msg": f"PDF下载失败，状态码: {pdf_response.status_code}"}
-                                except Exception as pdf_e:
-                                    return {"code": 998, "msg": f"PDF下载异常: {str(pdf_e)}"}
-                        
-                        # JSON响应不包含明确的链接时，返回原始响应
-                        return {
-                            "code": 998,
-                            "msg": "JSON响应格式未知，请检查服务器返回",
-                            "debug_response": json_response
-                        }
-                    else:
-                        # 非字典格式的JSON，可能是字符串或其他格式
-                        return {
-                            "code": 998,
-                            "msg": f"意外的JSON响应格式: {type(json_response)}",
-                            "debug_response": json_response
-                        }
-                        
-                except json.decoder.JSONDecodeError:
-                    # JSON解析失败，按文本处理
-                    return {"code": 998, "msg": f"JSON解析失败，响应内容: {response.text[:200]}"}
-            
-            elif 'pdf' in content_type.lower():
-                # 直接返回PDF内容（如果真的是PDF）
-                return {
-                    "code": 1000, 
-                    "msg": "获取课程表PDF成功", 
-                    "data": response.content, 
-                    "content_type": "application/pdf"
-                }
-            elif 'html' in content_type.lower():
-                # HTML页面，检查是否有错误信息
-                if "错误" in response.text or "error" in response.text.lower():
-                    error_msg = doc("p.error_title").text() or doc(".alert").text() or "PDF生成失败"
-                    return {"code": 998, "msg": error_msg}
-                else:
-                    return {"code": 998, "msg": "服务器返回HTML内容，请检查参数或登录状态"}
-            else:
-                # 其他格式，尝试作为PDF处理
-                if len(response.content) > 100 and response.content.startswith(b'%PDF'):
-                    return {
-                        "code": 1000, 
-                        "msg": "获取课程表PDF成功", 
-                        "data": response.content, 
-                        "content_type": "application/pdf"
-                    }
-                else:
-                    return {
-                        "code": 998, 
-                        "msg": f"未知的响应格式，Content-Type: {content_type}，响应长度: {len(response.content)}",
-                        "debug_response": response.text[:200] if response.text else "无文本内容"
-                    }
-                
-        except exceptions.Timeout:
-            return {"code": 1003, "msg": "获取课程表PDF超时"}
-        except (
-            exceptions.RequestException,
-            json.decoder.JSONDecodeError,
-            AttributeError,
-        ):
-            traceback.print_exc()
-            return {"code": 2333, "msg": "服务请求失败，可能是系统维护或接口异常"}
-        except Exception as e:
-            traceback.print_exc()
-            return {"code": 999, "msg": f"获取课程表PDF时未记录的错误：{str(e)}"}
-
+    @upstream
     def get_notifications(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取通知消息"""
         try:
@@ -1640,7 +1624,8 @@ class Client:
             print(f"通知消息查询 - 数据: {data}")
             print(f"通知消息查询 - Headers: {notification_headers}")
             
-            req_notification = self.sess.post(
+            req_notification = yield UpstreamRequest(
+                "post",
                 url,
                 headers=notification_headers,
                 data=data,
@@ -1655,8 +1640,7 @@ class Client:
             if req_notification.status_code != 200:
                 return {"code": 2333, "msg": f"教务系统服务异常，状态码: {req_notification.status_code}"}
             
-            doc = pq(req_notification.text)
-            if doc("h5").text() == "用户登录" or "错误" in doc("title").text():
+            if triage(req_notification) in (RESPONSE_LOGIN, RESPONSE_ERROR):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             
             # 解析JSON响应
@@ -1690,6 +1674,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取消息时未记录的错误：" + str(e)}
 
+    @upstream
     def get_selected_courses(self, year: int, term: int, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取已选课程信息"""
         try:
@@ -1716,7 +1701,8 @@ class Client:
                 "xkly": "0"
             }
             
-            req_selected = self.sess.post(
+            req_selected = yield UpstreamRequest(
+                "post",
                 url,
                 data=data,
                 headers=self.headers,
@@ -1725,8 +1711,7 @@ class Client:
             )
             if req_selected.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_selected.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_selected):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             selected = req_selected.json()
             result = {
@@ -1767,6 +1752,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"获取已选课程时未记录的错误：{str(e)}"}
 
+    @upstream
     def get_selected_courses2(self, year: int = 0, term: int = 0, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取已选课程信息2"""
         try:
@@ -1793,7 +1779,8 @@ class Client:
                 "queryModel.sortOrder": "asc",
                 "time": 1,
             }
-            req_selected = self.sess.post(
+            req_selected = yield UpstreamRequest(
+                "post",
                 url,
                 data=data,
                 headers=self.headers,
@@ -1801,8 +1788,7 @@ class Client:
             )
             if req_selected.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_selected.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_selected):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             selected = req_selected.json()
             result = {
@@ -1839,16 +1825,22 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"获取已选课程2时未记录的错误：{str(e)}"}
 
-    def get_block_courses(self, year: int, term: int, block: int, school_name: Optional[str] = None, base_url: Optional[str] = None):
-        """获取板块课选课列表（支持分页）"""
+    @upstream
+    def get_block_params(self, year: int, term: int, school_name: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        访问选课首页，获取板块课列表查询所需的表单参数（年级、专业、选课控制等）
+        首页未提供的参数使用默认值
+        返回:
+            dict: 结果字典，data 为表单参数
+        """
         try:
             url_head = self.get_school_url("block_courses_index", None, school_name, base_url)
         except ValueError as e:
             return {"code": 2333, "msg": str(e)}
-            
+
         try:
-            # 第一步：访问选课首页获取基础数据
-            req_head_data = self.sess.get(
+            req_head_data = yield UpstreamRequest(
+                "get",
                 url_head,
                 headers=self.headers,
                 timeout=self.timeout,
@@ -1857,142 +1849,183 @@ class Client:
             if req_head_data.status_code != 200:
                 print(f"[block_courses] 选课首页请求失败，状态码: {req_head_data.status_code}")
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_head_data.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_head_data):
                 print("[block_courses] 选课首页被重定向到登录页，cookies 可能失效")
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
-              # 第二步：分页获取可选课程列表
-            try:
-                url_part = self.get_school_url("block_courses", None, school_name, base_url)
-            except ValueError as e:
-                return {"code": 2333, "msg": str(e)}
-            
-            term_param = term ** 2 * 3  # 转换学期参数
-            grade_year = year - 1  # 年级通常是学年-1，如2025学年对应2024年级
-            
-            # 基础表单数据
-            base_form_data = {
-                "rwlx": "2",
-                "xklc": "2", 
-                "xkly": "0",
-                "bklx_id": "0",
-                "sfkkjyxdxnxq": "0",
-                "kzkcgs": "0",
-                "xqh_id": "1",
-                "jg_id": "14",
-                "zyh_id": "1401",
-                "zyfx_id": "wfx",
-                "njdm_id": str(grade_year),  # 年级参数，使用grade_year
-                "bh_id": "124140102",
-                "bjgkczxbbjwcx": "0",
-                "xbm": "1",
-                "xslbdm": "wlb",
-                "mzm": "01",
-                "xz": "4",
-                "ccdm": "w",
-                "xsbj": "0",
-                "sfkknj": "0",
-                "sfkkzy": "0",
-                "kzybkxy": "0",
-                "sfznkx": "0",
-                "zdkxms": "0",
-                "sfkxq": "1",
-                "njdm_id_xs": str(grade_year),  # 年级参数，使用grade_year
-                "zyh_id_xs": "1401",
-                "rlkz": "0",
-                "cdrlkz": "0",
-                "rlzlkz": "1",
-                "kklxdm": "10",
-                "xkxnm": str(year),  # 学年参数，使用year
-                "xkxqm": str(term_param),
-                "xkxskcgskg": "1",
-                "jxbzcxskg": "0",
-                "xklc": "2",
-                "xkkz_id": "376AC1914F6D7A4EE0630AECC1DAD910",
-                "cxbj": "0",
-                "fxbj": "0"
-            }
-            
-            # 分页获取所有课程
+        except exceptions.Timeout:
+            return {"code": 1003, "msg": "获取板块课程超时"}
+        except exceptions.RequestException:
+            traceback.print_exc()
+            return {"code": 2333, "msg": "服务请求失败，可能是系统维护或接口异常"}
+
+        term_param = term ** 2 * 3  # 转换学期参数
+        grade_year = year - 1  # 年级通常是学年-1，如2025学年对应2024年级
+
+        # 基础表单数据
+        form_data = {
+            "rwlx": "2",
+            "xklc": "2",
+            "xkly": "0",
+            "bklx_id": "0",
+            "sfkkjyxdxnxq": "0",
+            "kzkcgs": "0",
+            "xqh_id": "1",
+            "jg_id": "14",
+            "zyh_id": "1401",
+            "zyfx_id": "wfx",
+            "njdm_id": str(grade_year),  # 年级参数，使用grade_year
+            "bh_id": "124140102",
+            "bjgkczxbbjwcx": "0",
+            "xbm": "1",
+            "xslbdm": "wlb",
+            "mzm": "01",
+            "xz": "4",
+            "ccdm": "w",
+            "xsbj": "0",
+            "sfkknj": "0",
+            "sfkkzy": "0",
+            "kzybkxy": "0",
+            "sfznkx": "0",
+            "zdkxms": "0",
+            "sfkxq": "1",
+            "njdm_id_xs": str(grade_year),  # 年级参数，使用grade_year
+            "zyh_id_xs": "1401",
+            "rlkz": "0",
+            "cdrlkz": "0",
+            "rlzlkz": "1",
+            "kklxdm": "10",
+            "xkxnm": str(year),  # 学年参数，使用year
+            "xkxqm": str(term_param),
+            "xkxskcgskg": "1",
+            "jxbzcxskg": "0",
+            "xkkz_id": "376AC1914F6D7A4EE0630AECC1DAD910",
+            "cxbj": "0",
+            "fxbj": "0"
+        }
+
+        # 用首页隐藏字段覆盖默认值（同一年级、专业、选课控制的学生看到的板块课列表相同）
+        hidden = {}
+        for tag in BeautifulSoup(req_head_data.text, "html.parser").find_all("input", type="hidden"):
+            name = tag.get("name") or tag.get("id")
+            if name and tag.get("value"):
+                hidden[name] = tag["value"]
+        for alias, name in BLOCK_FORM_ALIASES.items():
+            if alias in hidden:
+                hidden.setdefault(name, hidden[alias])
+        overridden = [name for name in form_data if name in hidden and name not in ("xkxnm", "xkxqm")]
+        for name in overridden:
+            form_data[name] = hidden[name]
+        if overridden:
+            print(f"[block_courses] 使用选课首页参数: {', '.join(overridden)}")
+        return {"code": 1000, "msg": "获取选课参数成功", "data": form_data}
+
+    def _parse_block_page(self, response, label: str):
+        """
+        解析板块课列表的一页响应
+        返回:
+            list: 该页课程；无数据或响应异常时返回空列表
+        """
+        if isinstance(response, Exception):
+            print(f"[block_courses] {label}请求异常: {response}")
+            return []
+        if response.status_code != 200:
+            print(f"[block_courses] {label}请求失败，状态码: {response.status_code}")
+            return []
+
+        # 先检查响应内容
+        response_text = response.text.strip()
+        print(f"[block_courses] {label}响应: {response_text[:200]}")
+
+        # 特殊处理返回值 "0"
+        if response_text == '"0"' or response_text == '0':
+            print(f"[block_courses] {label}返回0，停止分页")
+            return []
+
+        content_type = response.headers.get('Content-Type', '')
+        if 'json' not in content_type.lower():
+            print(f"[block_courses] {label}非JSON响应: {content_type}")
+            return []
+
+        try:
+            course_data = response.json()
+        except Exception as e:
+            print(f"[block_courses] {label}JSON解析异常: {str(e)}")
+            return []
+        if not isinstance(course_data, dict):
+            print(f"[block_courses] {label}数据类型错误: {type(course_data)}")
+            return []
+        if not course_data.get("tmpList"):
+            print(f"[block_courses] {label}无课程列表，停止分页")
+            return []
+        return course_data["tmpList"]
+
+    @upstream
+    def get_block_courses(self, year: int, term: int, block: int, school_name: Optional[str] = None, base_url: Optional[str] = None, params: Optional[dict] = None):
+        """
+        获取板块课选课列表（支持分页）
+        参数:
+            params: get_block_params 返回的表单参数（可选，不传时先访问选课首页获取）
+        说明:
+            第一页之后每轮并发获取 UPSTREAM_PARALLEL 个行区间，区间大小逐轮翻倍（不超过 BLOCK_COURSES_MAX_PAGE_SIZE），
+            遇到不满的区间即停止，最多获取 BLOCK_COURSES_MAX_ROWS 条
+        """
+        if params is None:
+            params_result = yield from self.get_block_params.flow(self, year, term, school_name, base_url)
+            if params_result.get("code") != 1000:
+                return params_result
+            params = params_result["data"]
+        term_param = params.get("xkxqm")
+
+        try:
+            url_part = self.get_school_url("block_courses", None, school_name, base_url)
+        except ValueError as e:
+            return {"code": 2333, "msg": str(e)}
+
+        try:
+            # 按行区间（kspage~jspage）分页获取所有课程
             all_courses = []
-            page_size = 10
-            current_page = 1
-            max_pages = 50  # 最大页数限制，防止无限循环
-            
-            while current_page <= max_pages:
-                # 设置分页参数
-                form_data = base_form_data.copy()
-                form_data["kspage"] = str((current_page - 1) * page_size + 1)
-                form_data["jspage"] = str(current_page * page_size)
-                
-                print(f"[block_courses] 获取第{current_page}页: kspage={form_data['kspage']}, jspage={form_data['jspage']}")
-                
-                part_response = self.sess.post(
-                    url_part,
-                    headers=self.headers,
-                    data=form_data,
-                    timeout=self.timeout,
-                    verify=False,
-                )
-                
-                if part_response.status_code != 200:
-                    print(f"[block_courses] 第{current_page}页请求失败，状态码: {part_response.status_code}")
-                    break
-                
-                # 先检查响应内容
-                response_text = part_response.text.strip()
-                print(f"[block_courses] 第{current_page}页响应: {response_text[:200]}")
-                
-                # 特殊处理返回值 "0"
-                if response_text == '"0"' or response_text == '0':
-                    print(f"[block_courses] 第{current_page}页返回0，停止分页")
-                    break
-                
-                content_type = part_response.headers.get('Content-Type', '')
-                if 'json' not in content_type.lower():
-                    print(f"[block_courses] 第{current_page}页非JSON响应: {content_type}")
-                    break
-                
-                try:
-                    course_data = part_response.json()
-                    
-                    # 检查是否为字符串类型（如 "0"）
-                    if isinstance(course_data, str):
-                        if course_data == "0":
-                            print(f"[block_courses] 第{current_page}页返回字符串0，停止分页")
-                            break
-                        else:
-                            print(f"[block_courses] 第{current_page}页返回未知字符串: {course_data}")
-                            break
-                    
-                    # 检查是否为正常的对象格式
-                    if not isinstance(course_data, dict):
-                        print(f"[block_courses] 第{current_page}页数据类型错误: {type(course_data)}")
-                        break
-                    
-                    # 检查是否有课程列表
-                    if not course_data.get("tmpList"):
-                        print(f"[block_courses] 第{current_page}页无课程列表，停止分页")
+            page_size = BLOCK_COURSES_PAGE_SIZE
+            next_row = 1
+            pages = 0
+            finished = False
+
+            while not finished and next_row <= BLOCK_COURSES_MAX_ROWS:
+                # 第一轮只取一页（多数板块一页即可取完），之后每轮并发获取多页
+                windows = []
+                for _ in range(1 if pages == 0 else UPSTREAM_PARALLEL):
+                    if next_row > BLOCK_COURSES_MAX_ROWS:
                         break
-                    
-                    # 获取当前页课程
-                    page_courses = course_data["tmpList"]
-                    print(f"[block_courses] 第{current_page}页获取到 {len(page_courses)} 门课程")
-                    
-                    # 添加到总列表
+                    end_row = min(next_row + page_size - 1, BLOCK_COURSES_MAX_ROWS)
+                    windows.append((next_row, end_row))
+                    next_row = end_row + 1
+                print(f"[block_courses] 获取行区间: {windows}")
+
+                responses = yield [
+                    UpstreamRequest(
+                        "post",
+                        url_part,
+                        headers=self.headers,
+                        data=dict(params, kspage=str(start_row), jspage=str(end_row)),
+                        timeout=self.timeout,
+                        verify=False,
+                    )
+                    for start_row, end_row in windows
+                ]
+                # 第一页就失败时按原异常处理（超时等），之后的失败只结束分页
+                if pages == 0 and isinstance(responses[0], Exception):
+                    raise responses[0]
+
+                for (start_row, end_row), response in zip(windows, responses):
+                    pages += 1
+                    page_courses = self._parse_block_page(response, f"第{start_row}-{end_row}行")
                     all_courses.extend(page_courses)
-                    
-                    # 如果当前页课程数少于页面大小，说明已到最后一页
-                    if len(page_courses) < page_size:
-                        print(f"[block_courses] 第{current_page}页课程数({len(page_courses)})少于页面大小({page_size})，停止分页")
+                    # 区间不满说明已到最后一页，之后的区间（已并发请求）全部忽略
+                    if len(page_courses) < end_row - start_row + 1:
+                        print(f"[block_courses] 第{start_row}-{end_row}行课程数({len(page_courses)})不满，停止分页")
+                        finished = True
                         break
-                    
-                    current_page += 1
-                    
-                except Exception as e:
-                    print(f"[block_courses] 第{current_page}页JSON解析异常: {str(e)}")
-                    break
-            
+                page_size = min(page_size * 2, BLOCK_COURSES_MAX_PAGE_SIZE)
+
             # 检查是否获取到课程
             if not all_courses:
                 return {
@@ -2003,7 +2036,7 @@ class Client:
                         "term": term,
                         "block": block,
                         "xkxqm": term_param,
-                        "pages_checked": current_page - 1
+                        "pages_checked": pages
                     }
                 }
             
@@ -2013,7 +2046,7 @@ class Client:
                 "term": term,
                 "block": block,
                 "count": len(all_courses),
-                "pages": current_page - 1,
+                "pages": pages,
                 "courses": [
                     {
                         "course_id": course.get("kch_id"),
@@ -2037,7 +2070,7 @@ class Client:
                 ],
             }
             
-            print(f"[block_courses] 总共获取到 {len(all_courses)} 门课程，共 {current_page - 1} 页")
+            print(f"[block_courses] 总共获取到 {len(all_courses)} 门课程，共 {pages} 页")
             return {"code": 1000, "msg": "获取板块课程成功", "data": result}
             
         except exceptions.Timeout:
@@ -2056,8 +2089,13 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"获取板块课程时未记录的错误：{str(e)}"}
 
-    def get_course_classes(self, year: int, term: int, course_id: str, school_name: Optional[str] = None, base_url: Optional[str] = None):
-        """获取指定课程的教学班列表"""
+    @upstream
+    def get_course_classes(self, year: int, term: int, course_id: str, school_name: Optional[str] = None, base_url: Optional[str] = None,
+                           verbose: bool = True):
+        """
+        获取指定课程的教学班列表
+        verbose 为 False 时不打印请求表单与响应内容（余量监控等高频轮询使用），错误日志不受影响
+        """
         try:
             url_classes = self.get_school_url("course_classes", None, school_name, base_url)
         except ValueError as e:
@@ -2116,11 +2154,13 @@ class Client:
                 "fxbj": "0"
             }
             
-            print(f"[course_classes] 查询课程 {course_id} 的教学班")
-            print(f"[course_classes] POST {url_classes}")
-            print(f"[course_classes] 表单数据: {form_data}")
+            if verbose:
+                print(f"[course_classes] 查询课程 {course_id} 的教学班")
+                print(f"[course_classes] POST {url_classes}")
+                print(f"[course_classes] 表单数据: {form_data}")
             
-            classes_response = self.sess.post(
+            classes_response = yield UpstreamRequest(
+                "post",
                 url_classes,
                 headers=self.headers,
                 data=form_data,
@@ -2134,11 +2174,12 @@ class Client:
             # 检查响应内容
             response_text = classes_response.text.strip()
             content_type = classes_response.headers.get('Content-Type', '')
-            print(f"[course_classes] 响应Content-Type: {content_type}")
-            print(f"[course_classes] 响应内容前500: {response_text[:500]}")
+            if verbose:
+                print(f"[course_classes] 响应Content-Type: {content_type}")
+                print(f"[course_classes] 响应内容前500: {response_text[:500]}")
             
             # 检查是否为登录页面
-            if "用户登录" in response_text:
+            if is_login_page(classes_response):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             
             # 特殊处理返回值 "0"
@@ -2226,7 +2267,8 @@ class Client:
                         ],
                     }
                     
-                    print(f"[course_classes] 课程 {course_id} 查询到 {len(result['classes'])} 个教学班（列表格式）")
+                    if verbose:
+                        print(f"[course_classes] 课程 {course_id} 查询到 {len(result['classes'])} 个教学班（列表格式）")
                     return {"code": 1000, "msg": "获取教学班成功", "data": result}
                 
                 elif not isinstance(classes_data, dict):
@@ -2276,7 +2318,8 @@ class Client:
                     ],
                 }
                 
-                print(f"[course_classes] 课程 {course_id} 查询到 {len(result['classes'])} 个教学班")
+                if verbose:
+                    print(f"[course_classes] 课程 {course_id} 查询到 {len(result['classes'])} 个教学班")
                 return {"code": 1000, "msg": "获取教学班成功", "data": result}
                 
             except Exception as e:
@@ -2307,44 +2350,61 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"获取教学班时未记录的错误：{str(e)}"}
 
+    @staticmethod
+    def build_select_data(sid: str, course_id: str, do_id: str, kklxdm: str, year: int, term: int) -> dict:
+        """构建选课表单（选课与抢课共用，抢课时提前构建）"""
+        term = term**2 * 3
+        return {
+            "jxb_ids": do_id,
+            "kch_id": course_id,
+            # 'rwlx': '3',
+            # 'rlkz': '0',
+            # 'rlzlkz': '1',
+            # 'sxbj': '1',
+            # 'xxkbj': '0',
+            # 'cxbj': '0',
+            "qz": "0",
+            # 'xkkz_id': '9B247F4EFD6291B9E055000000000001',
+            "xkxnm": str(year),
+            "xkxqm": str(term),
+            "njdm_id": str(sid[0:2]),
+            "zyh_id": str(sid[2:6]),
+            "kklxdm": str(kklxdm),
+            # 'xklc': '1',
+        }
+
+    @upstream
     def select_course(self, sid: str, course_id: str, do_id: str, kklxdm: str, year: int, term: int, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """选课"""
         try:
             url_select = self.get_school_url("select_course", None, school_name, base_url)
         except ValueError as e:
             return {"code": 2333, "msg": str(e)}
-            
+
+        select_data = self.build_select_data(sid, course_id, do_id, kklxdm, year, term)
+        return (yield from self.submit_select.flow(self, url_select, select_data))
+
+    @upstream
+    def submit_select(self, url_select: str, select_data: dict, timeout: Optional[float] = None):
+        """
+        提交已构建好的选课表单（不解析 URL、不打印日志，供抢课等对延迟敏感的场景直接调用）
+        参数:
+            url_select: 选课地址（get_school_url("select_course") 的结果）
+            select_data: build_select_data 构建的表单
+            timeout: 本次请求超时时间（可选，默认使用客户端超时）
+        """
         try:
-            term = term**2 * 3
-            select_data = {
-                "jxb_ids": do_id,
-                "kch_id": course_id,
-                # 'rwlx': '3',
-                # 'rlkz': '0',
-                # 'rlzlkz': '1',
-                # 'sxbj': '1',
-                # 'xxkbj': '0',
-                # 'cxbj': '0',
-                "qz": "0",
-                # 'xkkz_id': '9B247F4EFD6291B9E055000000000001',
-                "xkxnm": str(year),
-                "xkxqm": str(term),
-                "njdm_id": str(sid[0:2]),
-                "zyh_id": str(sid[2:6]),
-                "kklxdm": str(kklxdm),
-                # 'xklc': '1',
-            }
-            req_select = self.sess.post(
+            req_select = yield UpstreamRequest(
+                "post",
                 url_select,
                 headers=self.headers,
                 data=select_data,
-                timeout=self.timeout,
+                timeout=timeout or self.timeout,
                 verify=False,
             )
             if req_select.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_select.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_select):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             result = req_select.json()
             return {"code": 1000, "msg": "选课成功", "data": result}
@@ -2361,32 +2421,72 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"选课时未记录的错误：{str(e)}"}
 
+    @upstream
+    def warm_select(self, connections: int = 1, school_name: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        选课开放前预热：并发访问选课首页，建立连接（完成 TLS 握手）并确认会话有效，同时保持教务系统会话不过期
+        参数:
+            connections: 同时访问的次数，即预先建立的连接数（受 UPSTREAM_PARALLEL 限制）
+        """
+        try:
+            url_head = self.get_school_url("block_courses_index", None, school_name, base_url)
+        except ValueError as e:
+            return {"code": 2333, "msg": str(e)}
+
+        responses = yield [
+            UpstreamRequest("get", url_head, headers=self.headers, timeout=self.timeout, verify=False)
+            for _ in range(max(1, connections))
+        ]
+        warmed = 0
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"选课预热请求失败: {response}")
+                continue
+            if is_login_page(response):
+                return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
+            if response.status_code == 200:
+                warmed += 1
+        if not warmed:
+            return {"code": 2333, "msg": "预热失败，教务系统无响应或服务异常"}
+        return {"code": 1000, "msg": "预热成功", "data": {"connections": warmed}}
+
+    @staticmethod
+    def build_cancel_data(do_id: str, course_id: str, year: int, term: int) -> dict:
+        """构建退课表单"""
+        term = term**2 * 3
+        return {
+            "jxb_ids": do_id,
+            "kch_id": course_id,
+            "xkxnm": str(year),
+            "xkxqm": str(term),
+        }
+
+    @upstream
     def cancel_course(self, do_id: str, course_id: str, year: int, term: int, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """取消选课"""
         try:
             url_cancel = self.get_school_url("drop_course", None, school_name, base_url)
         except ValueError as e:
             return {"code": 2333, "msg": str(e)}
-            
+
+        cancel_data = self.build_cancel_data(do_id, course_id, year, term)
+        return (yield from self.submit_cancel.flow(self, url_cancel, cancel_data))
+
+    @upstream
+    def submit_cancel(self, url_cancel: str, cancel_data: dict, timeout: Optional[float] = None):
+        """提交已构建好的退课表单（不解析 URL、不打印日志）"""
         try:
-            term = term**2 * 3
-            cancel_data = {
-                "jxb_ids": do_id,
-                "kch_id": course_id,
-                "xkxnm": str(year),
-                "xkxqm": str(term),
-            }
-            req_cancel = self.sess.post(
+            req_cancel = yield UpstreamRequest(
+                "post",
                 url_cancel,
                 headers=self.headers,
                 data=cancel_data,
-                timeout=self.timeout,
+                timeout=timeout or self.timeout,
                 verify=False,
             )
             if req_cancel.status_code != 200:
                 return {"code": 2333, "msg": "教务系统服务异常"}
-            doc = pq(req_cancel.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req_cancel):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             result = {"status": re.findall(r"(\d+)", req_cancel.text)[0]}
             return {"code": 1000, "msg": "退课成功", "data": result}
@@ -2403,8 +2503,99 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": f"选课时未记录的错误：{str(e)}"}
 
+    @upstream
+    def swap_course(self, sid: str, course_id: str, old_do_id: str, new_do_id: str, kklxdm: str, year: int, term: int,
+                    new_course_id: Optional[str] = None, school_name: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        换教学班：退掉原教学班后立即选新教学班，选新教学班失败时立即选回原教学班
+        退课前先解析地址、构建三份表单并预热连接，使原教学班空出的时间只包含两次请求
+        参数:
+            course_id, old_do_id: 原教学班所属课程与教学班
+            new_do_id: 新教学班
+            new_course_id: 新教学班所属课程（可选，默认与原课程相同）
+        返回:
+            dict: data 中 swapped 表示是否换课成功，steps 为每一步的耗时与结果，exposed_ms 为原教学班空出的时长
+        """
+        try:
+            url_select = self.get_school_url("select_course", None, school_name, base_url)
+            url_cancel = self.get_school_url("drop_course", None, school_name, base_url)
+        except ValueError as e:
+            return {"code": 2333, "msg": str(e)}
+
+        select_new = self.build_select_data(sid, new_course_id or course_id, new_do_id, kklxdm, year, term)
+        select_old = self.build_select_data(sid, course_id, old_do_id, kklxdm, year, term)
+        cancel_old = self.build_cancel_data(old_do_id, course_id, year, term)
+        started = time.perf_counter()
+        steps = []
+
+        def record(step, step_started, result):
+            data = result.get("data") if isinstance(result.get("data"), dict) else {}
+            steps.append({
+                "step": step,
+                "at_ms": round((step_started - started) * 1000, 1),
+                "ms": round((time.perf_counter() - step_started) * 1000, 1),
+                "code": result.get("code"),
+                "flag": data.get("flag", data.get("status")),
+                "msg": data.get("msg") or result.get("msg"),
+            })
+
+        def finish(msg, swapped, rolled_back, exposed_from=None):
+            exposed_ms = None
+            if exposed_from is not None:
+                exposed_ms = round((time.perf_counter() - exposed_from) * 1000, 1)
+            return {
+                "code": 1000,
+                "msg": msg,
+                "data": {
+                    "swapped": swapped,
+                    "rolled_back": rolled_back,
+                    "exposed_ms": exposed_ms,
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "steps": steps,
+                },
+            }
+
+        # 预热：确认会话有效并建立连接，失败时不退课
+        step_started = time.perf_counter()
+        warm = yield from self.warm_select.flow(self, 1, school_name, base_url)
+        record("warm", step_started, warm)
+        if warm.get("code") != 1000:
+            return warm
+
+        dropped_at = time.perf_counter()
+        dropped = yield from self.submit_cancel.flow(self, url_cancel, cancel_old)
+        record("drop", dropped_at, dropped)
+        if dropped.get("code") in (1003, 2333, 999):
+            # 退课结果不确定（超时等）时尝试选回原教学班，保证不丢课；原教学班仍在时教务系统会拒绝重复选课
+            step_started = time.perf_counter()
+            restored = yield from self.submit_select.flow(self, url_select, select_old)
+            record("rollback", step_started, restored)
+            return finish("退课结果不确定，已尝试选回原教学班，请查询已选课程确认", False, select_succeeded(restored), dropped_at)
+        if dropped.get("code") == 1006:
+            return dropped
+        if str(dropped["data"].get("status")) != "1":
+            return finish("退课失败，未换课", False, None)
+
+        step_started = time.perf_counter()
+        selected = yield from self.submit_select.flow(self, url_select, select_new)
+        record("select", step_started, selected)
+        if select_succeeded(selected):
+            return finish("换课成功", True, None, dropped_at)
+
+        # 选新教学班失败，立即选回原教学班（超时等可重试的错误最多尝试 SWAP_ROLLBACK_ATTEMPTS 次）
+        for _ in range(SWAP_ROLLBACK_ATTEMPTS):
+            step_started = time.perf_counter()
+            restored = yield from self.submit_select.flow(self, url_select, select_old)
+            record("rollback", step_started, restored)
+            if select_succeeded(restored):
+                return finish("选新教学班失败，已选回原教学班", False, True, dropped_at)
+            if restored.get("code") not in (1003, 2333, 999):
+                break
+        return finish("选新教学班失败，且未能选回原教学班，请尽快手动选课", False, False, dropped_at)
+
     # ============= utils =================
     
+    @upstream
     def get_gpa(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取GPA"""
         try:
@@ -2412,14 +2603,15 @@ class Client:
         except ValueError:
             return "init"
             
-        req_gpa = self.sess.get(
+        req_gpa = yield UpstreamRequest(
+            "get",
             url,
             headers=self.headers,
             timeout=self.timeout,
         )
-        doc = pq(req_gpa.text)
-        if doc("h5").text() == "用户登录":
+        if is_login_page(req_gpa):
             return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
+        doc = pq(req_gpa.text)
         allc_str = [allc.text() for allc in doc("font[size='2px']").items()]
         try:
             # Ensure we have enough elements and the element is a string
@@ -2431,6 +2623,7 @@ class Client:
         except Exception:
             return "init"
 
+    @upstream
     def get_course_category(self, type, item, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """根据课程号获取类别"""
         if type not in self.detail_category_type:
@@ -2443,7 +2636,8 @@ class Client:
         except ValueError:
             return item.get("KCLBMC")
             
-        req_category = self.sess.get(
+        req_category = yield UpstreamRequest(
+            "get",
             url,
             headers=self.headers,
             timeout=self.timeout,
@@ -2458,11 +2652,9 @@ class Client:
 
     @classmethod
     def encrypt_password(cls, pwd, n, e):
-        """对密码base64编码"""
+        """对密码base64编码（解析后的公钥按 modulus/exponent 复用）"""
         message = str(pwd).encode()
-        rsa_n = binascii.b2a_hex(binascii.a2b_base64(n))
-        rsa_e = binascii.b2a_hex(binascii.a2b_base64(e))
-        key = rsa.PublicKey(int(rsa_n, 16), int(rsa_e, 16))
+        key = pubkey_cache.public_key(n, e)
         encropy_pwd = rsa.encrypt(message, key)
         result = binascii.b2a_base64(encropy_pwd)
         return result
@@ -2499,39 +2691,21 @@ class Client:
 
     @classmethod
     def list_sessions(cls, sessions):
+        """
+        返回课程所含节次列表
+        与原有返回值保持一致：合并时段（如 "1-2节,5-6节"）只取第一段，全部时段见 sessions_mask
+        """
         if not sessions:
             return None
-        args = re.findall(r"(\d+)", sessions)
-        return [n for n in range(int(args[0]), int(args[1]) + 1)]
+        numbers = re.findall(r"(\d+)", sessions)[:2]
+        return mask_to_list(sessions_mask("-".join(numbers)))
 
     @classmethod
     def list_weeks(cls, weeks):
         """返回课程所含周列表"""
         if not weeks:
             return None
-        args = re.findall(r"[^,]+", weeks)
-        week_list = []
-        for item in args:
-            if "-" in item:
-                weeks_pair = re.findall(r"(\d+)", item)
-                if len(weeks_pair) != 2:
-                    continue
-                if "单" in item:
-                    for i in range(int(weeks_pair[0]), int(weeks_pair[1]) + 1):
-                        if i % 2 == 1:
-                            week_list.append(i)
-                elif "双" in item:
-                    for i in range(int(weeks_pair[0]), int(weeks_pair[1]) + 1):
-                        if i % 2 == 0:
-                            week_list.append(i)
-                else:
-                    for i in range(int(weeks_pair[0]), int(weeks_pair[1]) + 1):
-                        week_list.append(i)
-            else:
-                week_num = re.findall(r"(\d+)", item)
-                if len(week_num) == 1:
-                    week_list.append(int(week_num[0]))
-        return week_list
+        return mask_to_list(weeks_mask(weeks))
 
     @classmethod
     def get_academia_statistics(cls, display_statistics):
@@ -2614,52 +2788,24 @@ class Client:
     def split_merge_display(cls, schedule):
         """
         拆分同周同天同课程不同时段数据合并的问题
+        按 (课程号, 星期, 周次) 一次分组，同组 k 条记录的节次形如 "1-2节,5-6节"（共 2k 个数字）时，
+        按出现顺序把第 i 段节次分给第 i 条记录，支持一天内超过两个时段
         """
-        repetIndex = []
-        count = 0
-        for items in schedule["courses"]:
-            for index in range(len(schedule["courses"])):
-                if (schedule["courses"]).index(items) == count:  # 如果对比到自己就忽略
+        groups = {}
+        for course in schedule["courses"]:
+            key = (course["course_id"], course["weekday"], course["weeks"])
+            groups.setdefault(key, []).append(course)
+        for courses in groups.values():
+            if len(courses) < 2:
+                continue
+            for index, course in enumerate(courses):
+                numbers = re.findall(r"(\d+)", course["sessions"] or "")
+                if len(numbers) != 2 * len(courses):  # 节次数量与记录数不对应时不做拆分
                     continue
-                elif (
-                    items["course_id"]
-                    == schedule["courses"][index]["course_id"]  # 同周同天同课程
-                    and items["weekday"] == schedule["courses"][index]["weekday"]
-                    and items["weeks"] == schedule["courses"][index]["weeks"]
-                ):
-                    repetIndex.append(index)  # 满足条件记录索引
-            count += 1  # 记录当前对比课程的索引
-        if len(repetIndex) % 2 != 0:  # 检测到同一课程在一天内存在多个时段，当前逻辑不处理此情况
-            return schedule
-        for r in range(0, len(repetIndex), 2):  # 索引数组两两成对，故步进2循环
-            fir = repetIndex[r]
-            sec = repetIndex[r + 1]
-            if len(re.findall(r"(\d+)", schedule["courses"][fir]["sessions"])) == 4:
-                schedule["courses"][fir]["sessions"] = (
-                    re.findall(r"(\d+)", schedule["courses"][fir]["sessions"])[0]
-                    + "-"
-                    + re.findall(r"(\d+)", schedule["courses"][fir]["sessions"])[1]
-                    + "节"
-                )
-                schedule["courses"][fir]["list_sessions"] = cls.list_sessions(
-                    schedule["courses"][fir]["sessions"]
-                )
-                schedule["courses"][fir]["time"] = cls.display_course_time(
-                    schedule["courses"][fir]["sessions"]
-                )
-
-                schedule["courses"][sec]["sessions"] = (
-                    re.findall(r"(\d+)", schedule["courses"][sec]["sessions"])[2]
-                    + "-"
-                    + re.findall(r"(\d+)", schedule["courses"][sec]["sessions"])[3]
-                    + "节"
-                )
-                schedule["courses"][sec]["list_sessions"] = cls.list_sessions(
-                    schedule["courses"][sec]["sessions"]
-                )
-                schedule["courses"][sec]["time"] = cls.display_course_time(
-                    schedule["courses"][sec]["sessions"]
-                )
+                course["sessions"] = f"{numbers[2 * index]}-{numbers[2 * index + 1]}节"
+                course["list_sessions"] = cls.list_sessions(course["sessions"])
+                course["sessions_mask"] = sessions_mask(course["sessions"])
+                course["time"] = cls.display_course_time(course["sessions"])
         return schedule
 
     @classmethod
@@ -2696,6 +2842,7 @@ class Client:
             pass
         return False
 
+    @upstream
     def get_evaluate_menu(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取教学评价菜单（可评价课程列表）"""
         try:
@@ -2715,7 +2862,7 @@ class Client:
             "time": "0"
         }
         
-        resp = self.sess.post(url, headers=self.headers, data=data, timeout=self.timeout, verify=False)
+        resp = yield UpstreamRequest("post", url, headers=self.headers, data=data, timeout=self.timeout, verify=False)
         if resp.status_code != 200:
             return {"code": 2333, "msg": f"获取评价菜单失败，状态码: {resp.status_code}"}
         
@@ -2756,6 +2903,7 @@ class Client:
             }
         }
 
+    @upstream
     def get_evaluate_detail(self, jxb_id: str, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """获取某门课程的评价详情"""
         try:
@@ -2765,7 +2913,7 @@ class Client:
             url = f"{fallback_base.rstrip('/')}/xspjgl/xspj_cxXspjDisplay.html?gnmkdm=N401605"
         
         # 从课程列表中获取课程信息（需要先调用get_evaluate_menu）
-        menu_result = self.get_evaluate_menu(school_name, base_url)
+        menu_result = yield from self.get_evaluate_menu.flow(self, school_name, base_url)
         if menu_result.get("code") != 1000:
             return menu_result
         
@@ -2812,7 +2960,7 @@ class Client:
         
         print(f"POST请求数据: {data}")
         
-        resp = self.sess.post(url, headers=self.headers, data=data, timeout=self.timeout, verify=False)
+        resp = yield UpstreamRequest("post", url, headers=self.headers, data=data, timeout=self.timeout, verify=False)
         if resp.status_code != 200:
             return {"code": 2333, "msg": f"获取评价详情失败，状态码: {resp.status_code}"}
         
@@ -2926,10 +3074,11 @@ class Client:
             **panel_params
         }}
 
+    @upstream
     def save_evaluate(self, action_url: str, jxb_id: str, kch_id: str, evaluation_data: dict, comment: str = ""):
         """保存评价内容（严格官方嵌套结构，与提交一致，仅url不同）"""
         # 先获取评价详情，拿到所有嵌套参数
-        detail_result = self.get_evaluate_detail(jxb_id)
+        detail_result = yield from self.get_evaluate_detail.flow(self, jxb_id)
         if detail_result.get('code') != 1000:
             return detail_result
         detail_data = detail_result['data']
@@ -2993,7 +3142,7 @@ class Client:
             'X-Requested-With': 'XMLHttpRequest'
         })
         print('最终POST数据:', data)
-        resp = self.sess.post(action_url, data=data, headers=headers, timeout=self.timeout, verify=False)
+        resp = yield UpstreamRequest("post", action_url, data=data, headers=headers, timeout=self.timeout, verify=False)
         print('正方系统保存响应:', resp.text[:500])
         if resp.status_code == 200:
             try:
@@ -3014,10 +3163,11 @@ class Client:
                     return {"code": 2333, "msg": "保存失败，请检查评价内容"}
         return {"code": 2333, "msg": "保存失败"}
 
+    @upstream
     def submit_evaluate(self, action_url: str, jxb_id: str, kch_id: str, evaluation_data: dict, comment: str = ""):
         """提交评价（严格官方嵌套结构）"""
         # 先获取评价详情，拿到所有嵌套参数
-        detail_result = self.get_evaluate_detail(jxb_id)
+        detail_result = yield from self.get_evaluate_detail.flow(self, jxb_id)
         if detail_result.get('code') != 1000:
             return detail_result
         detail_data = detail_result['data']
@@ -3081,7 +3231,7 @@ class Client:
             'X-Requested-With': 'XMLHttpRequest'
         })
         print('最终POST数据:', data)
-        resp = self.sess.post(action_url, data=data, headers=headers, timeout=self.timeout, verify=False)
+        resp = yield UpstreamRequest("post", action_url, data=data, headers=headers, timeout=self.timeout, verify=False)
         print('正方系统响应:', resp.text[:500])
         if resp.status_code == 200:
             try:
@@ -3102,6 +3252,7 @@ class Client:
                     return {"code": 2333, "msg": "提交失败，请检查评价内容"}
         return {"code": 2333, "msg": "提交失败"}
 
+    @upstream
     def get_campus_list(self, school_name: Optional[str] = None, base_url: Optional[str] = None):
         """
         获取校区列表
@@ -3122,7 +3273,8 @@ class Client:
             
             print(f"获取校区列表 - URL: {url}")
             
-            req = self.sess.get(
+            req = yield UpstreamRequest(
+                "get",
                 url,
                 headers=self.headers,
                 timeout=self.timeout,
@@ -3135,9 +3287,9 @@ class Client:
                 return {"code": 2333, "msg": f"教务系统服务异常，状态码: {req.status_code}"}
             
             # 检查是否登录
-            doc = pq(req.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
+            doc = pq(req.text)
             
             # 解析校区列表
             campus_list = []
@@ -3178,6 +3330,7 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取校区列表时未记录的错误：" + str(e)}
 
+    @upstream
     def get_building_list(self, year: int, term: int, campus_id: str = "1", school_name: Optional[str] = None, base_url: Optional[str] = None):
         """
         获取教学楼列表和节次信息
@@ -3215,7 +3368,8 @@ class Client:
             print(f"获取教学楼列表 - URL: {url}")
             print(f"获取教学楼列表 - 参数: {params}")
             
-            req = self.sess.get(
+            req = yield UpstreamRequest(
+                "get",
                 url,
                 params=params,
                 headers=self.headers,
@@ -3230,8 +3384,7 @@ class Client:
                 return {"code": 2333, "msg": f"教务系统服务异常，状态码: {req.status_code}"}
             
             # 检查是否登录
-            doc = pq(req.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             
             # 解析JSON响应
@@ -3291,6 +3444,45 @@ class Client:
             traceback.print_exc()
             return {"code": 999, "msg": "获取教学楼列表时未记录的错误：" + str(e)}
 
+    @classmethod
+    def parse_classroom_query(cls, weeks, day_of_weeks, time_slots):
+        """
+        规范化空教室查询参数
+        返回:
+            tuple: (周次列表, 星期字符串(逗号分隔), 节次列表)
+        """
+        # 处理周次参数
+        if isinstance(weeks, str):
+            week_list = [int(w.strip()) for w in weeks.split(',') if w.strip()]
+        elif isinstance(weeks, list):
+            week_list = weeks
+        else:
+            week_list = [weeks]
+        
+        # 处理星期参数 - 可以是多个星期，用逗号分隔
+        if isinstance(day_of_weeks, str):
+            day_list = [d.strip() for d in day_of_weeks.split(',') if d.strip()]
+            xqj = ','.join(day_list)
+        elif isinstance(day_of_weeks, list):
+            xqj = ','.join(str(d) for d in day_of_weeks)
+        else:
+            xqj = str(day_of_weeks)
+        
+        # 处理节次参数
+        if isinstance(time_slots, str):
+            # 支持范围格式 "2-3" 或逗号分隔 "2,3"
+            if '-' in time_slots:
+                start, end = time_slots.split('-')
+                slot_list = list(range(int(start), int(end) + 1))
+            else:
+                slot_list = [int(s.strip()) for s in time_slots.split(',') if s.strip()]
+        elif isinstance(time_slots, list):
+            slot_list = time_slots
+        else:
+            slot_list = [time_slots]
+        return week_list, xqj, slot_list
+
+    @upstream
     def get_empty_classroom(self, year: int, term: int, weeks, day_of_weeks, time_slots, campus_id: str = "1", school_name: Optional[str] = None, base_url: Optional[str] = None, building: Optional[str] = None):
         """
         查询空闲教室
@@ -3324,39 +3516,10 @@ class Client:
             # 转换学期参数
             term_param = term ** 2 * 3 if term != 0 else ""
             
-            # 处理周次参数 - 转换为位掩码
-            if isinstance(weeks, str):
-                week_list = [int(w.strip()) for w in weeks.split(',') if w.strip()]
-            elif isinstance(weeks, list):
-                week_list = weeks
-            else:
-                week_list = [weeks]
-            # 计算周次位掩码: 第n周对应2^(n-1)
-            zcd = sum(2 ** (w - 1) for w in week_list)
-            
-            # 处理星期参数 - 可以是多个星期，用逗号分隔
-            if isinstance(day_of_weeks, str):
-                day_list = [d.strip() for d in day_of_weeks.split(',') if d.strip()]
-                xqj = ','.join(day_list)
-            elif isinstance(day_of_weeks, list):
-                xqj = ','.join(str(d) for d in day_of_weeks)
-            else:
-                xqj = str(day_of_weeks)
-            
-            # 处理节次参数 - 转换为位掩码
-            if isinstance(time_slots, str):
-                # 支持范围格式 "2-3" 或逗号分隔 "2,3"
-                if '-' in time_slots:
-                    start, end = time_slots.split('-')
-                    slot_list = list(range(int(start), int(end) + 1))
-                else:
-                    slot_list = [int(s.strip()) for s in time_slots.split(',') if s.strip()]
-            elif isinstance(time_slots, list):
-                slot_list = time_slots
-            else:
-                slot_list = [time_slots]
-            # 计算节次位掩码: 第n节对应2^(n-1)
-            jcd = sum(2 ** (s - 1) for s in slot_list)
+            week_list, xqj, slot_list = self.parse_classroom_query(weeks, day_of_weeks, time_slots)
+            # 计算周次/节次位掩码: 第n周(节)对应2^(n-1)
+            zcd = list_to_mask(week_list)
+            jcd = list_to_mask(slot_list)
             
             # 构建请求数据
             data = {
@@ -3393,7 +3556,8 @@ class Client:
             print(f"空教室查询 - 周次位掩码: weeks={week_list} -> zcd={zcd}")
             print(f"空教室查询 - 节次位掩码: slots={slot_list} -> jcd={jcd}")
             
-            req = self.sess.post(
+            req = yield UpstreamRequest(
+                "post",
                 url,
                 headers=self.headers,
                 data=data,
@@ -3408,8 +3572,7 @@ class Client:
                 return {"code": 2333, "msg": f"教务系统服务异常，状态码: {req.status_code}"}
             
             # 检查是否登录
-            doc = pq(req.text)
-            if doc("h5").text() == "用户登录":
+            if is_login_page(req):
                 return {"code": 1006, "msg": "未登录或已过期，请重新登录"}
             
             # 解析JSON响应